@@ -100,6 +100,9 @@ document.addEventListener('DOMContentLoaded', function () {
             });
             if (data && data.access_token) {
                 localStorage.setItem('token', data.access_token);
+                // Другой пользователь — локальные копии коллекций синхронизируем заново целиком
+                localStorage.removeItem('bookmarks_version');
+                localStorage.removeItem('cart_version');
             }
             errorDiv.classList.remove('show');
             errorDiv.textContent = '';
@@ -121,12 +124,32 @@ document.addEventListener('DOMContentLoaded', function () {
         localStorage.setItem('bookmarks', JSON.stringify(bookmarks));
     }
 
+    // --- Синхронизация с сервером ---
+    // Сервер отдаёт только изменения после сохранённой версии (since=); полный список приходит
+    // при первой загрузке или если версия устарела (full: true)
+    async function syncCollection(path, name, items) {
+        const version = localStorage.getItem(`${name}_version`);
+        const query = version !== null ? `?since=${encodeURIComponent(version)}` : '';
+        const data = await apiRequest(`${path}/changes${query}`);
+        // Конвертируем к прежнему формату для совместимости UI
+        const toLocal = c => ({ id: c.movie_id, title: c.title, author: c.author || '', price: c.price || '' });
+        let result;
+        if (data.full) {
+            result = data.items.map(toLocal);
+        } else {
+            const changed = new Set(data.items.map(c => String(c.movie_id)));
+            const removed = new Set(data.removed.map(String));
+            result = items.filter(item => !changed.has(String(item.id)) && !removed.has(String(item.id)))
+                .concat(data.items.map(toLocal));
+        }
+        localStorage.setItem(`${name}_version`, String(data.version));
+        return result;
+    }
+
     // --- Работа с серверными закладками ---
     async function fetchBookmarksFromServer() {
         try {
-            const data = await apiRequest('/bookmarks');
-            // Конвертируем к прежнему формату для совместимости UI
-            bookmarks = data.map(b => ({ id: b.movie_id, title: b.title, author: b.author || '', price: b.price || '' }));
+            bookmarks = await syncCollection('/bookmarks', 'bookmarks', bookmarks);
             updateStorage();
             return bookmarks;
         } catch (e) {
@@ -138,7 +161,7 @@ document.addEventListener('DOMContentLoaded', function () {
     async function addBookmarkOnServer(movie) {
         return apiRequest('/bookmarks', {
             method: 'POST',
-            body: JSON.stringify({ movie_id: movie.id, title: movie.title, author: movie.author, price: movie.price })
+            body: JSON.stringify({ movie_id: movie.id })
         });
     }
 
@@ -149,8 +172,7 @@ document.addEventListener('DOMContentLoaded', function () {
     // --- Работа с серверной корзиной ---
     async function fetchCartFromServer() {
         try {
-            const data = await apiRequest('/cart');
-            cart = data.map(c => ({ id: c.movie_id, title: c.title, author: c.author || '', price: c.price || '' }));
+            cart = await syncCollection('/cart', 'cart', cart);
             updateStorage();
             return cart;
         } catch (e) {
@@ -161,7 +183,7 @@ document.addEventListener('DOMContentLoaded', function () {
     async function addCartOnServer(movie) {
         return apiRequest('/cart', {
             method: 'POST',
-            body: JSON.stringify({ movie_id: movie.id, title: movie.title, author: movie.author, price: movie.price })
+            body: JSON.stringify({ movie_id: movie.id })
         });
     }
 
@@ -237,9 +259,23 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
-    // При загрузке страницы подтянем корзину и закладки для корректной иконки
-    fetchCartFromServer();
-    fetchBookmarksFromServer();
+    // --- Первая загрузка страницы ---
+    // Профиль, версии закладок и корзины и (на главной) случайные фильмы — одним запросом.
+    // Страницы берут профиль отсюда (window.appBootstrap) вместо отдельного /me
+    const randomCount = document.getElementById('randomMoviesSection') ? 4 : 0;
+    const bootstrapPromise = apiRequest(`/bootstrap?random=${randomCount}`).catch(() => null);
+    window.appBootstrap = bootstrapPromise;
+
+    // Списки синхронизируем, только если версия на сервере отличается от сохранённой
+    bootstrapPromise.then(data => {
+        if (!data || !data.user) return;
+        if (localStorage.getItem('cart_version') !== String(data.cart.version)) {
+            fetchCartFromServer();
+        }
+        if (localStorage.getItem('bookmarks_version') !== String(data.bookmarks.version)) {
+            fetchBookmarksFromServer();
+        }
+    });
 
     // --- Каталог жанров: переход на страницу жанра ---
     document.querySelectorAll('#genreList .genre-item').forEach(item => {
@@ -265,13 +301,14 @@ document.addEventListener('DOMContentLoaded', function () {
             if (allFilms.length > 0) {
                 console.log('Пример фильма:', {
                     title: allFilms[0].title,
-                    movie_base64: allFilms[0].movie_base64 ? `base64 данные (${allFilms[0].movie_base64.length} символов)` : 'нет'
+                    poster_url: allFilms[0].poster_url || 'нет'
                 });
             }
             renderMovies(allFilms, allMoviesSection);
 
-            // Загружаем 4 случайных фильма
-            const randomFilms = await apiRequest('/films/random/4');
+            // 4 случайных фильма уже пришли в /bootstrap
+            const boot = await bootstrapPromise;
+            const randomFilms = boot ? boot.random_films : await apiRequest('/films/random/4');
             console.log('Загружено случайных фильмов:', randomFilms.length);
             renderMovies(randomFilms, randomMoviesSection);
         } catch (e) {
@@ -286,19 +323,9 @@ document.addEventListener('DOMContentLoaded', function () {
             // Определяем изображение из БД или используем fallback
             let imageSrc;
             
-            if (film.movie_base64) {
-                // Проверяем, есть ли уже префикс data:
-                if (film.movie_base64.startsWith('data:image/')) {
-                    imageSrc = film.movie_base64;
-                    console.log(`Используем base64 с префиксом для: ${film.title}`);
-                } else if (film.movie_base64.startsWith('data:')) {
-                    imageSrc = film.movie_base64;
-                    console.log(`Используем base64 data: для: ${film.title}`);
-                } else {
-                    // Добавляем префикс для base64
-                    imageSrc = `data:image/jpeg;base64,${film.movie_base64}`;
-                    console.log(`Добавляем префикс base64 для: ${film.title} (длина: ${film.movie_base64.length})`);
-                }
+            if (film.poster_url) {
+                // Постер отдаётся сервером по отдельному URL и кешируется браузером
+                imageSrc = film.poster_url;
             } else {
                 // Fallback на локальные файлы
                 imageSrc = getImagePathForFilm(film.title);
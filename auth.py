@@ -1,26 +1,78 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from database import User
+from database import User, Role
+from caching import TTLCache
+from throttling import SlidingWindowLimiter
+from passwords import PasswordHashBusy, hash_password, verify_and_update
 from schemas import TokenData
-from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-
-# Настройка для хеширования паролей (pbkdf2_sha256 — кроссплатформенно и без ограничений 72 байта)
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+from config import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES,
+    AUTH_CACHE_TTL_SECONDS, AUTH_CACHE_MAXSIZE,
+    LOGIN_THROTTLE_WINDOW_SECONDS, LOGIN_ATTEMPTS_PER_USER, LOGIN_ATTEMPTS_PER_IP, LOGIN_THROTTLE_MAX_KEYS,
+    REGISTRATIONS_PER_IP,
+)
 
 # Настройка для JWT токенов
 security = HTTPBearer()
+# Для маршрутов, доступных и гостям: без заголовка Authorization ошибки нет
+optional_security = HTTPBearer(auto_error=False)
+
+# Кеши пути аутентификации: проверенные токены и пользователи с ролями
+_token_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+_user_cache = TTLCache(maxsize=AUTH_CACHE_MAXSIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+
+# Попытки входа: по имени (подбор пароля к одному аккаунту) и по адресу (перебор аккаунтов).
+# Счётчики в памяти процесса: при нескольких воркерах предел на каждый воркер
+_login_user_limiter = SlidingWindowLimiter(LOGIN_ATTEMPTS_PER_USER, LOGIN_THROTTLE_WINDOW_SECONDS, LOGIN_THROTTLE_MAX_KEYS)
+_login_ip_limiter = SlidingWindowLimiter(LOGIN_ATTEMPTS_PER_IP, LOGIN_THROTTLE_WINDOW_SECONDS, LOGIN_THROTTLE_MAX_KEYS)
+_register_ip_limiter = SlidingWindowLimiter(REGISTRATIONS_PER_IP, LOGIN_THROTTLE_WINDOW_SECONDS, LOGIN_THROTTLE_MAX_KEYS)
+
+def _hashing(func, *args):
+    # Хеш считается в пуле процессов; если пул перегружен, отвечаем сразу, а не копим очередь
+    try:
+        return func(*args)
+    except PasswordHashBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": "1"},
+        )
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Проверяет пароль"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return _hashing(verify_and_update, plain_password, hashed_password)[0]
 
 def get_password_hash(password: str) -> str:
     """Хеширует пароль"""
-    return pwd_context.hash(password)
+    return _hashing(hash_password, password)
+
+def _throttled(retry_after: float):
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"Слишком много попыток, повторите через {int(retry_after) + 1} с",
+        headers={"Retry-After": str(int(retry_after) + 1)},
+    )
+
+def check_registration_attempt(client_ip: str):
+    """Учитывает регистрацию до вычисления хеша; лимит отдельный, чтобы регистрации не расходовали попытки входа"""
+    retry_after = _register_ip_limiter.hit(client_ip)
+    if retry_after:
+        raise _throttled(retry_after)
+
+def check_login_attempt(client_ip: str, username: Optional[str] = None):
+    """Учитывает попытку входа до вычисления хеша; сверх предела — 429"""
+    retry_after = _login_ip_limiter.hit(client_ip)
+    if retry_after:
+        raise _throttled(retry_after)
+    if username is not None:
+        retry_after = _login_user_limiter.hit(username.strip().lower())
+        if retry_after:
+            raise _throttled(retry_after)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Создает JWT токен"""
@@ -36,6 +88,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 def verify_token(token: str, credentials_exception):
     """Проверяет JWT токен"""
+    # Уже проверенные токены кешируются по sha256, чтобы не декодировать подпись на каждый запрос
+    digest = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    cached = _token_cache.get(digest)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -44,20 +101,52 @@ def verify_token(token: str, credentials_exception):
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
+    # Запись не должна пережить сам токен
+    exp = payload.get("exp")
+    ttl = exp - time.time() if exp else None
+    _token_cache.set(digest, token_data, ttl=ttl)
     return token_data
 
+def invalidate_user_cache(username: str):
+    """Сбрасывает закешированного пользователя (смена пароля, аватара, деактивация)"""
+    _user_cache.pop(username)
+
+def get_user_with_role(username: str) -> Optional[User]:
+    """Загружает пользователя вместе с ролью одним запросом, с коротким кешем"""
+    user = _user_cache.get(username)
+    if user is None:
+        user = (User
+                .select(User, Role)
+                .join(Role)
+                .where(User.username == username)
+                .get_or_none())
+        if user is not None:
+            _user_cache.set(username, user)
+    return user
+
 def authenticate_user(username: str, password: str) -> Optional[User]:
     """Аутентифицирует пользователя"""
     try:
         # Пытаемся найти пользователя по username или email
         user = User.get((User.username == username) | (User.email == username))
-        if not verify_password(password, user.hashed_password):
-            return None
-        return user
     except User.DoesNotExist:
         return None
+    valid, new_hash = _hashing(verify_and_update, password, user.hashed_password)
+    if not valid:
+        return None
+    # Успешный вход не должен расходовать попытки владельца аккаунта
+    _login_user_limiter.reset(username.strip().lower())
+    if new_hash:
+        # Хеш с устаревшей стоимостью заменяем, пока знаем пароль; если пароль успели сменить — не трогаем
+        (User
+         .update(hashed_password=new_hash)
+         .where((User.id == user.id) & (User.hashed_password == user.hashed_password))
+         .execute())
+        user.hashed_password = new_hash
+        invalidate_user_cache(user.username)
+    return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Получает текущего пользователя из токена"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -68,16 +157,27 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     token = credentials.credentials
     token_data = verify_token(token, credentials_exception)
     
-    try:
-        user = User.get(User.username == token_data.username)
-        if user is None:
-            raise credentials_exception
-        return user
-    except User.DoesNotExist:
+    user = get_user_with_role(token_data.username)
+    if user is None:
         raise credentials_exception
+    return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """Получает активного пользователя"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Неактивный пользователь")
     return current_user
+
+def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> Optional[User]:
+    """Текущий пользователь или None для гостя.
+
+    Недействительный или истёкший токен и неактивный пользователь тоже считаются
+    гостем: страница должна открыться, а клиент — предложить войти заново.
+    """
+    if credentials is None:
+        return None
+    try:
+        user = get_current_user(credentials)
+    except HTTPException:
+        return None
+    return user if user.is_active else None
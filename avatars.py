@@ -0,0 +1,101 @@
+import io
+from typing import List, Optional, Tuple
+from database import Role, User, database
+from auth import invalidate_user_cache
+from blobstore import decode_base64_image, delete_blob_if_unused, sniff_content_type, store_blob
+from images import Image, run_in_process_pool
+from config import AVATAR_MAX_BYTES, AVATAR_SIZE, AVATAR_THUMB_SIZE, POSTER_WEBP_QUALITY
+
+if Image is not None:
+    from PIL import ImageOps, UnidentifiedImageError
+
+# Варианты аватара: имя -> сторона квадрата. large — для профиля, thumb — для списков и шапки
+AVATAR_VARIANTS = {"large": AVATAR_SIZE, "thumb": AVATAR_THUMB_SIZE}
+
+# (байты, MIME-тип, ширина, высота)
+RenderedAvatar = Tuple[bytes, str, Optional[int], Optional[int]]
+
+
+def render_avatar(data: bytes) -> List[RenderedAvatar]:
+    """Обрезает изображение по центру до квадрата и строит варианты в WebP. Выполняется в отдельном процессе.
+
+    Возвращает варианты в порядке AVATAR_VARIANTS; некорректное изображение — ValueError.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("RGB", (AVATAR_SIZE, AVATAR_SIZE))
+            img = ImageOps.exif_transpose(img)
+            has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise ValueError("Некорректное изображение")
+    variants = []
+    for size in AVATAR_VARIANTS.values():
+        side = min(size, img.width, img.height)
+        square = ImageOps.fit(img, (side, side), Image.LANCZOS)
+        buf = io.BytesIO()
+        square.save(buf, "WEBP", quality=POSTER_WEBP_QUALITY, method=4)
+        variants.append((buf.getvalue(), "image/webp", side, side))
+    return variants
+
+
+def _original(data: bytes) -> List[RenderedAvatar]:
+    # Без Pillow уменьшить нельзя: храним исходный файл для всех вариантов
+    content_type = sniff_content_type(data, default="")
+    if not content_type:
+        raise ValueError("Некорректное изображение")
+    return [(data, content_type, None, None)] * len(AVATAR_VARIANTS)
+
+
+def _render(data: bytes) -> List[RenderedAvatar]:
+    if len(data) > AVATAR_MAX_BYTES:
+        raise ValueError("Изображение слишком большое")
+    if Image is None:
+        return _original(data)
+    return run_in_process_pool(render_avatar, data)
+
+
+def render_stored_avatar(data: bytes) -> List[RenderedAvatar]:
+    """Варианты для уже сохранённого аватара (перенос старых данных): в текущем процессе и без
+    ограничения размера — старые аватары могли быть больше лимита, их уменьшаем, а не отбрасываем
+    """
+    return render_avatar(data) if Image is not None else _original(data)
+
+
+def store_avatar(variants: List[RenderedAvatar]) -> Tuple[str, str]:
+    """Сохраняет варианты в blobs (вызывать внутри транзакции записи); возвращает (large, thumb)"""
+    large, thumb = (store_blob(*variant) for variant in variants)
+    return large, thumb
+
+
+def _replace_avatar(user: User, variants: Optional[List[RenderedAvatar]]) -> User:
+    """Записывает новый аватар (None — удаляет) и удаляет blobs прежнего; возвращает пользователя из БД"""
+    with database.atomic("IMMEDIATE"):
+        # Прежние хеши читаются под блокировкой записи: пользователь из кеша мог устареть,
+        # а параллельная загрузка — уже заменить аватар
+        old = User.select(User.avatar_hash, User.avatar_thumb_hash).where(User.id == user.id).tuples().get()
+        large, thumb = store_avatar(variants) if variants else (None, None)
+        User.update(avatar_hash=large, avatar_thumb_hash=thumb).where(User.id == user.id).execute()
+        for digest in set(old) - {large, thumb}:
+            delete_blob_if_unused(digest)
+    # Закешированный экземпляр не меняется: его могут читать другие запросы
+    invalidate_user_cache(user.username)
+    return User.select(User, Role).join(Role).where(User.id == user.id).get()
+
+
+def set_user_avatar(user: User, data: bytes) -> User:
+    """Уменьшает изображение, сохраняет его вне строки users и удаляет прежний аватар.
+
+    Ошибки данных (не изображение, слишком большое) — ValueError.
+    """
+    return _replace_avatar(user, _render(data))
+
+
+def set_user_avatar_base64(user: User, payload: str) -> User:
+    """То же для data URL / base64 (как присылает FileReader.readAsDataURL)"""
+    data, _ = decode_base64_image(payload, max_bytes=AVATAR_MAX_BYTES)
+    return set_user_avatar(user, data)
+
+
+def clear_user_avatar(user: User) -> User:
+    return _replace_avatar(user, None)
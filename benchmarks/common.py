@@ -0,0 +1,87 @@
+"""Общие утилиты бенчмарков: статистика задержек и запуск uvicorn"""
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentiles(samples):
+    """p50/p95/p99 в миллисекундах по списку длительностей в секундах"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class HTTPDriver:
+    """Клиент поверх http.client с keep-alive; по одному экземпляру на поток"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    def request(self, method, path, payload=None, headers=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        hdrs = {"Content-Type": "application/json"}
+        hdrs.update(headers or {})
+        for attempt in range(2):
+            try:
+                self.conn.request(method, path, body=body, headers=hdrs)
+                resp = self.conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.HTTPException, OSError):
+                # Сервер закрыл keep-alive соединение — переподключаемся один раз
+                self.conn.close()
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                if attempt:
+                    raise
+
+
+def request(base_url, path, payload=None, method=None):
+    """Одиночный запрос без keep-alive (для подготовки данных)"""
+    host, port = base_url.split("//")[1].split(":")
+    driver = HTTPDriver(host, int(port))
+    try:
+        return driver.request(method or ("POST" if payload is not None else "GET"), path, payload)
+    finally:
+        driver.conn.close()
+
+
+def start_uvicorn(db_path, port, workers=1, extra_env=None):
+    # Все клиенты бенчмарка приходят с 127.0.0.1: ограничение попыток входа исказило бы замеры
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", DEBUG="False",
+               LOGIN_ATTEMPTS_PER_IP="0", LOGIN_ATTEMPTS_PER_USER="0", REGISTRATIONS_PER_IP="0")
+    env.update(extra_env or {})
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=str(ROOT), env=env,
+    )
+
+
+def wait_ready(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if request(base_url, "/api/v1/films/random/1")[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Сервер не запустился")
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Воспроизводимый бенчмарк API.
+
+Создаёт временную SQLite-базу заданного размера, прогоняет смешанную нагрузку
+(каталог, жанры, случайные фильмы, логины, закладки, добавление фильмов админом)
+в процессе (TestClient) и/или через локальный uvicorn и печатает JSON
+с пропускной способностью и p50/p95/p99 по маршрутам.
+
+Примеры:
+    python -m benchmarks.harness --films 2000 --users 100 --duration 15 --out bench.json
+    python -m benchmarks.harness --mode uvicorn --workers 2 --baseline bench.json
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from benchmarks.common import HTTPDriver, free_port, percentiles, start_uvicorn, wait_ready
+from benchmarks.seed import ADMIN_USERNAME, BENCH_PASSWORD, GENRES, seed_database
+
+API = "/api/v1"
+
+# Маленький постер для сценария добавления фильма (1x1 GIF)
+TINY_POSTER = "data:image/gif;base64," + base64.b64encode(
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+    b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+).decode()
+
+# Веса сценариев смешанной нагрузки (можно переопределить --mix browse=1,login=0,...)
+# discover (похожие/популярные) в смесь по умолчанию не входит, чтобы прогоны сравнивались с прежними базовыми
+DEFAULT_MIX = {
+    "browse": 30,
+    "genre": 20,
+    "random": 25,
+    "login": 5,
+    "bookmark_churn": 15,
+    "admin_insert": 5,
+}
+
+
+class InProcessDriver:
+    """Запросы к приложению без сети через starlette TestClient (общий на все потоки)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, path, payload=None, headers=None):
+        resp = self.client.request(method, path, json=payload, headers=headers)
+        return resp.status_code, resp.content
+
+
+# --- Сценарии: каждый возвращает список (маршрут, статус, длительность) ---
+
+def _timed(driver, route, method, path, payload=None, headers=None):
+    started = time.perf_counter()
+    status, _ = driver.request(method, path, payload, headers)
+    return route, status, time.perf_counter() - started
+
+
+def scenario_browse(driver, ctx, rng, worker):
+    return [_timed(driver, "GET /films/all", "GET", f"{API}/films/all")]
+
+
+def scenario_genre(driver, ctx, rng, worker):
+    return [_timed(driver, "GET /genres/{genre}/films", "GET", f"{API}/genres/{rng.choice(GENRES)}/films")]
+
+
+def scenario_random(driver, ctx, rng, worker):
+    return [_timed(driver, "GET /films/random/{count}", "GET", f"{API}/films/random/4")]
+
+
+def scenario_discover(driver, ctx, rng, worker):
+    film_id = rng.choice(ctx["film_ids"])
+    return [
+        _timed(driver, "GET /films/popular", "GET", f"{API}/films/popular?genre={rng.choice(GENRES)}"),
+        _timed(driver, "GET /films/{film_id}/similar", "GET", f"{API}/films/{film_id}/similar"),
+    ]
+
+
+def scenario_login(driver, ctx, rng, worker):
+    name = rng.choice(ctx["usernames"])
+    return [_timed(driver, "POST /login", "POST", f"{API}/login", {"username": name, "password": BENCH_PASSWORD})]
+
+
+def scenario_bookmark_churn(driver, ctx, rng, worker):
+    # У каждого потока свои пользователи, чтобы добавление/удаление не конфликтовали между потоками
+    tokens = ctx["tokens"][worker::ctx["threads"]] or ctx["tokens"]
+    headers = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+    film_id = str(rng.choice(ctx["film_ids"]))
+    return [
+        _timed(driver, "POST /bookmarks", "POST", f"{API}/bookmarks",
+               {"movie_id": film_id, "title": f"Film {film_id}"}, headers),
+        _timed(driver, "GET /bookmarks", "GET", f"{API}/bookmarks", headers=headers),
+        _timed(driver, "DELETE /bookmarks/{movie_id}", "DELETE", f"{API}/bookmarks/{film_id}", headers=headers),
+    ]
+
+
+def scenario_admin_insert(driver, ctx, rng, worker):
+    headers = {"Authorization": f"Bearer {ctx['admin_token']}"}
+    payload = {"title": f"Bench insert {rng.random():.8f}", "genre_title": rng.choice(GENRES),
+               "price": "199", "movie_base64": TINY_POSTER}
+    return [_timed(driver, "POST /admin/films", "POST", f"{API}/admin/films", payload, headers)]
+
+
+SCENARIOS = {
+    "browse": scenario_browse,
+    "genre": scenario_genre,
+    "random": scenario_random,
+    "discover": scenario_discover,
+    "login": scenario_login,
+    "bookmark_churn": scenario_bookmark_churn,
+    "admin_insert": scenario_admin_insert,
+}
+
+
+def login_all(driver, names):
+    tokens = []
+    for name in names:
+        status, body = driver.request("POST", f"{API}/login", {"username": name, "password": BENCH_PASSWORD})
+        if status != 200:
+            raise RuntimeError(f"Не удалось войти как {name}: {status} {body[:200]!r}")
+        tokens.append(json.loads(body)["access_token"])
+    return tokens
+
+
+def run_workload(make_driver, ctx, mix, threads, duration, warmup, seed):
+    """Гоняет смешанную нагрузку в threads потоков и собирает статистику по маршрутам"""
+    names = [n for n, w in mix.items() if w > 0]
+    weights = [mix[n] for n in names]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        driver = make_driver()
+        rng = random.Random(seed + index)
+        local_samples, local_errors = defaultdict(list), defaultdict(int)
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            results = SCENARIOS[rng.choices(names, weights)[0]](driver, ctx, rng, index)
+            if now < measure_from:
+                continue
+            for route, status, elapsed in results:
+                local_samples[route].append(elapsed)
+                if status >= 400:
+                    local_errors[route] += 1
+        with lock:
+            for route, values in local_samples.items():
+                samples[route].extend(values)
+            for route, count in local_errors.items():
+                errors[route] += count
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    routes = {}
+    for route in sorted(samples):
+        stats = percentiles(samples[route])
+        stats["errors"] = errors[route]
+        stats["rps"] = round(len(samples[route]) / duration, 1)
+        routes[route] = stats
+    total = sum(len(v) for v in samples.values())
+    return {"routes": routes, "total": {"requests": total, "rps": round(total / duration, 1),
+                                        "errors": sum(errors.values())}}
+
+
+def bench_inprocess(ctx, args, mix):
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        driver = InProcessDriver(client)
+        ctx["tokens"] = login_all(driver, ctx["usernames"][:args.active_users])
+        ctx["admin_token"] = login_all(driver, [ADMIN_USERNAME])[0]
+        return run_workload(lambda: driver, ctx, mix, args.threads, args.duration, args.warmup, args.seed)
+
+
+def bench_uvicorn(ctx, args, mix):
+    port = free_port()
+    server = start_uvicorn(ctx["db_path"], port, workers=args.workers)
+    try:
+        wait_ready(f"http://127.0.0.1:{port}")
+        driver = HTTPDriver("127.0.0.1", port)
+        ctx["tokens"] = login_all(driver, ctx["usernames"][:args.active_users])
+        ctx["admin_token"] = login_all(driver, [ADMIN_USERNAME])[0]
+        result = run_workload(lambda: HTTPDriver("127.0.0.1", port), ctx, mix, args.threads,
+                              args.duration, args.warmup, args.seed)
+        result["workers"] = args.workers
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def compare(report, baseline, threshold):
+    """Сравнивает p95 и rps с базовым отчётом; возвращает список регрессий"""
+    regressions = []
+    for mode, result in report["results"].items():
+        base_routes = baseline.get("results", {}).get(mode, {}).get("routes", {})
+        for route, stats in result["routes"].items():
+            base = base_routes.get(route)
+            if not base or not base.get("count"):
+                continue
+            p95_ratio = stats["p95_ms"] / max(base["p95_ms"], 0.01)
+            rps_ratio = stats["rps"] / max(base["rps"], 0.01)
+            line = f"{mode:9} {route:32} p95 {base['p95_ms']:8.2f} -> {stats['p95_ms']:8.2f} ms " \
+                   f"({p95_ratio:5.2f}x)  rps {base['rps']:8.1f} -> {stats['rps']:8.1f}"
+            print(line, file=sys.stderr)
+            if p95_ratio > 1 + threshold or rps_ratio < 1 - threshold:
+                regressions.append({"mode": mode, "route": route, "p95_ratio": round(p95_ratio, 2),
+                                    "rps_ratio": round(rps_ratio, 2)})
+    return regressions
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    if value:
+        for part in value.split(","):
+            name, _, weight = part.partition("=")
+            if name not in SCENARIOS:
+                raise SystemExit(f"Неизвестный сценарий: {name}")
+            mix[name] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn", "both"), default="both")
+    parser.add_argument("--films", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--bookmarks-per-user", type=int, default=10)
+    parser.add_argument("--cart-per-user", type=int, default=3)
+    parser.add_argument("--poster-kb", type=int, default=120, help="Средний размер постера, КБ (0 — без постеров)")
+    parser.add_argument("--distinct-posters", type=int, default=50)
+    parser.add_argument("--active-users", type=int, default=20, help="Сколько пользователей участвует в нагрузке")
+    parser.add_argument("--threads", type=int, default=8, help="Параллельных клиентов")
+    parser.add_argument("--workers", type=int, default=1, help="Воркеров uvicorn")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность замера, с")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Прогрев перед замером, с")
+    parser.add_argument("--mix", help="Веса сценариев, например browse=10,login=0")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="Путь к базе (по умолчанию — временный файл)")
+    parser.add_argument("--out", help="Куда сохранить JSON-отчёт (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="JSON-отчёт для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Допустимое ухудшение p95/rps относительно базового отчёта (доля)")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="videoteka-bench-"), "bench.db")
+    # Настройку БД нужно выставить до первого импорта модулей приложения
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("DEBUG", "False")
+    # Все виртуальные пользователи приходят с одного адреса: ограничение попыток входа выключено
+    os.environ.setdefault("LOGIN_ATTEMPTS_PER_IP", "0")
+    os.environ.setdefault("LOGIN_ATTEMPTS_PER_USER", "0")
+    os.environ.setdefault("REGISTRATIONS_PER_IP", "0")
+    from database import init_database, database
+
+    init_database()
+    dataset = seed_database(films=args.films, users=args.users, bookmarks_per_user=args.bookmarks_per_user,
+                            cart_per_user=args.cart_per_user, poster_kb=args.poster_kb,
+                            distinct_posters=args.distinct_posters, seed=args.seed)
+    database.close()
+    ctx = {"db_path": db_path, "usernames": dataset.pop("usernames"), "film_ids": dataset.pop("film_ids"),
+           "threads": args.threads}
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "threads": args.threads,
+            "duration_s": args.duration,
+            "mix": mix,
+            "dataset": dataset,
+        },
+        "results": {},
+    }
+    if args.mode in ("inprocess", "both"):
+        report["results"]["inprocess"] = bench_inprocess(ctx, args, mix)
+    if args.mode in ("uvicorn", "both"):
+        report["results"]["uvicorn"] = bench_uvicorn(ctx, args, mix)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        if regressions:
+            print(f"Регрессии производительности: {len(regressions)}", file=sys.stderr)
+            exit_code = 1
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: задержка /films/all во время волны логинов.
+
+Запускает uvicorn на временной базе, измеряет p50/p95/p99 для /api/v1/films/all
+в спокойном режиме и под параллельными запросами /api/v1/login, печатает JSON.
+Пример:
+    python -m benchmarks.login_burst --films 500 --login-threads 16 --duration 10
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import HTTPDriver, free_port, percentiles, request, start_uvicorn, wait_ready
+
+
+def seed_films(db_path, count):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            'INSERT INTO film_list (title, "title-ru", author, price_minor, "genre-title") VALUES (?, ?, ?, ?, ?)',
+            [(f"Film {i}", f"Фильм {i}", f"Director {i % 50}", (100 + i % 400) * 100,
+              ("action", "comedy", "drama", "horror", "scifi", "fantasy")[i % 6]) for i in range(count)],
+        )
+        conn.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    conn.close()
+
+
+def probe(port, stop, samples, interval):
+    driver = HTTPDriver("127.0.0.1", port)
+    while not stop.is_set():
+        started = time.perf_counter()
+        driver.request("GET", "/api/v1/films/all")
+        samples.append(time.perf_counter() - started)
+        time.sleep(interval)
+
+
+def login_worker(port, users, stop, counter):
+    driver = HTTPDriver("127.0.0.1", port)
+    i = 0
+    while not stop.is_set():
+        name = users[i % len(users)]
+        driver.request("POST", "/api/v1/login", {"username": name, "password": "benchmark-password"})
+        counter.append(1)
+        i += 1
+
+
+def run_phase(port, duration, interval, login_threads, users):
+    stop = threading.Event()
+    samples, logins = [], []
+    threads = [threading.Thread(target=probe, args=(port, stop, samples, interval))]
+    threads += [threading.Thread(target=login_worker, args=(port, users, stop, logins)) for _ in range(login_threads)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    result = percentiles(samples)
+    result["logins"] = len(logins)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--films", type=int, default=500)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--login-threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность каждой фазы, с")
+    parser.add_argument("--interval", type=float, default=0.01, help="Пауза между пробами /films/all, с")
+    parser.add_argument("--max-ratio", type=float, default=None,
+                        help="Завершиться с ошибкой, если p99 под нагрузкой больше p99 без неё в N раз")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="videoteka-bench-")
+    db_path = os.path.join(tmp, "bench.db")
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_uvicorn(db_path, port)
+    try:
+        wait_ready(base)
+        seed_films(db_path, args.films)
+        users = [f"bench{i}" for i in range(args.users)]
+        for name in users:
+            request(base, "/api/v1/register",
+                    {"username": name, "email": f"{name}@example.com", "password": "benchmark-password"})
+
+        report = {
+            "films": args.films,
+            "idle": run_phase(port, args.duration, args.interval, 0, users),
+            "login_burst": run_phase(port, args.duration, args.interval, args.login_threads, users),
+        }
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if args.max_ratio is not None:
+            ratio = report["login_burst"]["p99_ms"] / max(report["idle"]["p99_ms"], 0.001)
+            if ratio > args.max_ratio:
+                print(f"p99 вырос в {ratio:.1f} раз (допустимо {args.max_ratio})", file=sys.stderr)
+                sys.exit(1)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
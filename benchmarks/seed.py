@@ -0,0 +1,96 @@
+"""Наполнение базы синтетическими данными для бенчмарков.
+
+Модули приложения импортируются внутри функций: DATABASE_URL должен быть
+выставлен до первого импорта database.
+"""
+import os
+import random
+
+GENRES = ("action", "comedy", "drama", "horror", "scifi", "fantasy")
+WORDS = ("star", "night", "dark", "king", "ring", "war", "love", "city", "ghost", "river",
+         "storm", "iron", "last", "secret", "garden", "empire", "shadow", "dream", "road", "fire")
+WORDS_RU = ("звезда", "ночь", "тёмный", "король", "кольцо", "война", "любовь", "город", "призрак", "река",
+            "буря", "железный", "последний", "тайна", "сад", "империя", "тень", "мечта", "дорога", "огонь")
+
+BENCH_PASSWORD = "benchmark-password"
+ADMIN_USERNAME = "bench_admin"
+
+
+def _fake_jpeg(rng, size):
+    # Сигнатура JPEG + случайные байты: по размеру и несжимаемости похоже на настоящий постер
+    return b"\xff\xd8\xff\xe0" + rng.randbytes(max(0, size - 4))
+
+
+def seed_database(films=1000, users=50, bookmarks_per_user=10, cart_per_user=3,
+                  poster_kb=120, distinct_posters=50, seed=42, batch_size=500):
+    """Создаёт фильмы с постерами, пользователей (и одного админа), закладки и корзины.
+
+    Возвращает описание набора данных для отчёта бенчмарка.
+    """
+    from passwords import pwd_context
+    from blobstore import store_blob
+    from database import (
+        database, Film, User, Role, Bookmark, CartItem, bump_catalog_version,
+    )
+
+    rng = random.Random(seed)
+    with database.atomic():
+        poster_hashes = [
+            store_blob(_fake_jpeg(rng, int(poster_kb * 1024 * rng.uniform(0.5, 1.5))), "image/jpeg")
+            for _ in range(distinct_posters)
+        ] if poster_kb and distinct_posters else [None]
+
+    film_rows = []
+    for i in range(films):
+        words = rng.sample(range(len(WORDS)), 3)
+        film_rows.append({
+            "title": " ".join(WORDS[w] for w in words).title() + f" {i}",
+            "title_ru": " ".join(WORDS_RU[w] for w in words).capitalize() + f" {i}",
+            "author": f"Director {rng.randrange(max(1, films // 10))}",
+            "price_minor": rng.randrange(99, 999) * 100,
+            "genre_title": GENRES[i % len(GENRES)],
+            "poster_hash": rng.choice(poster_hashes),
+        })
+    with database.atomic():
+        for start in range(0, len(film_rows), batch_size):
+            Film.insert_many(film_rows[start:start + batch_size]).execute()
+        bump_catalog_version()
+
+    # Хешируем пароль один раз — для бенчмарка все пользователи с одинаковым паролем
+    password_hash = pwd_context.hash(BENCH_PASSWORD)
+    user_role = Role.get(Role.name == "user")
+    admin_role = Role.get(Role.name == "administrator")
+    usernames = [f"bench{i}" for i in range(users)]
+    with database.atomic():
+        rows = [{"username": name, "email": f"{name}@example.com", "hashed_password": password_hash,
+                 "role": user_role} for name in usernames]
+        rows.append({"username": ADMIN_USERNAME, "email": f"{ADMIN_USERNAME}@example.com",
+                     "hashed_password": password_hash, "role": admin_role})
+        for start in range(0, len(rows), batch_size):
+            User.insert_many(rows[start:start + batch_size]).execute()
+
+    film_ids = [film_id for (film_id,) in Film.select(Film.flim_id).tuples()]
+    user_ids = [u.id for u in User.select(User.id).where(User.username.in_(usernames))]
+    bookmark_rows, cart_rows = [], []
+    for user_id in user_ids:
+        for film_id in rng.sample(film_ids, min(bookmarks_per_user, len(film_ids))):
+            bookmark_rows.append({"user": user_id, "film": film_id})
+        for film_id in rng.sample(film_ids, min(cart_per_user, len(film_ids))):
+            cart_rows.append({"user": user_id, "film": film_id})
+    with database.atomic():
+        for start in range(0, len(bookmark_rows), batch_size):
+            Bookmark.insert_many(bookmark_rows[start:start + batch_size]).execute()
+        for start in range(0, len(cart_rows), batch_size):
+            CartItem.insert_many(cart_rows[start:start + batch_size]).execute()
+
+    return {
+        "films": films,
+        "users": users,
+        "bookmarks": len(bookmark_rows),
+        "cart_items": len(cart_rows),
+        "poster_kb": poster_kb,
+        "distinct_posters": distinct_posters if poster_kb else 0,
+        "usernames": usernames,
+        "film_ids": film_ids,
+        "db_size_mb": round(os.path.getsize(database.database) / 1024 / 1024, 1),
+    }
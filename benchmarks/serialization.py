@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк: стоимость сериализации одной строки списка.
+
+Сравнивает прежний путь (модель Peewee -> FilmResponse.model_validate ->
+повторная валидация и сериализация response_model в FastAPI -> json.dumps)
+с быстрым (кортежи/словари из Peewee -> fastjson.dumps) для /films/all и
+/bookmarks. Печатает JSON с микросекундами на строку.
+Пример:
+    python -m benchmarks.serialization --films 20000 --bookmarks 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from benchmarks.seed import seed_database
+
+
+def measure(fn, rows: int, repeat: int) -> dict:
+    """Лучшее время из repeat прогонов (меньше всего шума от планировщика)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return {"total_ms": round(best * 1000, 2), "us_per_row": round(best * 1e6 / max(rows, 1), 2)}
+
+
+def fastapi_double_pass(models, response_model):
+    """Что делал FastAPI с возвращённым списком моделей при заданном response_model"""
+    from pydantic import TypeAdapter
+    adapter = TypeAdapter(List[response_model])
+    prepared = [m.model_dump() for m in models]
+    validated = adapter.validate_python(prepared)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--films", type=int, default=20000)
+    parser.add_argument("--bookmarks", type=int, default=500, help="Закладок у одного пользователя")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="videoteka-bench-"), "bench.db")
+    # Настройку БД нужно выставить до первого импорта модулей приложения
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from database import init_database, Film, Bookmark, User
+    from catalog_cache import film_rows
+    from fastjson import dumps, orjson
+    from routers import BookmarkResponse
+    from user_collections import list_items
+    from schemas import FilmResponse
+
+    init_database()
+    seed_database(films=args.films, users=1, bookmarks_per_user=args.bookmarks, cart_per_user=0,
+                  poster_kb=1, distinct_posters=20)
+    user = User.get(User.username == "bench0")
+
+    def films_before():
+        models = [FilmResponse.model_validate(f, from_attributes=True) for f in Film.select().order_by(Film.flim_id)]
+        return fastapi_double_pass(models, FilmResponse)
+
+    def films_after():
+        return dumps(film_rows(Film.select().order_by(Film.flim_id)))
+
+    def bookmarks_before():
+        models = [BookmarkResponse.model_validate(item) for item in list_items(user.id, "bookmarks")]
+        return fastapi_double_pass(models, BookmarkResponse)
+
+    def bookmarks_after():
+        return dumps(list_items(user.id, "bookmarks"))
+
+    # Ответы должны совпадать по содержимому, иначе сравнение бессмысленно
+    assert json.loads(films_before()) == json.loads(films_after())
+    assert json.loads(bookmarks_before()) == json.loads(bookmarks_after())
+
+    bookmarks = Bookmark.select().where(Bookmark.user == user).count()
+    report = {"encoder": "orjson" if orjson is not None else "json", "films": {}, "bookmarks": {}}
+    for name, (before, after, rows) in {
+        "films": (films_before, films_after, args.films),
+        "bookmarks": (bookmarks_before, bookmarks_after, bookmarks),
+    }.items():
+        report[name]["rows"] = rows
+        report[name]["before"] = measure(before, rows, args.repeat)
+        report[name]["after"] = measure(after, rows, args.repeat)
+        report[name]["speedup"] = round(report[name]["before"]["total_ms"] / report[name]["after"]["total_ms"], 1)
+
+    json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
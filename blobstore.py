@@ -0,0 +1,100 @@
+import base64
+import binascii
+import hashlib
+import re
+from typing import Optional, Tuple
+from database import Blob, BlobVariant, Film, User
+from config import POSTER_MAX_BYTES
+
+# data:image/png;base64,.... — префикс data URL, который присылает FileReader.readAsDataURL
+_DATA_URL_RE = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?:;[^,;]*)*;base64,", re.IGNORECASE)
+
+# Сигнатуры форматов изображений. Тип всегда определяется по данным: тип из data URL
+# задаёт клиент, а /media отдаёт файлы с того же origin (text/html или SVG там — XSS)
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def sniff_content_type(data: bytes, default: str = "image/jpeg") -> str:
+    """Определяет MIME-тип изображения по первым байтам"""
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return default
+
+
+# Типы, которые принимаются на загрузку и отдаются из /media как есть
+IMAGE_CONTENT_TYPES = frozenset(mime for _, mime in _MAGIC) | {"image/webp"}
+
+
+def image_content_type(data: bytes) -> str:
+    """MIME-тип растрового изображения по сигнатуре; другие данные — ValueError"""
+    content_type = sniff_content_type(data, default="")
+    if not content_type:
+        raise ValueError("Поддерживаются только изображения JPEG, PNG, GIF и WebP")
+    return content_type
+
+
+def decode_base64_image(payload: str, max_bytes: int = POSTER_MAX_BYTES) -> Tuple[bytes, str]:
+    """Декодирует base64 (с префиксом data: или без) в байты и MIME-тип.
+
+    MIME-тип из префикса data: не используется — он определяется по содержимому.
+    Бросает ValueError, если строка не является корректным base64, слишком велика
+    или не содержит изображение JPEG, PNG, GIF или WebP.
+    """
+    payload = (payload or "").strip()
+    match = _DATA_URL_RE.match(payload)
+    if match:
+        payload = payload[match.end():]
+    # Оценка размера до декодирования, чтобы не тратить память на заведомо большие данные
+    if len(payload) * 3 // 4 > max_bytes:
+        raise ValueError("Изображение слишком большое")
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Некорректные данные base64")
+    if not data:
+        raise ValueError("Пустое изображение")
+    return data, image_content_type(data)
+
+
+def store_blob(data: bytes, content_type: str, width: Optional[int] = None, height: Optional[int] = None) -> str:
+    """Сохраняет данные в хранилище (однократно) и возвращает их sha256"""
+    digest = hashlib.sha256(data).hexdigest()
+    Blob.insert(
+        digest=digest,
+        content_type=content_type,
+        size=len(data),
+        data=data,
+        width=width,
+        height=height,
+    ).on_conflict_ignore().execute()
+    return digest
+
+
+def get_blob(digest: str) -> Optional[Blob]:
+    return Blob.get_or_none(Blob.digest == digest)
+
+
+def _is_referenced(digest: str) -> bool:
+    return (Film.select().where(Film.poster_hash == digest).exists()
+            or User.select().where((User.avatar_hash == digest) | (User.avatar_thumb_hash == digest)).exists()
+            or BlobVariant.select().where(BlobVariant.digest == digest).exists())
+
+
+def delete_blob_if_unused(digest: Optional[str]):
+    """Удаляет blob вместе с его вариантами, если на него больше не ссылаются фильмы и пользователи"""
+    if not digest or _is_referenced(digest):
+        return
+    variants = [d for (d,) in BlobVariant.select(BlobVariant.digest).where(BlobVariant.source == digest).tuples()]
+    BlobVariant.delete().where(BlobVariant.source == digest).execute()
+    Blob.delete().where(Blob.digest == digest).execute()
+    for variant in variants:
+        if not _is_referenced(variant):
+            Blob.delete().where(Blob.digest == variant).execute()
@@ -0,0 +1,259 @@
+"""Массовый импорт и экспорт каталога фильмов.
+
+Формат манифеста (CSV с заголовком или NDJSON) совпадает у импорта и экспорта:
+title, title_ru, author, price (в основных единицах, "299.50"), currency, genre_title
+и постер — либо poster (имя файла в каталоге изображений / zip-архиве), либо
+poster_base64 (содержимое файла).
+"""
+import base64
+import csv
+import io
+import json
+import os
+import zipfile
+import zlib
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from pydantic import BaseModel, Field, ValidationError
+from database import Blob, Film, database, bump_catalog_version
+from blobstore import decode_base64_image, image_content_type, store_blob
+from images import thumb_digest, schedule_poster_variants
+from money import parse_price, format_price, CURRENCY_PATTERN
+from config import BULK_BATCH_SIZE, POSTER_MAX_BYTES, DEFAULT_CURRENCY
+
+MANIFEST_FIELDS = ("title", "title_ru", "author", "price", "currency", "genre_title", "poster", "poster_base64")
+
+# Расширения файлов постеров при экспорте в каталог
+POSTER_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/gif": "gif", "image/webp": "webp"}
+
+# Пачка сбрасывается раньше batch_size, если постеры в ней заняли столько байт
+BATCH_MAX_POSTER_BYTES = 32 * 1024 * 1024
+
+PosterLoader = Callable[[str], bytes]
+
+
+class FilmImportRow(BaseModel):
+    title: str = Field(..., min_length=1, max_length=255)
+    title_ru: str | None = Field(None, max_length=255)
+    author: str | None = Field(None, max_length=255)
+    price: str | float | None = None  # в основных единицах: "299.50" или 299.5
+    currency: str | None = Field(None, pattern=CURRENCY_PATTERN)
+    genre_title: str = Field(..., min_length=1, max_length=100)
+    poster: str | None = None
+    poster_base64: str | None = None
+
+
+def read_manifest(stream, fmt: str) -> Iterator[Tuple[int, Union[dict, Exception]]]:
+    """Читает манифест построчно: (номер строки, словарь) или (номер строки, ошибка разбора).
+
+    stream — бинарный файл; весь манифест в память не загружается.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            # Пустые ячейки CSV — отсутствующие значения
+            yield reader.line_num, {k: (v if v != "" else None) for k, v in record.items() if k}
+    elif fmt == "ndjson":
+        for line_num, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_num, ValueError(f"Некорректный JSON: {e}")
+                continue
+            yield line_num, record if isinstance(record, dict) else ValueError("Ожидается JSON-объект")
+    else:
+        raise ValueError(f"Неизвестный формат манифеста: {fmt}")
+
+
+def directory_loader(directory: str) -> PosterLoader:
+    """Постеры из каталога; имена вне каталога (../) не принимаются"""
+    root = os.path.realpath(directory)
+
+    def load(name: str) -> bytes:
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError("Путь к постеру вне каталога изображений")
+        if os.path.getsize(path) > POSTER_MAX_BYTES:
+            raise ValueError("Изображение слишком большое")
+        with open(path, "rb") as f:
+            return f.read()
+    return load
+
+
+def zip_loader(archive) -> PosterLoader:
+    """Постеры из zip-архива (zipfile.ZipFile)"""
+    def load(name: str) -> bytes:
+        info = archive.getinfo(name)
+        if info.file_size > POSTER_MAX_BYTES:
+            raise ValueError("Изображение слишком большое")
+        return archive.read(info)
+    return load
+
+
+def _validate(record: dict, load_poster: Optional[PosterLoader]) -> Tuple[dict, Optional[Tuple[bytes, str]]]:
+    """Проверяет строку манифеста и загружает постер. Бросает ValueError с понятным текстом"""
+    try:
+        row = FilmImportRow.model_validate(record)
+    except ValidationError as e:
+        err = e.errors()[0]
+        field = ".".join(str(p) for p in err.get("loc", ())) or "строка"
+        raise ValueError(f"{field}: {err.get('msg')}")
+    poster = None
+    if row.poster_base64:
+        poster = decode_base64_image(row.poster_base64)
+    elif row.poster:
+        if load_poster is None:
+            raise ValueError("Постер указан файлом, но изображения не переданы")
+        try:
+            data = load_poster(row.poster)
+        except (FileNotFoundError, KeyError):
+            raise ValueError(f"Файл постера не найден: {row.poster}")
+        except (OSError, zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError):
+            # Повреждённый или зашифрованный файл архива, неподдерживаемое сжатие — ошибка строки, а не всего импорта
+            raise ValueError(f"Не удалось прочитать постер: {row.poster}")
+        if not data:
+            raise ValueError("Пустое изображение")
+        poster = data, image_content_type(data)
+    values = {
+        "title": row.title,
+        "title_ru": row.title_ru,
+        "author": row.author,
+        "price_minor": parse_price(row.price),
+        "currency": row.currency or DEFAULT_CURRENCY,
+        "genre_title": row.genre_title.strip().lower(),
+    }
+    return values, poster
+
+
+def _insert_batch(batch: List[Tuple[int, dict, Optional[Tuple[bytes, str]]]]) -> Tuple[List[int], List[str]]:
+    """Вставляет пачку одной транзакцией и одним INSERT; возвращает id фильмов и постеры без миниатюр"""
+    pending = []
+    with database.atomic("IMMEDIATE"):
+        rows = []
+        for _, values, poster in batch:
+            poster_hash = store_blob(*poster) if poster else None
+            thumb = thumb_digest(poster_hash) if poster_hash else None
+            if poster_hash and not thumb:
+                pending.append(poster_hash)
+            rows.append({**values, "poster_hash": poster_hash, "poster_thumb_hash": thumb})
+        # flim_id растут в порядке вставки, поэтому отсортированные id соответствуют строкам пачки
+        ids = sorted(film_id for (film_id,) in Film.insert_many(rows).returning(Film.flim_id).tuples().execute())
+        bump_catalog_version()
+    return ids, pending
+
+
+def import_films(
+    records: Iterable[Tuple[int, Union[dict, Exception]]],
+    load_poster: Optional[PosterLoader] = None,
+    batch_size: int = BULK_BATCH_SIZE,
+    futures: Optional[List[Future]] = None,
+) -> Iterator[dict]:
+    """Импортирует фильмы пачками по batch_size и выдаёт результат по каждой строке.
+
+    Некорректные строки пропускаются с ошибкой, остальные вставляются; если пачка
+    не записалась, ошибку получают все её строки. В памяти — не больше одной пачки
+    (и не больше BATCH_MAX_POSTER_BYTES постеров). Миниатюры постеров ставятся
+    в фоновую очередь; их Future добавляются в futures, если список передан.
+    """
+    batch = []
+    batch_bytes = 0
+    scheduled = set()  # один и тот же постер обрабатываем один раз за импорт
+
+    def flush():
+        nonlocal batch_bytes
+        try:
+            ids, pending = _insert_batch(batch)
+        except Exception as e:
+            results = [{"line": line, "status": "error", "error": f"Не удалось записать: {e}"} for line, _, _ in batch]
+        else:
+            results = [{"line": line, "status": "created", "flim_id": film_id}
+                       for (line, _, _), film_id in zip(batch, ids)]
+            for digest in pending:
+                if digest in scheduled:
+                    continue
+                scheduled.add(digest)
+                future = schedule_poster_variants(digest)
+                if future is not None and futures is not None:
+                    futures.append(future)
+        batch.clear()
+        batch_bytes = 0
+        return results
+
+    for line, record in records:
+        if isinstance(record, Exception):
+            yield {"line": line, "status": "error", "error": str(record)}
+            continue
+        try:
+            values, poster = _validate(record, load_poster)
+        except ValueError as e:
+            yield {"line": line, "status": "error", "error": str(e)}
+            continue
+        batch.append((line, values, poster))
+        batch_bytes += len(poster[0]) if poster else 0
+        if len(batch) >= batch_size or batch_bytes >= BATCH_MAX_POSTER_BYTES:
+            yield from flush()
+    if batch:
+        yield from flush()
+
+
+def export_rows(batch_size: int = BULK_BATCH_SIZE) -> Iterator[Tuple[dict, Optional[str]]]:
+    """Строки манифеста для всего каталога (без постера) и хеш постера; keyset-пачками"""
+    last_id = 0
+    while True:
+        rows = list(Film
+                    .select(Film.flim_id, Film.title, Film.title_ru, Film.author, Film.price_minor,
+                            Film.currency, Film.genre_title, Film.poster_hash)
+                    .where(Film.flim_id > last_id)
+                    .order_by(Film.flim_id)
+                    .limit(batch_size)
+                    .tuples())
+        if not rows:
+            return
+        for flim_id, title, title_ru, author, price_minor, currency, genre_title, poster_hash in rows:
+            yield {"title": title, "title_ru": title_ru, "author": author, "price": format_price(price_minor),
+                   "currency": currency, "genre_title": genre_title}, poster_hash
+        last_id = rows[-1][0]
+
+
+def poster_content(digest: str) -> Tuple[Optional[bytes], Optional[str]]:
+    row = Blob.select(Blob.data, Blob.content_type).where(Blob.digest == digest).tuples().first()
+    return (bytes(row[0]), row[1]) if row else (None, None)
+
+
+def export_with_inline_posters(batch_size: int = BULK_BATCH_SIZE) -> Iterator[dict]:
+    """Манифест, который можно сразу загрузить импортом: постеры в poster_base64"""
+    for row, poster_hash in export_rows(batch_size):
+        data, _ = poster_content(poster_hash) if poster_hash else (None, None)
+        row["poster_base64"] = base64.b64encode(data).decode("ascii") if data else None
+        yield row
+
+
+def export_to_directory(directory: str, fmt: str = "csv", batch_size: int = BULK_BATCH_SIZE) -> Dict[str, int]:
+    """Пишет manifest.csv|ndjson и каталог images/ с постерами (по одному файлу на постер)"""
+    images_dir = os.path.join(directory, "images")
+    os.makedirs(images_dir, exist_ok=True)
+    written: Dict[str, Optional[str]] = {}  # хеш постера -> имя файла
+    films = 0
+    with open(os.path.join(directory, f"manifest.{fmt}"), "w", encoding="utf-8", newline="") as manifest:
+        writer = csv.DictWriter(manifest, fieldnames=MANIFEST_FIELDS[:-1]) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        for row, poster_hash in export_rows(batch_size):
+            if poster_hash and poster_hash not in written:
+                data, content_type = poster_content(poster_hash)
+                name = None
+                if data is not None:
+                    name = f"{poster_hash}.{POSTER_EXTENSIONS.get(content_type, 'bin')}"
+                    with open(os.path.join(images_dir, name), "wb") as f:
+                        f.write(data)
+                written[poster_hash] = name
+            row["poster"] = written.get(poster_hash) if poster_hash else None
+            if writer:
+                writer.writerow(row)
+            else:
+                manifest.write(json.dumps(row, ensure_ascii=False) + "\n")
+            films += 1
+    return {"films": films, "posters": sum(1 for name in written.values() if name)}
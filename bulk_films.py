@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Массовый импорт и экспорт каталога фильмов напрямую в базу (без HTTP).
+
+Импорт манифеста CSV/NDJSON с каталогом изображений:
+    python bulk_films.py import catalog.csv --images ./posters
+Экспорт в каталог (manifest.csv + images/), который можно загрузить командой import:
+    python bulk_films.py export ./dump --format csv
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import wait
+
+
+def cmd_import(args):
+    from bulk import directory_loader, import_films, read_manifest
+    import images
+
+    fmt = args.format or ("csv" if args.manifest.lower().endswith(".csv") else "ndjson")
+    load_poster = directory_loader(args.images) if args.images else None
+    futures = []
+    created = failed = 0
+    started = time.perf_counter()
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+    try:
+        with open(args.manifest, "rb") as manifest:
+            for result in import_films(read_manifest(manifest, fmt), load_poster,
+                                       batch_size=args.batch_size, futures=futures):
+                if result["status"] == "created":
+                    created += 1
+                else:
+                    failed += 1
+                    print(f"строка {result['line']}: {result['error']}", file=sys.stderr)
+                if report:
+                    report.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if report:
+            report.close()
+    print(f"Добавлено: {created}, с ошибками: {failed}, {time.perf_counter() - started:.1f} с")
+    if futures and not args.skip_variants:
+        print(f"Обработка постеров: {len(futures)}...")
+        wait(futures)
+    images.shutdown()
+    return 1 if failed else 0
+
+
+def cmd_export(args):
+    from bulk import export_to_directory
+
+    stats = export_to_directory(args.directory, fmt=args.format, batch_size=args.batch_size)
+    print(f"Выгружено фильмов: {stats['films']}, постеров: {stats['posters']} -> {args.directory}")
+    return 0
+
+
+def main():
+    from config import BULK_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="Загрузить фильмы из манифеста")
+    p_import.add_argument("manifest", help="Файл CSV (с заголовком) или NDJSON")
+    p_import.add_argument("--images", help="Каталог с файлами, на которые ссылается колонка poster")
+    p_import.add_argument("--format", choices=("csv", "ndjson"), help="По умолчанию — по расширению файла")
+    p_import.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    p_import.add_argument("--report", help="Куда записать результат по каждой строке (NDJSON)")
+    p_import.add_argument("--skip-variants", action="store_true",
+                          help="Не ждать миниатюр: их построит сервер при запуске")
+    p_import.set_defaults(func=cmd_import)
+
+    p_export = sub.add_parser("export", help="Выгрузить каталог с постерами")
+    p_export.add_argument("directory", help="Куда записать manifest и images/")
+    p_export.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    p_export.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    p_export.set_defaults(func=cmd_export)
+
+    args = parser.parse_args()
+    from database import init_database
+    init_database()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
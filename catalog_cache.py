@@ -0,0 +1,207 @@
+import hashlib
+import heapq
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from database import Film, CatalogVersion, database, media_url
+from fastjson import dumps
+from money import format_price
+from schemas import FilmResponse
+
+# Колонки film_list в порядке полей FilmResponse; poster_url — миниатюра или оригинал постера
+_FILM_COLUMNS = (Film.flim_id, Film.title, Film.title_ru, Film.author, Film.price_minor, Film.currency,
+                 Film.genre_title, Film.poster_thumb_hash, Film.poster_hash)
+
+
+def dump_films(films: List[dict]) -> bytes:
+    """Сериализует список фильмов в JSON (так же, как это сделал бы JSONResponse)"""
+    return dumps(films)
+
+
+def film_to_dict(film: Film) -> dict:
+    return FilmResponse.model_validate(film, from_attributes=True).model_dump(mode="json")
+
+
+def film_rows(query) -> List[dict]:
+    """Фильмы из запроса в виде словарей FilmResponse — без моделей Peewee и валидации Pydantic.
+
+    Строки читаются кортежами; на большом каталоге это в несколько раз дешевле
+    film_to_dict для каждой строки.
+    """
+    return [
+        {
+            "flim_id": flim_id,
+            "title": title,
+            "title_ru": title_ru,
+            "author": author,
+            "price": format_price(price_minor),
+            "price_minor": price_minor,
+            "currency": currency,
+            "genre_title": genre_title,
+            "poster_url": media_url(poster_thumb_hash or poster_hash),
+        }
+        for flim_id, title, title_ru, author, price_minor, currency, genre_title, poster_thumb_hash, poster_hash
+        in query.select(*_FILM_COLUMNS).tuples()
+    ]
+
+
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога определённой версии.
+
+    Ответы для "всех фильмов" и для каждого жанра сериализуются один раз
+    при первом обращении и дальше отдаются готовыми байтами.
+    """
+
+    # Сколько разных детерминированных выборок (seed или день, count) держать в снимке
+    MAX_SEEDED_SAMPLES = 128
+
+    def __init__(self, version: int, films: List[dict]):
+        self.version = version
+        self.films = films
+        self.ids = tuple(f["flim_id"] for f in films)
+        self.by_id = {f["flim_id"]: f for f in films}
+        self.by_genre: Dict[str, List[dict]] = {}
+        for film in films:
+            self.by_genre.setdefault(film["genre_title"], []).append(film)
+        self._serialized: Dict[Optional[str], bytes] = {}
+        self._samples: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _serialize(self, key: Optional[str], films: List[dict]) -> bytes:
+        body = self._serialized.get(key)
+        if body is None:
+            with self._lock:
+                body = self._serialized.get(key)
+                if body is None:
+                    body = dump_films(films)
+                    self._serialized[key] = body
+        return body
+
+    def all_json(self) -> bytes:
+        return self._serialize(None, self.films)
+
+    def genre_json(self, genre: str) -> bytes:
+        return self._serialize(genre, self.by_genre.get(genre, []))
+
+    def films_json(self, ids) -> bytes:
+        """Сериализует фильмы в заданном порядке id (например, по релевантности поиска)"""
+        return dump_films([self.by_id[i] for i in ids if i in self.by_id])
+
+    def _sample(self, rng, count: int) -> List[dict]:
+        # Выбираем k идентификаторов из массива id и берём только эти строки: O(k)
+        count = max(0, min(count, len(self.ids)))
+        return [self.by_id[i] for i in rng.sample(self.ids, count)]
+
+    def random_films(self, count: int) -> List[dict]:
+        return self._sample(random, count)
+
+    def random_json(self, count: int) -> bytes:
+        return dump_films(self.random_films(count))
+
+    def _cached_sample(self, key: Tuple, build) -> bytes:
+        with self._lock:
+            body = self._samples.get(key)
+            if body is not None:
+                self._samples.move_to_end(key)
+                return body
+        body = dump_films(build())
+        with self._lock:
+            self._samples[key] = body
+            if len(self._samples) > self.MAX_SEEDED_SAMPLES:
+                self._samples.popitem(last=False)
+        return body
+
+    def seeded_json(self, seed: str, count: int) -> bytes:
+        """Детерминированная выборка: одинаковая для всех пользователей при одном seed.
+
+        Результат кешируется в снимке, поэтому повторные запросы не пересчитываются.
+        """
+        return self._cached_sample(("seed", seed, count),
+                                   lambda: self._sample(random.Random(f"{self.version}:{seed}"), count))
+
+    def daily_json(self, day: str, count: int) -> bytes:
+        """Подборка дня: фильмы с наименьшим хешем (день, id).
+
+        Зависит только от дня, а не от версии каталога: правка каталога меняет подборку,
+        только если удалён выбранный фильм (его место занимает следующий) или добавлен
+        фильм, попавший в начало порядка.
+        """
+        def rank(film_id: int) -> bytes:
+            return hashlib.blake2b(f"{day}:{film_id}".encode(), digest_size=8).digest()
+
+        return self._cached_sample(("daily", day, count),
+                                   lambda: [self.by_id[i] for i in heapq.nsmallest(max(0, count), self.ids, key=rank)])
+
+    def with_film(self, version: int, film: dict) -> "CatalogSnapshot":
+        return CatalogSnapshot(version, self.films + [film])
+
+    def without_film(self, version: int, film_id: int) -> "CatalogSnapshot":
+        return CatalogSnapshot(version, [f for f in self.films if f["flim_id"] != film_id])
+
+
+class CatalogCache:
+    """Кеш каталога в памяти процесса.
+
+    Актуальность проверяется по строке catalog_version: это один запрос к
+    крошечной таблице вместо чтения film_list. Если версия в БД изменилась
+    (например, фильм добавили через другой воркер uvicorn), снимок
+    перестраивается целиком.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._rebuild_lock = threading.Lock()
+
+    def current_version(self) -> int:
+        row = CatalogVersion.select(CatalogVersion.version).where(CatalogVersion.id == 1).tuples().first()
+        return row[0] if row else 0
+
+    def _build(self) -> CatalogSnapshot:
+        # Версия и строки читаются в одной транзакции, чтобы снимок был согласованным
+        with database.atomic():
+            version = self.current_version()
+            films = film_rows(Film.select().order_by(Film.flim_id))
+        return CatalogSnapshot(version, films)
+
+    def snapshot(self, version: Optional[int] = None) -> CatalogSnapshot:
+        """Возвращает актуальный снимок каталога, перестраивая его при необходимости.
+
+        version — уже прочитанная версия из catalog_version, чтобы не читать её повторно.
+        """
+        if version is None:
+            version = self.current_version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._rebuild_lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._build()
+                self._snapshot = snapshot
+        return snapshot
+
+    def film_added(self, version: int, film: Film):
+        """Дополняет снимок после создания фильма (version — значение после записи)"""
+        with self._rebuild_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version - 1:
+                self._snapshot = snapshot.with_film(version, film_to_dict(film))
+            else:
+                self._snapshot = None
+
+    def film_deleted(self, version: int, film_id: int):
+        """Убирает фильм из снимка после удаления (version — значение после записи)"""
+        with self._rebuild_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version - 1:
+                self._snapshot = snapshot.without_film(version, film_id)
+            else:
+                self._snapshot = None
+
+    def invalidate(self):
+        with self._rebuild_lock:
+            self._snapshot = None
+
+
+catalog = CatalogCache()
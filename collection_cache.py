@@ -0,0 +1,219 @@
+"""Закладки и корзина пользователей в памяти процесса.
+
+Списки хранятся готовыми JSON-ответами (LRU с пределом COLLECTION_CACHE_MAX_BYTES) вместе
+с версией коллекции, из которой построены. Версия всё равно читается для ETag, поэтому
+проверка актуальности бесплатна: изменение в другом воркере (или удаление фильма из
+каталога) меняет версию, и список перестраивается.
+
+С COLLECTION_WRITE_BEHIND_MS > 0 одиночные добавления и удаления не пишутся сразу:
+за это время изменения пользователя копятся, взаимно гасятся ("добавил-убрал") и
+записываются одной транзакцией. Перед любым чтением коллекции пользователя и перед
+пакетными изменениями его отложенные изменения записываются, так что сам пользователь
+всегда видит свои изменения.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from caching import LRUCache
+from database import database, get_collection_version
+from fastjson import dumps
+from metrics import registry
+from user_collections import COLLECTIONS, UnknownFilmError, apply_changes, list_items
+from config import COLLECTION_CACHE_MAX_BYTES, COLLECTION_WRITE_BEHIND_MS
+
+logger = logging.getLogger(__name__)
+
+# Оценка памяти на фильм в записи, сверх тела ответа (словарь flim_id -> id строки)
+_ID_OVERHEAD = 100
+
+
+@dataclass(frozen=True)
+class CachedCollection:
+    version: int
+    body: bytes                 # JSON-массив, как отдаёт GET /bookmarks и /cart
+    ids: Dict[int, int]         # flim_id -> id строки коллекции
+
+
+_cache = LRUCache(COLLECTION_CACHE_MAX_BYTES)
+
+
+def _load(user_id: int, kind: str) -> CachedCollection:
+    # Версия и строки читаются в одной транзакции, чтобы запись соответствовала версии
+    with database.atomic():
+        version = get_collection_version(user_id, kind)
+        items = list_items(user_id, kind)
+    return CachedCollection(version, dumps(items), {int(item["movie_id"]): item["id"] for item in items})
+
+
+def get_collection(user_id: int, kind: str, version: Optional[int] = None) -> CachedCollection:
+    """Список коллекции из кеша или из БД; version — уже прочитанная версия, чтобы не читать её повторно"""
+    if version is None:
+        version = get_collection_version(user_id, kind)
+    entry = _cache.get((user_id, kind), lambda cached: cached.version == version)
+    if entry is None:
+        entry = _load(user_id, kind)
+        _cache.set((user_id, kind), entry, len(entry.body) + _ID_OVERHEAD * len(entry.ids))
+    return entry
+
+
+def invalidate(user_id: int, kind: str):
+    _cache.pop((user_id, kind))
+
+
+# --- Запись ---
+
+_pending: Dict[Tuple[int, str], Dict[int, bool]] = {}     # (пользователь, коллекция) -> {flim_id: должен быть}
+_deadlines: Dict[Tuple[int, str], float] = {}             # когда записать; порядок вставки = порядок сроков
+_cond = threading.Condition()
+# Изменения одной коллекции выполняются по очереди; блокировки разбиты на полосы, чтобы не держать по одной на пользователя
+_key_locks = [threading.Lock() for _ in range(64)]
+_flusher: Optional[threading.Thread] = None
+_stopping = False
+_write_stats = {"deferred": 0, "coalesced": 0, "flushes": 0, "failed": 0}
+
+
+def _key_lock(key: Tuple[int, str]) -> threading.Lock:
+    return _key_locks[hash(key) % len(_key_locks)]
+
+
+def write_behind_enabled() -> bool:
+    return COLLECTION_WRITE_BEHIND_MS > 0
+
+
+def apply(user_id: int, kind: str, add: List[int], remove: List[int]) -> Tuple[int, List[int]]:
+    """apply_changes с поддержкой кеша: отложенные изменения коллекции записываются раньше"""
+    flush(user_id, kind)
+    with _key_lock((user_id, kind)):
+        try:
+            return apply_changes(user_id, kind, add, remove)
+        finally:
+            invalidate(user_id, kind)
+
+
+def defer(user_id: int, kind: str, film_id: int, present: bool) -> Tuple[bool, Optional[int]]:
+    """Откладывает добавление (present=True) или удаление фильма.
+
+    Возвращает (состояние изменилось, id строки, если фильм уже записан в коллекции).
+    Фильм должен быть в каталоге — это проверяет вызывающий.
+    """
+    key = (user_id, kind)
+    with _key_lock(key):
+        stored = get_collection(user_id, kind).ids.get(film_id)
+        with _cond:
+            ops = _pending.get(key, {})
+            current = ops.get(film_id, stored is not None)
+            if current == present:
+                return False, stored
+            if film_id in ops:
+                _write_stats["coalesced"] += 1
+            _pending.setdefault(key, {})[film_id] = present
+            _write_stats["deferred"] += 1
+            if key not in _deadlines:
+                _deadlines[key] = time.monotonic() + COLLECTION_WRITE_BEHIND_MS / 1000
+                _cond.notify()
+    _start_flusher()
+    return True, stored
+
+
+def _flush_key(key: Tuple[int, str]):
+    user_id, kind = key
+    with _key_lock(key):
+        with _cond:
+            ops = _pending.pop(key, None)
+            _deadlines.pop(key, None)
+        if not ops:
+            return
+        add = [film_id for film_id, present in ops.items() if present]
+        remove = [film_id for film_id, present in ops.items() if not present]
+        try:
+            try:
+                # Фильм, добавленный и снова убранный до записи, попадает в remove и ничего не меняет
+                apply_changes(user_id, kind, add, remove)
+            except UnknownFilmError as e:
+                # Фильм удалили из каталога, пока изменение ждало записи
+                apply_changes(user_id, kind, [f for f in add if f not in e.film_ids], remove)
+            with _cond:
+                _write_stats["flushes"] += 1
+        except Exception:
+            with _cond:
+                _write_stats["failed"] += 1
+            logger.exception("Не удалось записать отложенные изменения %s пользователя %s", kind, user_id)
+        finally:
+            invalidate(user_id, kind)
+
+
+def flush(user_id: Optional[int] = None, kind: Optional[str] = None):
+    """Записывает отложенные изменения пользователя (или всех, если user_id не задан)"""
+    if user_id is None:
+        with _cond:
+            keys = list(_pending)
+    else:
+        keys = [(user_id, k) for k in ([kind] if kind else COLLECTIONS) if (user_id, k) in _pending]
+    for key in keys:
+        _flush_key(key)
+
+
+def _flush_loop():
+    with database.connection_context():
+        while True:
+            with _cond:
+                while not _deadlines and not _stopping:
+                    _cond.wait()
+                if not _deadlines:
+                    return
+                key, deadline = next(iter(_deadlines.items()))
+                delay = deadline - time.monotonic()
+                if delay > 0 and not _stopping:
+                    _cond.wait(delay)
+                    continue
+            _flush_key(key)
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        with _cond:
+            if _flusher is None or not _flusher.is_alive():
+                _flusher = threading.Thread(target=_flush_loop, name="collection-write-behind", daemon=True)
+                _flusher.start()
+
+
+def shutdown(timeout: float = 10.0):
+    """Записывает все отложенные изменения (при остановке приложения)"""
+    global _stopping
+    with _cond:
+        _stopping = True
+        _cond.notify_all()
+    if _flusher is not None:
+        _flusher.join(timeout)
+    flush()
+    with _cond:
+        _stopping = False
+
+
+def _metrics() -> List[str]:
+    stats = _cache.stats()
+    with _cond:
+        pending = sum(len(ops) for ops in _pending.values())
+        writes = dict(_write_stats)
+    lines = []
+    for name, kind, help_text, value in (
+        ("hits_total", "counter", "Ответы из кеша списков закладок и корзины", stats["hits"]),
+        ("misses_total", "counter", "Списки, построенные из БД (нет в кеше или версия устарела)", stats["misses"]),
+        ("evictions_total", "counter", "Списки, вытесненные из кеша по пределу памяти", stats["evictions"]),
+        ("entries", "gauge", "Списков в кеше", stats["entries"]),
+        ("bytes", "gauge", "Оценка памяти кеша, байты", stats["bytes"]),
+        ("write_behind_pending", "gauge", "Отложенных изменений, ещё не записанных в БД", pending),
+        ("write_behind_deferred_total", "counter", "Отложенных изменений", writes["deferred"]),
+        ("write_behind_coalesced_total", "counter", "Изменений, перекрытых следующим до записи", writes["coalesced"]),
+        ("write_behind_flushes_total", "counter", "Транзакций с отложенными изменениями", writes["flushes"]),
+        ("write_behind_failed_total", "counter", "Неудачных записей отложенных изменений", writes["failed"]),
+    ):
+        metric = f"videoteka_collection_cache_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}", f"{metric} {value}"]
+    return lines
+
+
+registry.add_collector(_metrics)
@@ -6,12 +6,104 @@ load_dotenv()
 # Настройки базы данных
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///videoteka.db")
 
+# Профиль SQLite: "wal" — WAL и настройки для нескольких воркеров, "default" — настройки SQLite по умолчанию.
+# Отдельные параметры профиля можно переопределить переменными окружения ниже
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS")
+SQLITE_CACHE_SIZE_KB = os.getenv("SQLITE_CACHE_SIZE_KB")
+SQLITE_MMAP_SIZE = os.getenv("SQLITE_MMAP_SIZE")
+# Сколько ждать освобождения блокировки записи, прежде чем вернуть "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Миграции (migrate.py): через сколько секунд без признаков жизни блокировка другого процесса считается брошенной
+MIGRATION_LOCK_TIMEOUT_SECONDS = float(os.getenv("MIGRATION_LOCK_TIMEOUT_SECONDS", "600"))
+
 # JWT настройки
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Кеш проверенных токенов и пользователей: изменения в других воркерах видны не позже чем через TTL
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "30"))
+AUTH_CACHE_MAXSIZE = int(os.getenv("AUTH_CACHE_MAXSIZE", "10000"))
+
+# Пул потоков для синхронных обработчиков (запросы к БД и хеширование паролей)
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
+# Хеширование паролей — в отдельных процессах (не под GIL воркера API): сколько процессов
+# и сколько хешей может ждать в очереди; сверх этого /login и /register сразу отвечают 503.
+# PASSWORD_HASH_WORKERS=0 — считать в потоке запроса, без пула
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+# Стоимость pbkdf2_sha256 (число итераций); хеши с другим числом пересчитываются при входе
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+# Ограничение попыток входа (скользящее окно) до вычисления хеша: по имени пользователя и по IP.
+# 0 — без ограничения
+LOGIN_THROTTLE_WINDOW_SECONDS = float(os.getenv("LOGIN_THROTTLE_WINDOW_SECONDS", "300"))
+LOGIN_ATTEMPTS_PER_USER = int(os.getenv("LOGIN_ATTEMPTS_PER_USER", "10"))
+LOGIN_ATTEMPTS_PER_IP = int(os.getenv("LOGIN_ATTEMPTS_PER_IP", "100"))
+# Регистраций с одного IP за то же окно (отдельно от попыток входа)
+REGISTRATIONS_PER_IP = int(os.getenv("REGISTRATIONS_PER_IP", "20"))
+# Сколько ключей (имён и адресов) помнит ограничитель; при переполнении забываются самые давние
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "100000"))
+# Сколько обратных прокси перед приложением дописывают адрес в X-Forwarded-For: адрес клиента
+# берётся из заголовка на столько позиций справа. 0 — адрес соединения (без прокси или uvicorn
+# с --proxy-headers); без этого за прокси все клиенты делят один лимит по IP
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Журнал медленных запросов: порог в миллисекундах, 0 — выключен.
+# Для запросов дольше порога в лог пишутся все их SQL-выражения с временем
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
 
 # Настройки приложения
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
+
+# Хранилище медиа (постеры): публичный URL и ограничение размера
+MEDIA_URL_PREFIX = "/api/v1/media"
+POSTER_MAX_BYTES = int(os.getenv("POSTER_MAX_BYTES", str(10 * 1024 * 1024)))
+# Варианты постеров: ширина миниатюры для списков и крупного изображения для страницы фильма
+POSTER_THUMB_WIDTH = int(os.getenv("POSTER_THUMB_WIDTH", "320"))
+POSTER_LARGE_WIDTH = int(os.getenv("POSTER_LARGE_WIDTH", "1280"))
+POSTER_WEBP_QUALITY = int(os.getenv("POSTER_WEBP_QUALITY", "80"))
+# Аватары: максимальный размер загружаемого файла и стороны квадратных вариантов (WebP)
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", str(5 * 1024 * 1024)))
+AVATAR_SIZE = int(os.getenv("AVATAR_SIZE", "256"))
+AVATAR_THUMB_SIZE = int(os.getenv("AVATAR_THUMB_SIZE", "64"))
+# Процессов для обработки изображений (декодирование и ресайз не должны занимать воркеры API)
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))
+
+# Статика: каталог сборки (файлы с хешем содержимого в имени и их gzip/brotli-варианты).
+# Собирается при запуске; можно собрать заранее: python static_assets.py
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static_build"))
+STATIC_GZIP_LEVEL = int(os.getenv("STATIC_GZIP_LEVEL", "9"))
+STATIC_BROTLI_QUALITY = int(os.getenv("STATIC_BROTLI_QUALITY", "11"))
+
+# Валюта цен фильмов, если она не указана явно (ISO 4217)
+DEFAULT_CURRENCY = os.getenv("DEFAULT_CURRENCY", "RUB")
+
+# Случайная подборка фильмов: максимальный размер выдачи
+RANDOM_FILMS_MAX = int(os.getenv("RANDOM_FILMS_MAX", "50"))
+
+# Рекомендации (recommendations.py): длина готовых списков "похожие" и "популярные",
+# сколько пользователей учитывать за одну транзакцию и как часто пересчитывать на сервере
+# (0 — только вручную: python recommendations.py)
+RECOMMENDATIONS_TOP_N = int(os.getenv("RECOMMENDATIONS_TOP_N", "50"))
+RECOMMENDATIONS_BATCH_USERS = int(os.getenv("RECOMMENDATIONS_BATCH_USERS", "2000"))
+RECOMMENDATIONS_INTERVAL_SECONDS = float(os.getenv("RECOMMENDATIONS_INTERVAL_SECONDS", "300"))
+
+# Постраничная выдача каталога: размер страницы по умолчанию и максимум
+FILMS_PAGE_DEFAULT = int(os.getenv("FILMS_PAGE_DEFAULT", "50"))
+FILMS_PAGE_MAX = int(os.getenv("FILMS_PAGE_MAX", "500"))
+# Потоковая выгрузка каталога: сколько строк читается из БД за один чанк
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+# Кеш списков закладок и корзины в памяти процесса (готовые JSON-ответы, LRU): предел в байтах, 0 — выключен
+COLLECTION_CACHE_MAX_BYTES = int(os.getenv("COLLECTION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Отложенная запись одиночных добавлений/удалений: изменения за это время (мс) сливаются в одну
+# транзакцию, быстрые "добавил-убрал" взаимно гасятся. 0 — запись сразу. Пока изменение ждёт,
+# другие воркеры его не видят, а при аварийной остановке процесса оно теряется
+COLLECTION_WRITE_BEHIND_MS = float(os.getenv("COLLECTION_WRITE_BEHIND_MS", "0"))
+# Сколько дней хранить отметки об удалении из закладок и корзины (для since=). Клиент, который
+# синхронизировался раньше, получает полный список (full=true)
+COLLECTION_TOMBSTONE_RETENTION_DAYS = float(os.getenv("COLLECTION_TOMBSTONE_RETENTION_DAYS", "30"))
+# Массовый импорт: строк в одной транзакции и одном INSERT
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
@@ -1,6 +1,16 @@
 import os
+import time
 from peewee import *
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL, MEDIA_URL_PREFIX, SQLITE_PROFILE, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS,
+    SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT_MS, DEFAULT_CURRENCY,
+)
+from metrics import observe_sql
+from money import format_price
+
+def media_url(digest):
+    """Публичный URL файла из хранилища blobs"""
+    return f"{MEDIA_URL_PREFIX}/{digest}" if digest else None
 
 # Всегда используем SQLite
 def _resolve_sqlite_path(url: str) -> str:
@@ -12,7 +22,57 @@ def _resolve_sqlite_path(url: str) -> str:
         return url.split("sqlite:///")[-1]
     return url
 
-database = SqliteDatabase(_resolve_sqlite_path(DATABASE_URL))
+# Профили настроек SQLite (PRAGMA применяются к каждому новому соединению)
+SQLITE_PROFILES = {
+    "default": {},
+    "wal": {
+        # Читатели не блокируют писателя и друг друга — важно для нескольких воркеров uvicorn
+        "journal_mode": "wal",
+        # В режиме WAL NORMAL безопасен и не делает fsync на каждую транзакцию
+        "synchronous": "normal",
+        "cache_size": -64 * 1024,  # 64 МБ (отрицательное значение — в килобайтах)
+        "mmap_size": 256 * 1024 * 1024,
+    },
+}
+
+def _sqlite_pragmas() -> dict:
+    """Собирает PRAGMA из выбранного профиля и переопределений из окружения"""
+    if SQLITE_PROFILE not in SQLITE_PROFILES:
+        raise ValueError(f"Неизвестный профиль SQLite: {SQLITE_PROFILE}")
+    pragmas = dict(SQLITE_PROFILES[SQLITE_PROFILE])
+    if SQLITE_JOURNAL_MODE:
+        pragmas["journal_mode"] = SQLITE_JOURNAL_MODE
+    if SQLITE_SYNCHRONOUS:
+        pragmas["synchronous"] = SQLITE_SYNCHRONOUS
+    if SQLITE_CACHE_SIZE_KB:
+        pragmas["cache_size"] = -int(SQLITE_CACHE_SIZE_KB)
+    if SQLITE_MMAP_SIZE:
+        pragmas["mmap_size"] = int(SQLITE_MMAP_SIZE)
+    return pragmas
+
+# Соединения у Peewee привязаны к потоку: каждый поток пула открывает своё
+# соединение при первом запросе (autoconnect) и держит его открытым,
+# поэтому между запросами не тратится время на connect/close.
+# Пишущие транзакции открываются как database.atomic("IMMEDIATE"): отложенная
+# транзакция, начавшаяся с чтения, в WAL не может дождаться блокировки записи
+# и сразу падает с "database is locked", а IMMEDIATE честно ждёт busy_timeout.
+class InstrumentedSqliteDatabase(SqliteDatabase):
+    """SqliteDatabase, сообщающая о каждом SQL-выражении в metrics (число и время за запрос)"""
+
+    def execute_sql(self, sql, params=None, commit=None):
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params, commit)
+        finally:
+            observe_sql(sql, time.perf_counter() - start)
+
+
+database = InstrumentedSqliteDatabase(
+    _resolve_sqlite_path(DATABASE_URL),
+    pragmas=_sqlite_pragmas(),
+    timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+    autoconnect=True,
+)
 
 class BaseModel(Model):
     class Meta:
@@ -32,7 +92,10 @@ class User(BaseModel):
     email = CharField(max_length=100, unique=True, index=True)
     hashed_password = CharField(max_length=255)
     is_active = BooleanField(default=True)
-    avatar_base64 = TextField(null=True)
+    # Аватар хранится в таблице blobs (avatars.py); в строке пользователя только хеши,
+    # поэтому загрузка пользователя при каждом запросе не тянет мегабайты base64
+    avatar_hash = CharField(max_length=64, null=True)
+    avatar_thumb_hash = CharField(max_length=64, null=True)
     role = ForeignKeyField(Role, backref='users', default=1)
     created_at = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
     updated_at = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
@@ -40,92 +103,220 @@ class User(BaseModel):
     class Meta:
         table_name = 'users'
 
+    @property
+    def avatar_url(self):
+        return media_url(self.avatar_hash)
+
+    @property
+    def avatar_thumb_url(self):
+        return media_url(self.avatar_thumb_hash or self.avatar_hash)
+
+class Film(BaseModel):
+    flim_id = AutoField(primary_key=True, column_name='flim_id')
+    title = CharField(max_length=255)
+    title_ru = CharField(max_length=255, null=True, column_name='title-ru')
+    author = CharField(max_length=255, null=True)
+    # Цена в минимальных единицах валюты (копейках): суммы считаются в SQL без разбора строк
+    price_minor = IntegerField(null=True)
+    currency = CharField(max_length=3, default=DEFAULT_CURRENCY, constraints=[SQL(f"DEFAULT '{DEFAULT_CURRENCY}'")])
+    created_at = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
+    genre_title = CharField(max_length=100, column_name='genre-title', index=True)
+    # Хеш постера в таблице blobs (старая колонка movie_base64 переносится и удаляется миграцией 0002)
+    poster_hash = CharField(max_length=64, null=True, column_name='poster_hash')
+    # Миниатюра постера для списков; заполняется фоновой обработкой (images.py)
+    poster_thumb_hash = CharField(max_length=64, null=True)
+
+    class Meta:
+        table_name = 'film_list'
+        indexes = (
+            # Постраничная выдача: сортировка по названию, в том числе внутри жанра
+            (('title',), False),
+            (('genre_title', 'title'), False),
+        )
+
+    @property
+    def price(self):
+        # Цена для отображения в основных единицах: "299" или "299.50"
+        return format_price(self.price_minor)
+
+    @property
+    def poster_url(self):
+        # В списках — миниатюра, пока её нет — оригинал
+        return media_url(self.poster_thumb_hash or self.poster_hash)
+
 class Bookmark(BaseModel):
     id = AutoField(primary_key=True)
     user = ForeignKeyField(User, backref='bookmarks', on_delete='CASCADE')
-    movie_id = CharField(max_length=100, index=True)
-    title = CharField(max_length=255)
-    author = CharField(max_length=255, null=True)
-    price = CharField(max_length=50, null=True)
+    # Название, режиссёр и цена берутся из каталога: в строке пользователя только ссылка на фильм
+    film = ForeignKeyField(Film, column_name='film_id', on_delete='CASCADE')
     created_at = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
+    # Версия коллекции, в которой строка последний раз менялась (для синхронизации since=)
+    version = IntegerField(default=0)
 
     class Meta:
         table_name = 'bookmarks'
         indexes = (
-            # Уникальность закладки по пользователю и идентификатору фильма
-            (('user', 'movie_id'), True),
+            # Уникальность закладки по пользователю и фильму
+            (('user', 'film'), True),
         )
 
 class CartItem(BaseModel):
     id = AutoField(primary_key=True)
     user = ForeignKeyField(User, backref='cart_items', on_delete='CASCADE')
-    movie_id = CharField(max_length=100, index=True)
-    title = CharField(max_length=255)
-    author = CharField(max_length=255, null=True)
-    price = CharField(max_length=50, null=True)
+    film = ForeignKeyField(Film, column_name='film_id', on_delete='CASCADE')
     created_at = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
+    # Версия коллекции, в которой строка последний раз менялась (для синхронизации since=)
+    version = IntegerField(default=0)
 
     class Meta:
         table_name = 'cart_items'
         indexes = (
-            (('user', 'movie_id'), True),
+            (('user', 'film'), True),
         )
 
-class Film(BaseModel):
-    flim_id = AutoField(primary_key=True, column_name='flim_id')
-    title = CharField(max_length=255)
-    title_ru = CharField(max_length=255, null=True, column_name='title-ru')
-    author = CharField(max_length=255, null=True)
-    price = CharField(max_length=50, null=True)
+class Blob(BaseModel):
+    """Бинарные данные (постеры), адресуемые по sha256 содержимого"""
+    digest = CharField(max_length=64, primary_key=True)
+    content_type = CharField(max_length=100)
+    size = IntegerField()
+    data = BlobField()
     created_at = DateTimeField(constraints=[SQL('DEFAULT CURRENT_TIMESTAMP')])
-    genre_title = CharField(max_length=100, column_name='genre-title')
-    movie_base64 = TextField(null=True, column_name='movie_base64')
+    # Размеры изображения; известны после обработки постера
+    width = IntegerField(null=True)
+    height = IntegerField(null=True)
+    # Pillow не смог декодировать изображение: варианты не строятся, при запуске не повторяются
+    variants_failed = BooleanField(default=False, constraints=[SQL('DEFAULT 0')])
 
     class Meta:
-        table_name = 'film_list'
+        table_name = 'blobs'
 
-def create_tables():
-    """Создает все таблицы в базе данных"""
-    database.connect()
-    database.create_tables([Role, User, Bookmark, CartItem, Film], safe=True)
-    database.close()
+class BlobVariant(BaseModel):
+    """Уменьшенная копия изображения (миниатюра, крупный WebP), сама хранится в blobs"""
+    source = CharField(max_length=64)   # digest оригинала
+    name = CharField(max_length=20)     # "thumb", "large"
+    digest = CharField(max_length=64, index=True)
+    content_type = CharField(max_length=100)
+    width = IntegerField()
+    height = IntegerField()
 
-def init_database():
-    """Инициализирует базу данных"""
-    create_tables()
-    database.connect(reuse_if_open=True)
+    class Meta:
+        table_name = 'blob_variants'
+        primary_key = CompositeKey('source', 'name')
+
+class CatalogVersion(BaseModel):
+    """Счётчик изменений каталога: одна строка, увеличивается при каждой записи в film_list"""
+    id = IntegerField(primary_key=True)
+    version = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'catalog_version'
+
+def bump_catalog_version() -> int:
+    """Увеличивает версию каталога и возвращает новое значение (вызывать внутри транзакции записи)"""
+    CatalogVersion.update(version=CatalogVersion.version + 1).where(CatalogVersion.id == 1).execute()
+    return CatalogVersion.get_by_id(1).version
+
+class CollectionVersion(BaseModel):
+    """Версии пользовательских коллекций (закладки, корзина) для ETag"""
+    user = ForeignKeyField(User, on_delete='CASCADE')
+    kind = CharField(max_length=20)
+    version = IntegerField(default=0)
+    # Наибольшая версия среди удалённых старых отметок об удалении: since меньше неё — полный список
+    pruned_version = IntegerField(default=0, constraints=[SQL('DEFAULT 0')])
+
+    class Meta:
+        table_name = 'collection_versions'
+        primary_key = CompositeKey('user', 'kind')
+
+class CollectionTombstone(BaseModel):
+    """Удалённые из коллекции фильмы и версия удаления — чтобы клиент узнал об удалении через since="""
+    user = ForeignKeyField(User, on_delete='CASCADE')
+    kind = CharField(max_length=20)
+    movie_id = CharField(max_length=100)
+    version = IntegerField()
+    # Когда удалён (unix time): старые отметки удаляются, см. user_collections.prune_tombstones
+    deleted_at = FloatField(default=time.time, index=True)
+
+    class Meta:
+        table_name = 'collection_tombstones'
+        primary_key = CompositeKey('user', 'kind', 'movie_id')
+
+class FilmAudience(BaseModel):
+    """Сколько пользователей держат фильм в закладках или корзине (считает recommendations.py)"""
+    film_id = IntegerField(primary_key=True)
+    users = IntegerField()
+
+    class Meta:
+        table_name = 'film_audience'
+
+class FilmPair(BaseModel):
+    """Сколько пользователей держат оба фильма; каждая пара хранится в обе стороны"""
+    film_a = IntegerField()
+    film_b = IntegerField()
+    users = IntegerField()
+
+    class Meta:
+        table_name = 'film_pairs'
+        primary_key = CompositeKey('film_a', 'film_b')
+        without_rowid = True
+
+class RecommendationUser(BaseModel):
+    """Набор фильмов пользователя, уже учтённый в счётчиках, и версии его коллекций на тот момент"""
+    # Без внешнего ключа: строка удалённого пользователя нужна, чтобы вычесть его вклад
+    user_id = IntegerField(primary_key=True)
+    bookmarks_version = IntegerField(default=0)
+    cart_version = IntegerField(default=0)
+    films = TextField(default='[]')     # JSON-массив flim_id
+
+    class Meta:
+        table_name = 'recommendation_users'
+
+class RecommendationList(BaseModel):
+    """Готовый список рекомендаций по ключу: similar:<flim_id>, popular, popular:<жанр>"""
+    key = CharField(max_length=150, primary_key=True)
+    film_ids = TextField()              # JSON-массив flim_id, лучшие первыми
+    computed_at = IntegerField()        # миллисекунды; входит в ETag ответа
+
+    class Meta:
+        table_name = 'recommendation_lists'
+
+class RecommendationLease(BaseModel):
+    """Какой процесс пересчитывает рекомендации (одна строка) и когда он последний раз это подтвердил"""
+    id = IntegerField(primary_key=True)
+    owner = CharField(max_length=200)
+    heartbeat = FloatField()
+
+    class Meta:
+        table_name = 'recommendation_lease'
+
+def get_collection_version(user_id: int, kind: str) -> int:
+    row = (CollectionVersion
+           .select(CollectionVersion.version)
+           .where((CollectionVersion.user == user_id) & (CollectionVersion.kind == kind))
+           .tuples()
+           .first())
+    return row[0] if row else 0
+
+def bump_collection_version(user_id: int, kind: str) -> int:
+    """Увеличивает версию коллекции пользователя (вызывать внутри транзакции записи)"""
+    (CollectionVersion
+     .insert(user=user_id, kind=kind, version=1)
+     .on_conflict(
+         conflict_target=[CollectionVersion.user, CollectionVersion.kind],
+         update={CollectionVersion.version: CollectionVersion.version + 1})
+     .execute())
+    return get_collection_version(user_id, kind)
+
+def init_database(background: bool = False):
+    """Приводит схему базы к актуальной версии (migrations/, см. migrate.py).
+
+    С актуальной схемой это один SELECT. background=True — переносы данных
+    (например, постеров в blobs) идут в фоне и не задерживают запуск сервера.
+    """
+    from migrate import migrate
     try:
-        # Создаем роли, если их еще нет
-        try:
-            user_role = Role.get(Role.name == "user")
-        except Role.DoesNotExist:
-            Role.create(name="user", description="Обычный пользователь")
-        
-        try:
-            admin_role = Role.get(Role.name == "administrator")
-        except Role.DoesNotExist:
-            Role.create(name="administrator", description="Администратор системы")
-        
-        # Проверяем и добавляем поле role_id, если его нет
-        info = database.execute_sql("PRAGMA table_info(users)").fetchall()
-        columns = {row[1] for row in info}
-        
-        if 'role_id' not in columns:
-            database.execute_sql("ALTER TABLE users ADD COLUMN role_id INTEGER DEFAULT 1")
-        
-        if 'avatar_base64' not in columns:
-            database.execute_sql("ALTER TABLE users ADD COLUMN avatar_base64 TEXT")
-        
-        # Создадим таблицу корзины, если её нет
-        database.create_tables([CartItem, Film], safe=True)
- 
-        # Миграция: добавить колонку title-ru и movie_base64, если их нет
-        film_info = database.execute_sql("PRAGMA table_info(film_list)").fetchall()
-        film_columns = {row[1] for row in film_info}
-        if 'title-ru' not in film_columns:
-            database.execute_sql("ALTER TABLE film_list ADD COLUMN \"title-ru\" TEXT")
-        if 'movie_base64' not in film_columns:
-            database.execute_sql("ALTER TABLE film_list ADD COLUMN movie_base64 TEXT")
+        migrate(background=background)
     finally:
+        # Соединение текущего потока не нужно: обработчики открывают свои
         if not database.is_closed():
             database.close()
@@ -0,0 +1,56 @@
+import hashlib
+from typing import Callable, Optional
+from fastapi import Request, status
+from fastapi.responses import Response
+
+# Политики кеширования по типам ответов
+CATALOG_CACHE_CONTROL = "public, no-cache"      # общий для всех, но каждый раз с проверкой ETag
+USER_CACHE_CONTROL = "private, no-cache"        # только браузер пользователя, с проверкой ETag
+NO_STORE = "no-store"                           # случайные выборки кешировать бессмысленно
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из частей версии: make_etag("bookmarks", 7, 12) -> '"bookmarks-7-12"'"""
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+
+def request_variant(request: Request) -> str:
+    """Короткий хеш пути и параметров запроса: разные страницы/фильтры — разные ETag"""
+    raw = f"{request.url.path}?{request.url.query}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверяет заголовок If-None-Match (список значений, W/-префиксы, "*")"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional_response(
+    request: Request,
+    etag: str,
+    cache_control: str,
+    build: Callable[[], Response],
+    vary: Optional[str] = None,
+) -> Response:
+    """Отвечает 304, если у клиента актуальная версия, иначе вызывает build().
+
+    Для 304 тело не строится вовсе — ни запросов к строкам, ни сериализации.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response = build()
+    response.headers.update(headers)
+    return response
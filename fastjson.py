@@ -0,0 +1,20 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson есть в requirements.txt; без него работаем на стандартном json
+    orjson = None
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def dumps(obj: Any) -> bytes:
+    """Сериализует готовые dict/list в байты JSON (UTF-8, без пробелов).
+
+    Для списков из десятков тысяч строк orjson в разы быстрее json.dumps.
+    Результат совпадает с JSONResponse: кириллица не экранируется.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,181 @@
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+from database import Blob, BlobVariant, Film, database, bump_catalog_version
+from blobstore import store_blob
+from config import POSTER_THUMB_WIDTH, POSTER_LARGE_WIDTH, POSTER_WEBP_QUALITY, IMAGE_WORKERS
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # Pillow есть в requirements.txt; без него постеры отдаются только оригиналами
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Варианты постера: имя -> (ширина, формат Pillow, MIME-тип). Высота — по пропорциям оригинала,
+# изображения уже исходной ширины не увеличиваются
+POSTER_VARIANTS = {
+    "thumb": (POSTER_THUMB_WIDTH, "WEBP", "image/webp"),
+    "large": (POSTER_LARGE_WIDTH, "WEBP", "image/webp"),
+}
+
+# EXIF-ориентации, при которых изображение поворачивается на 90°
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def render_variants(data: bytes) -> dict:
+    """Декодирует изображение один раз и строит все варианты. Выполняется в отдельном процессе.
+
+    Возвращает {"width", "height", "variants": [(имя, байты, MIME, ширина, высота), ...]}.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        if img.getexif().get(0x0112, 1) in _ROTATED_ORIENTATIONS:
+            width, height = height, width
+        # JPEG можно декодировать сразу в уменьшенном масштабе (не меньше самого крупного варианта)
+        largest = max(w for w, _, _ in POSTER_VARIANTS.values())
+        img.draft("RGB", (largest, largest))
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ("RGBA", "LA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+        variants = []
+        for name, (target, fmt, content_type) in POSTER_VARIANTS.items():
+            w = min(target, img.width)
+            h = max(1, round(img.height * w / img.width))
+            resized = img if (w, h) == img.size else img.resize((w, h), Image.LANCZOS)
+            buf = io.BytesIO()
+            resized.save(buf, fmt, quality=POSTER_WEBP_QUALITY, method=4)
+            variants.append((name, buf.getvalue(), content_type, w, h))
+    return {"width": width, "height": height, "variants": variants}
+
+
+_lock = threading.Lock()
+_process_pool: Optional[ProcessPoolExecutor] = None
+_queue: Optional[ThreadPoolExecutor] = None
+
+
+def _pools():
+    """Пул процессов для Pillow и очередь потоков, которые ждут результат и пишут в БД.
+
+    Создаются лениво; spawn, а не fork — процесс API многопоточный.
+    """
+    global _process_pool, _queue
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            _queue = ThreadPoolExecutor(IMAGE_WORKERS, thread_name_prefix="poster-variants")
+        return _process_pool, _queue
+
+
+def run_in_process_pool(func, *args):
+    """Выполняет обработку изображения в пуле процессов и ждёт результат (поток API не держит GIL)"""
+    process_pool, _ = _pools()
+    return process_pool.submit(func, *args).result()
+
+
+def shutdown():
+    """Останавливает обработку (при завершении приложения); незапущенные задачи отменяются"""
+    global _process_pool, _queue
+    with _lock:
+        if _queue is not None:
+            _queue.shutdown(wait=False, cancel_futures=True)
+            # Текущий постер дообрабатывается: с wait=False воркер uvicorn может зависнуть
+            # на выходе интерпретатора, не дождавшись остановки процессов пула
+            _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = _queue = None
+
+
+def thumb_digest(digest: str) -> Optional[str]:
+    """Миниатюра уже обработанного постера (тот же файл мог быть загружен раньше)"""
+    return (BlobVariant
+            .select(BlobVariant.digest)
+            .where((BlobVariant.source == digest) & (BlobVariant.name == "thumb"))
+            .scalar())
+
+
+def _link_thumbnail(digest: str, thumb: str):
+    """Проставляет миниатюру всем фильмам с этим постером; каталог меняет версию"""
+    updated = (Film
+               .update(poster_thumb_hash=thumb)
+               .where((Film.poster_hash == digest)
+                      & (Film.poster_thumb_hash.is_null() | (Film.poster_thumb_hash != thumb)))
+               .execute())
+    if updated:
+        bump_catalog_version()
+
+
+def process_poster(digest: str) -> bool:
+    """Строит варианты постера (если их ещё нет) и привязывает миниатюру к фильмам"""
+    thumb = thumb_digest(digest)
+    if thumb:
+        with database.atomic("IMMEDIATE"):
+            _link_thumbnail(digest, thumb)
+        return False
+    data = (Blob.select(Blob.data)
+            .where((Blob.digest == digest) & (Blob.variants_failed == False))
+            .scalar())
+    if data is None:
+        return False
+    try:
+        result = run_in_process_pool(render_variants, bytes(data))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError, SyntaxError):
+        # Ошибка в самих данных — повтор ничего не даст; сбои пула процессов сюда не попадают
+        with database.atomic("IMMEDIATE"):
+            Blob.update(variants_failed=True).where(Blob.digest == digest).execute()
+        raise
+
+    with database.atomic("IMMEDIATE"):
+        # Фильм могли удалить вместе с постером, пока шла обработка
+        if not Blob.select().where(Blob.digest == digest).exists():
+            return False
+        Blob.update(width=result["width"], height=result["height"]).where(Blob.digest == digest).execute()
+        for name, variant, content_type, width, height in result["variants"]:
+            variant_digest = store_blob(variant, content_type, width, height)
+            BlobVariant.insert(
+                source=digest, name=name, digest=variant_digest,
+                content_type=content_type, width=width, height=height,
+            ).on_conflict_replace().execute()
+            if name == "thumb":
+                thumb = variant_digest
+        _link_thumbnail(digest, thumb)
+    return True
+
+
+def _process_logged(digest: str) -> bool:
+    try:
+        return process_poster(digest)
+    except Exception:
+        logger.exception("Не удалось обработать постер %s", digest)
+        return False
+
+
+def schedule_poster_variants(digest: Optional[str]) -> Optional[Future]:
+    """Ставит постер в очередь на фоновую обработку и сразу возвращает управление"""
+    if not digest or Image is None:
+        return None
+    _, queue = _pools()
+    return queue.submit(_process_logged, digest)
+
+
+def schedule_missing_variants() -> List[Future]:
+    """Ставит в очередь постеры, для которых ещё нет миниатюр (например, перенесённые из movie_base64).
+
+    Постеры, которые Pillow не смог декодировать, пропускаются.
+    """
+    if Image is None:
+        return []
+    digests = (Film
+               .select(Film.poster_hash)
+               .join(Blob, on=(Blob.digest == Film.poster_hash))
+               .where(Film.poster_thumb_hash.is_null() & (Blob.variants_failed == False))
+               .distinct()
+               .tuples())
+    return [schedule_poster_variants(digest) for (digest,) in digests]
+
+
+def poster_variants(digest: str) -> List[BlobVariant]:
+    return list(BlobVariant.select().where(BlobVariant.source == digest).order_by(BlobVariant.width))
@@ -1,21 +1,52 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from pathlib import Path
 from contextlib import asynccontextmanager
+from anyio import to_thread
 from database import init_database, database
 from routers import router
-from config import HOST, PORT, DEBUG
+import images
+import passwords
+import migrate
+import recommendations
+import collection_cache
+from user_collections import prune_tombstones
+import static_assets
+from static_assets import AssetFiles, BUILD_DIR
+from metrics import MetricsMiddleware, registry
+from config import HOST, PORT, DEBUG, THREADPOOL_SIZE
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Инициализация базы данных при запуске
-    init_database()
+    # Обработчики API синхронные: FastAPI выполняет их в пуле потоков anyio,
+    # поэтому запросы к БД и хеширование паролей не блокируют event loop
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Статика с хешем в именах и сжатыми вариантами; HTML ссылается на собранные файлы
+    static_assets.build()
+    # Схема базы: с актуальной версией — один SELECT; долгие переносы данных идут в фоне
+    init_database(background=True)
+    # Постеры без миниатюр (перенесённые из movie_base64 или загруженные до обработки) — в фоновую очередь
+    images.schedule_missing_variants()
+    # Старые отметки об удалении из закладок и корзины: клиенты с давним since получат полный список
+    prune_tombstones()
+    # Процессы хеширования паролей стартуют заранее, а не на первом входе
+    passwords.start()
+    # Похожие и популярные фильмы пересчитываются в фоне по изменившимся коллекциям (одним из воркеров)
+    recommendations.start_background()
     yield
-    # Очистка при завершении (если необходимо)
-    pass
+    recommendations.stop_background()
+    # Отложенные изменения закладок и корзины записываются до закрытия соединений
+    collection_cache.shutdown()
+    # Фоновый перенос данных останавливается после текущей порции и продолжится при следующем запуске
+    migrate.stop_background()
+    passwords.shutdown()
+    images.shutdown()
+    # Соединения с БД открываются лениво в потоках, которые обрабатывают запросы API
+    # (статика БД не трогает), и живут вместе с потоком; закрываем соединение текущего потока
+    if not database.is_closed():
+        database.close()
 
 # Создание экземпляра FastAPI
 app = FastAPI(
@@ -63,45 +94,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
-
-# Подключение/закрытие БД на каждый запрос (для Peewee)
-@app.middleware("http")
-async def db_session_middleware(request, call_next):
-    try:
-        if database.is_closed():
-            database.connect(reuse_if_open=True)
-        response = await call_next(request)
-        return response
-    finally:
-        if not database.is_closed():
-            database.close()
+# Метрики снаружи CORS, чтобы учитывать и preflight-запросы
+app.add_middleware(MetricsMiddleware)
 
 base_dir = Path(__file__).resolve().parent
 
 # Подключение роутеров
 app.include_router(router, prefix="/api/v1")
 
-# Отдаём статику: CSS/изображения — отдельными маунтами, затем корень с HTML
-app.mount("/all_css", StaticFiles(directory=str(base_dir / "all_css")), name="all_css")
-app.mount("/images", StaticFiles(directory=str(base_dir / "images")), name="images")
-app.mount("/images_for_buttons", StaticFiles(directory=str(base_dir / "images_for_buttons")), name="images_for_buttons")
-app.mount("/images_for_movies", StaticFiles(directory=str(base_dir / "images_for_movies")), name="images_for_movies")
+# Отдаём статику: CSS/изображения — отдельными маунтами, затем корень с HTML.
+# Сначала ищем в сборке (файлы с хешем, immutable), затем в исходниках (старые URL, no-cache)
+for directory in ("all_css", "images", "images_for_buttons", "images_for_movies"):
+    app.mount(f"/{directory}", AssetFiles(BUILD_DIR / directory, base_dir / directory), name=directory)
 
 
 @app.get("/app.js")
 def get_app_js():
-    return FileResponse(str(base_dir / "app.js"))
-
+    # Собранные страницы ссылаются на /app.<хеш>.js; этот адрес — для закешированных старых страниц
+    return FileResponse(str(base_dir / "app.js"), headers={"Cache-Control": "no-cache"})
 
-# В самом конце — корневой маунт с HTML, чтобы не перехватывать пути статики выше
-app.mount("/", StaticFiles(directory=str(base_dir / "all_html"), html=True), name="static_html")
 
 @app.get("/health")
 async def health_check():
     """Проверка состояния API"""
     return {"status": "healthy", "message": "API работает корректно"}
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus (по процессу воркера)"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# В самом конце — корневой маунт с HTML, чтобы не перехватывать пути статики и служебные маршруты выше
+app.mount("/", AssetFiles(BUILD_DIR / "all_html", base_dir / "all_html", html=True), name="static_html")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,202 @@
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from config import SLOW_REQUEST_MS
+
+logger = logging.getLogger("videoteka.slow")
+
+# Границы корзин гистограмм
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Запросы, не попавшие в маршрут API (статика, 404), сводятся в одну метку,
+# чтобы произвольные пути не раздували число временных рядов
+OTHER_ROUTE = "other"
+
+# Сколько SQL-выражений и символов каждого сохранять для журнала медленных запросов
+SLOW_LOG_MAX_STATEMENTS = 200
+SLOW_LOG_MAX_SQL_CHARS = 500
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus: накопительные корзины, сумма и количество"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """SQL-статистика одного запроса; заполняется из потоков пула через contextvar"""
+
+    __slots__ = ("sql_count", "sql_seconds", "statements")
+
+    def __init__(self, capture: bool):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.statements: Optional[List[Tuple[str, float]]] = [] if capture else None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def observe_sql(sql: str, seconds: float):
+    """Вызывается базой данных после каждого выражения"""
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.sql_count += 1
+    stats.sql_seconds += seconds
+    if stats.statements is not None and len(stats.statements) < SLOW_LOG_MAX_STATEMENTS:
+        stats.statements.append((sql[:SLOW_LOG_MAX_SQL_CHARS], seconds))
+
+
+class MetricsRegistry:
+    """Метрики по шаблонам маршрутов. Каждый воркер uvicorn считает свои."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.sql_per_request: Dict[Tuple[str, str], Histogram] = {}
+        self.sql_seconds: Dict[Tuple[str, str], float] = {}
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        # Метрики других модулей (кеши и т.п.): функции, возвращающие готовые строки
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def add_collector(self, collect: Callable[[], List[str]]):
+        self._collectors.append(collect)
+
+    def record(self, method: str, route: str, status: int, seconds: float, stats: RequestStats, size: int):
+        key = (method, route)
+        with self._lock:
+            status_key = (method, route, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.sql_per_request[key] = Histogram(SQL_COUNT_BUCKETS)
+                self.response_size[key] = Histogram(SIZE_BUCKETS)
+                self.sql_seconds[key] = 0.0
+            self.latency[key].observe(seconds)
+            self.sql_per_request[key].observe(stats.sql_count)
+            self.sql_seconds[key] += stats.sql_seconds
+            self.response_size[key].observe(size)
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus (text/plain; version=0.0.4)"""
+        lines: List[str] = []
+        with self._lock:
+            lines += [
+                "# HELP videoteka_requests_total Количество HTTP-запросов",
+                "# TYPE videoteka_requests_total counter",
+            ]
+            for (method, route, code), value in sorted(self.requests.items()):
+                lines.append(f"videoteka_requests_total{_labels(method, route, status=code)} {value}")
+            _render_histograms(lines, "videoteka_request_duration_seconds",
+                               "Время обработки запроса, секунды", self.latency)
+            _render_histograms(lines, "videoteka_sql_queries_per_request",
+                               "Число SQL-выражений за запрос", self.sql_per_request)
+            lines += [
+                "# HELP videoteka_sql_duration_seconds_total Суммарное время SQL-выражений, секунды",
+                "# TYPE videoteka_sql_duration_seconds_total counter",
+            ]
+            for (method, route), value in sorted(self.sql_seconds.items()):
+                lines.append(f"videoteka_sql_duration_seconds_total{_labels(method, route)} {value:.6f}")
+            _render_histograms(lines, "videoteka_response_size_bytes",
+                               "Размер тела ответа, байты", self.response_size)
+        for collect in self._collectors:
+            lines += collect()
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str, **extra: str) -> str:
+    pairs = [("method", method), ("route", route), *extra.items()]
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def _render_histograms(lines: List[str], name: str, help_text: str, series: Dict[Tuple[str, str], Histogram]):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), hist in sorted(series.items()):
+        cumulative = 0
+        for bound, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(method, route, le=_format_bound(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(method, route, le='+Inf')} {hist.count}")
+        lines.append(f"{name}_sum{_labels(method, route)} {hist.sum:.6f}")
+        lines.append(f"{name}_count{_labels(method, route)} {hist.count}")
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время ответа, SQL-выражения и размер тела по шаблону маршрута.
+
+    Шаблон (/api/v1/genres/{genre}/films) берётся из scope["route"], который
+    FastAPI заполняет при сопоставлении маршрута. Чистый ASGI, а не
+    BaseHTTPMiddleware, чтобы не буферизовать потоковые ответы.
+    """
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(capture=self.slow_request_ms > 0)
+        token = _current.set(stats)
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or OTHER_ROUTE
+            registry.record(scope["method"], route, status_code, elapsed, stats, size)
+            if stats.statements is not None and elapsed * 1000 >= self.slow_request_ms:
+                _log_slow_request(scope, status_code, elapsed, stats)
+
+
+def _log_slow_request(scope, status_code: int, elapsed: float, stats: RequestStats):
+    path = scope["path"]
+    if scope.get("query_string"):
+        path += "?" + scope["query_string"].decode("latin-1")
+    statements = "".join(f"\n  {seconds * 1000:8.2f} ms  {sql}" for sql, seconds in stats.statements)
+    logger.warning(
+        "Медленный запрос %s %s -> %s: %.1f ms, SQL: %s выражений, %.1f ms%s",
+        scope["method"], path, status_code, elapsed * 1000,
+        stats.sql_count, stats.sql_seconds * 1000, statements,
+    )
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Версионированные миграции схемы: migrations/NNNN_имя.py применяются по порядку, каждая один раз.
+
+Применённые версии хранятся в schema_version, поэтому запуск воркера с актуальной схемой
+стоит одного SELECT. Применяет миграции только один процесс (блокировка в schema_lock),
+остальные ждут его и продолжают с уже обновлённой схемой.
+
+Модуль миграции:
+    up()                  — изменения схемы; выполняются в одной транзакции (может отсутствовать,
+                            если миграция только переносит данные);
+    load(cursor)          — необязательно: перенос данных порциями. Читает и готовит следующую порцию
+                            без блокировки записи и возвращает (порция, новый курсор) или None,
+                            если переносить больше нечего; cursor — None при первом вызове;
+    apply(batch)          — записывает порцию; выполняется в одной транзакции с сохранением курсора,
+                            поэтому прерванный перенос продолжается с последней записанной порции;
+    finish()              — необязательно: после последней порции (например, DROP COLUMN).
+
+Переносы данных на сервере идут в фоне после запуска (init_database(background=True)),
+поэтому следующие миграции не должны зависеть от их завершения.
+
+Применить все миграции заранее (с переносом данных) или посмотреть состояние:
+    python migrate.py
+    python migrate.py status
+"""
+import importlib
+import json
+import logging
+import os
+import pkgutil
+import socket
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Tuple
+from peewee import OperationalError
+from database import database
+from config import MIGRATION_LOCK_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_PACKAGE = "migrations"
+
+_CREATE_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at REAL NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 1,
+    cursor TEXT
+)
+"""
+# Одна строка: кто применяет миграции и когда последний раз подтвердил, что жив
+_CREATE_LOCK_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_lock (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT NOT NULL,
+    heartbeat REAL NOT NULL
+)
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    module: ModuleType
+
+    @property
+    def has_data(self) -> bool:
+        return hasattr(self.module, "load")
+
+
+_migrations: Optional[List[Migration]] = None
+
+
+def discover() -> List[Migration]:
+    """Миграции из пакета migrations, по возрастанию номера"""
+    global _migrations
+    if _migrations is None:
+        package = importlib.import_module(MIGRATIONS_PACKAGE)
+        found = []
+        for info in pkgutil.iter_modules(package.__path__):
+            number, _, name = info.name.partition("_")
+            if number.isdigit():
+                module = importlib.import_module(f"{MIGRATIONS_PACKAGE}.{info.name}")
+                found.append(Migration(int(number), name, module))
+        found.sort(key=lambda m: m.version)
+        if len({m.version for m in found}) != len(found):
+            raise RuntimeError("Повторяющиеся номера миграций")
+        _migrations = found
+    return _migrations
+
+
+def column_names(table: str) -> set:
+    return {row[1] for row in database.execute_sql(f'PRAGMA table_info("{table}")').fetchall()}
+
+
+def add_column(table: str, column: str, definition: str):
+    """ALTER TABLE ADD COLUMN, если колонки ещё нет.
+
+    Новая база получает таблицы из моделей в 0001, то есть уже с колонкой, которую
+    добавляет более поздняя миграция; для старой базы колонка добавляется.
+    """
+    if column not in column_names(table):
+        database.execute_sql(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}')
+
+
+def _read_state() -> Optional[Tuple[int, int]]:
+    # Единственный запрос при запуске с актуальной схемой: (последняя версия, незавершённых переносов)
+    try:
+        return database.execute_sql(
+            "SELECT COALESCE(MAX(version), 0), COALESCE(SUM(completed = 0), 0) FROM schema_version"
+        ).fetchone()
+    except OperationalError:
+        return None  # таблицы ещё нет: база до появления миграций или пустая
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _is_busy(error: OperationalError) -> bool:
+    # Запись держит другой процесс дольше SQLITE_BUSY_TIMEOUT_MS (например, идёт долгая миграция)
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _create_tables():
+    while True:
+        try:
+            database.execute_sql(_CREATE_VERSION_TABLE)
+            database.execute_sql(_CREATE_LOCK_TABLE)
+            return
+        except OperationalError as e:
+            if not _is_busy(e):
+                raise
+            time.sleep(0.2)
+
+
+def _lock_owner() -> Optional[str]:
+    """Кто держит живую блокировку (чтение не ждёт записи в режиме WAL)"""
+    row = database.execute_sql("SELECT owner, heartbeat FROM schema_lock WHERE id = 1").fetchone()
+    if row is None or row[1] <= time.time() - MIGRATION_LOCK_TIMEOUT_SECONDS:
+        return None
+    return row[0]
+
+
+def _try_lock(owner: str) -> bool:
+    """Берёт блокировку короткой транзакцией; False — её держит другой процесс или база занята записью"""
+    try:
+        with database.atomic("IMMEDIATE"):
+            # Блокировка процесса, который давно не подавал признаков жизни, считается брошенной
+            holder = _lock_owner()
+            if holder is not None and holder != owner:
+                return False
+            database.execute_sql("INSERT OR REPLACE INTO schema_lock (id, owner, heartbeat) VALUES (1, ?, ?)",
+                                 (owner, time.time()))
+    except OperationalError as e:
+        if not _is_busy(e):
+            raise
+        return False
+    return True
+
+
+def _wait_lock(owner: str):
+    waited = False
+    while not _try_lock(owner):
+        if not waited:
+            logger.info("Миграции применяет другой процесс, ждём")
+            waited = True
+        time.sleep(0.2)
+
+
+def _heartbeat(owner: str):
+    database.execute_sql("UPDATE schema_lock SET heartbeat = ? WHERE owner = ?", (time.time(), owner))
+
+
+def _unlock(owner: str):
+    with database.atomic("IMMEDIATE"):
+        database.execute_sql("DELETE FROM schema_lock WHERE owner = ?", (owner,))
+
+
+def _applied() -> Dict[int, Tuple[bool, Any]]:
+    return {version: (bool(completed), json.loads(cursor) if cursor else None)
+            for version, completed, cursor
+            in database.execute_sql("SELECT version, completed, cursor FROM schema_version")}
+
+
+def _apply_schema(migration: Migration, owner: str):
+    started = time.perf_counter()
+    # Признак жизни — отдельной короткой транзакцией: пока идёт up(), запись занята и
+    # ожидающие процессы получают "database is locked", что для них значит "ждать дальше"
+    with database.atomic("IMMEDIATE"):
+        _heartbeat(owner)
+    # Сама миграция — одна транзакция: при ошибке схема не остаётся наполовину изменённой
+    with database.atomic("IMMEDIATE"):
+        if hasattr(migration.module, "up"):
+            migration.module.up()
+        database.execute_sql(
+            "INSERT INTO schema_version (version, name, applied_at, completed) VALUES (?, ?, ?, ?)",
+            (migration.version, migration.name, time.time(), 0 if migration.has_data else 1),
+        )
+    logger.info("Миграция %04d_%s применена за %.2f с", migration.version, migration.name,
+                time.perf_counter() - started)
+
+
+def _run_data(migration: Migration, cursor: Any, owner: str, stop: Optional[threading.Event] = None) -> bool:
+    """Переносит данные порциями; False — остановлено до конца (продолжится со следующего запуска)"""
+    module = migration.module
+    batches = 0
+    while stop is None or not stop.is_set():
+        loaded = module.load(cursor)
+        with database.atomic("IMMEDIATE"):
+            _heartbeat(owner)
+            if loaded is None:
+                if hasattr(module, "finish"):
+                    module.finish()
+                database.execute_sql("UPDATE schema_version SET completed = 1, cursor = NULL WHERE version = ?",
+                                     (migration.version,))
+                logger.info("Перенос данных %04d_%s завершён (%s порций)", migration.version, migration.name, batches)
+                return True
+            batch, cursor = loaded
+            module.apply(batch)
+            database.execute_sql("UPDATE schema_version SET cursor = ? WHERE version = ?",
+                                 (json.dumps(cursor), migration.version))
+        batches += 1
+    return False
+
+
+def _run_pending_data(owner: str, stop: Optional[threading.Event] = None) -> bool:
+    applied = _applied()
+    for migration in discover():
+        completed, cursor = applied.get(migration.version, (True, None))
+        if not completed and not _run_data(migration, cursor, owner, stop):
+            return False
+    return True
+
+
+def migrate(background: bool = False) -> int:
+    """Применяет недостающие миграции и возвращает их число.
+
+    background=True — переносы данных запускаются в фоновом потоке после возврата,
+    иначе выполняются здесь же.
+    """
+    migrations = discover()
+    latest = migrations[-1].version if migrations else 0
+    state = _read_state()
+    if state is not None and state[0] >= latest:
+        if state[1]:
+            _data_after_schema(background)
+        return 0
+
+    owner = _owner()
+    applied_count = 0
+    with database.connection_context():
+        _create_tables()
+        _wait_lock(owner)
+        try:
+            applied = _applied()
+            for migration in migrations:
+                if migration.version not in applied:
+                    _apply_schema(migration, owner)
+                    applied_count += 1
+            if not background:
+                _run_pending_data(owner)
+        finally:
+            _unlock(owner)
+    if background:
+        _data_after_schema(background)
+    return applied_count
+
+
+def _data_after_schema(background: bool):
+    if background:
+        start_background()
+        return
+    owner = _owner()
+    with database.connection_context():
+        _wait_lock(owner)
+        try:
+            _run_pending_data(owner)
+        finally:
+            _unlock(owner)
+
+
+_background: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def _background_worker():
+    owner = _owner()
+    try:
+        with database.connection_context():
+            # Переносом занимается один процесс; остальные воркеры просто обслуживают запросы
+            while not _try_lock(owner):
+                if _lock_owner() not in (None, owner):
+                    return
+                time.sleep(0.2)
+            try:
+                _run_pending_data(owner, _stop)
+            finally:
+                _unlock(owner)
+    except Exception:
+        logger.exception("Перенос данных прерван; продолжится при следующем запуске")
+
+
+def start_background():
+    global _background
+    if _background is None or not _background.is_alive():
+        _stop.clear()
+        _background = threading.Thread(target=_background_worker, name="data-migrations", daemon=True)
+        _background.start()
+
+
+def stop_background(timeout: float = 10.0):
+    """Останавливает фоновый перенос после текущей порции (курсор уже сохранён)"""
+    _stop.set()
+    if _background is not None:
+        _background.join(timeout)
+
+
+def status() -> List[dict]:
+    applied = {}
+    if _read_state() is not None:
+        applied = {row[0]: row[1:] for row in database.execute_sql(
+            "SELECT version, applied_at, completed, cursor FROM schema_version")}
+    result = []
+    for migration in discover():
+        applied_at, completed, cursor = applied.get(migration.version, (None, None, None))
+        result.append({
+            "version": migration.version,
+            "name": migration.name,
+            "applied_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(applied_at)) if applied_at else None,
+            "state": "не применена" if applied_at is None else ("применена" if completed else f"перенос данных: {cursor}"),
+        })
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if sys.argv[1:] == ["status"]:
+        for row in status():
+            print(f"{row['version']:04d}_{row['name']:<30} {row['state']:<20} {row['applied_at'] or ''}")
+    elif sys.argv[1:]:
+        sys.exit("использование: python migrate.py [status]")
+    else:
+        print(f"Применено миграций: {migrate()}")
@@ -0,0 +1,115 @@
+"""Схема на момент появления миграций.
+
+Базы, созданные раньше, могли остановиться на любом промежуточном состоянии, поэтому
+здесь собраны все прежние проверки PRAGMA и ALTER TABLE из init_database: для такой базы
+они выполняются один раз, новая база сразу получает таблицы из моделей.
+"""
+import logging
+from database import (
+    Blob, BlobVariant, Bookmark, CartItem, CatalogVersion, CollectionTombstone, CollectionVersion, Film, Role,
+    User, bump_catalog_version, bump_collection_version, database,
+)
+from migrate import add_column, column_names
+from money import parse_price
+from config import DEFAULT_CURRENCY
+
+logger = logging.getLogger(__name__)
+
+MODELS = [Role, User, Bookmark, CartItem, Film, Blob, BlobVariant, CatalogVersion, CollectionVersion,
+          CollectionTombstone]
+
+
+def _migrate_collections_to_films():
+    """Закладки и корзина ссылаются на film_list вместо копий title/author/price.
+
+    Старая таблица переименовывается, создаётся новая и строки переносятся по movie_id.
+    Строки с movie_id, которого нет в каталоге, не переносятся: они попадают в
+    collection_tombstones, чтобы клиенты с since= тоже их удалили.
+    """
+    for model, kind in ((Bookmark, "bookmarks"), (CartItem, "cart")):
+        table = model._meta.table_name
+        columns = column_names(table)
+        if 'movie_id' not in columns:
+            continue
+        legacy = f"{table}_legacy"
+        database.execute_sql(f"ALTER TABLE {table} RENAME TO {legacy}")
+        # Индексы переименованы вместе с таблицей, но их имена нужны новой таблице
+        for index in database.get_indexes(legacy):
+            database.execute_sql(f'DROP INDEX "{index.name}"')
+        database.create_tables([Film, model, CollectionVersion, CollectionTombstone], safe=True)
+        row_version = "version" if 'version' in columns else "0"
+        # CAST туда и обратно отсекает значения вроде "12abc"
+        database.execute_sql(
+            f"INSERT OR IGNORE INTO {table} (id, user_id, film_id, created_at, version) "
+            f"SELECT l.id, l.user_id, f.flim_id, l.created_at, {row_version} "
+            f"FROM {legacy} l JOIN film_list f ON f.flim_id = CAST(l.movie_id AS INTEGER) "
+            f"WHERE CAST(CAST(l.movie_id AS INTEGER) AS TEXT) = l.movie_id")
+        dropped = {}
+        for user_id, movie_id in database.execute_sql(
+                f"SELECT user_id, movie_id FROM {legacy} WHERE id NOT IN (SELECT id FROM {table})"):
+            dropped.setdefault(user_id, []).append(movie_id)
+        for user_id, movie_ids in dropped.items():
+            version = bump_collection_version(user_id, kind)
+            (CollectionTombstone
+             .insert_many([{"user": user_id, "kind": kind, "movie_id": movie_id, "version": version}
+                           for movie_id in movie_ids])
+             .on_conflict_replace()
+             .execute())
+        database.execute_sql(f"DROP TABLE {legacy}")
+
+
+def _migrate_film_prices(has_text_price: bool):
+    """Строковая цена фильма -> price_minor (копейки) и currency.
+
+    Нераспознанные цены ("договорная") становятся NULL и попадают в лог.
+    """
+    database.execute_sql("ALTER TABLE film_list ADD COLUMN price_minor INTEGER")
+    database.execute_sql(
+        f"ALTER TABLE film_list ADD COLUMN currency VARCHAR(3) NOT NULL DEFAULT '{DEFAULT_CURRENCY}'")
+    if not has_text_price:
+        return
+    updates, unparsed = [], []
+    for film_id, text in database.execute_sql("SELECT flim_id, price FROM film_list WHERE price IS NOT NULL"):
+        try:
+            updates.append((parse_price(text), film_id))
+        except ValueError:
+            unparsed.append(film_id)
+    database.cursor().executemany("UPDATE film_list SET price_minor = ? WHERE flim_id = ?", updates)
+    database.execute_sql("ALTER TABLE film_list DROP COLUMN price")
+    if unparsed:
+        logger.warning("Не удалось разобрать цену у %d фильмов: %s", len(unparsed), unparsed[:20])
+    if updates or unparsed:
+        bump_catalog_version()
+
+
+def up():
+    _migrate_collections_to_films()
+    # Пустое множество — новая база: film_list создаётся из модели целиком и догонять её не нужно
+    film_columns = column_names("film_list")
+    database.create_tables(MODELS, safe=True)
+
+    Role.insert_many([
+        {"name": "user", "description": "Обычный пользователь"},
+        {"name": "administrator", "description": "Администратор системы"},
+    ]).on_conflict_ignore().execute()
+    # Строка счётчика версии каталога
+    CatalogVersion.insert(id=1, version=0).on_conflict_ignore().execute()
+
+    add_column("users", "role_id", "INTEGER DEFAULT 1")
+    add_column("users", "avatar_hash", "VARCHAR(64)")
+    add_column("users", "avatar_thumb_hash", "VARCHAR(64)")
+
+    if film_columns:
+        add_column("film_list", "title-ru", "TEXT")
+        add_column("film_list", "poster_hash", "VARCHAR(64)")
+        add_column("film_list", "poster_thumb_hash", "VARCHAR(64)")
+        if 'price_minor' not in film_columns:
+            _migrate_film_prices('price' in film_columns)
+
+    # Размеры изображений в blobs
+    add_column("blobs", "width", "INTEGER")
+    add_column("blobs", "height", "INTEGER")
+
+    # Полнотекстовый поиск по каталогу (FTS5) и триггеры синхронизации
+    from search import create_search_index
+    create_search_index()
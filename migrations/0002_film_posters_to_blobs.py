@@ -0,0 +1,62 @@
+"""Постеры из колонки film_list.movie_base64 -> таблица blobs (film_list.poster_hash); колонка удаляется.
+
+Значения, которые не удаётся перенести (не base64 или не изображение, например путь
+images_for_movies/x.jpg), записываются в лог и очищаются: колонку нельзя удалить, пока
+в ней что-то осталось, а повторный запуск их всё равно не перенесёт.
+"""
+import logging
+from blobstore import decode_base64_image, store_blob
+import images
+from database import bump_catalog_version, database
+from migrate import column_names
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+
+
+def load(last_id):
+    """Следующая порция: [(flim_id, данные, MIME-тип)], курсор — последний просмотренный flim_id.
+
+    Для значения, которое не удалось перенести, данные и MIME-тип — None.
+    """
+    if last_id is None and 'movie_base64' not in column_names("film_list"):
+        return None
+    rows = database.execute_sql(
+        "SELECT flim_id, movie_base64 FROM film_list "
+        "WHERE movie_base64 IS NOT NULL AND flim_id > ? ORDER BY flim_id LIMIT ?",
+        (last_id or 0, BATCH_SIZE),
+    ).fetchall()
+    if not rows:
+        return None
+    posters = []
+    for film_id, payload in rows:
+        try:
+            posters.append((film_id, *decode_base64_image(payload, max_bytes=float("inf"))))
+        except ValueError as e:
+            logger.warning("Постер фильма %s не перенесён и удалён (%s): %.80s", film_id, e, payload)
+            posters.append((film_id, None, None))
+    return posters, rows[-1][0]
+
+
+def apply(posters):
+    for film_id, data, content_type in posters:
+        digest = store_blob(data, content_type) if data is not None else None
+        # Перенос идёт на работающем сервере: постер, загруженный за это время, не перезаписываем
+        database.execute_sql(
+            "UPDATE film_list SET poster_hash = COALESCE(poster_hash, ?), movie_base64 = NULL WHERE flim_id = ?",
+            (digest, film_id),
+        )
+    if posters:
+        bump_catalog_version()
+
+
+def finish():
+    # Все значения перенесены или очищены (см. apply), колонка больше не нужна
+    if 'movie_base64' in column_names("film_list"):
+        remaining = database.execute_sql("SELECT COUNT(*) FROM film_list WHERE movie_base64 IS NOT NULL").fetchone()[0]
+        if remaining:
+            raise RuntimeError(f"В film_list.movie_base64 осталось {remaining} неперенесённых постеров")
+        database.execute_sql("ALTER TABLE film_list DROP COLUMN movie_base64")
+    # Стартовая проверка постеров без миниатюр прошла до переноса: ставим их в очередь сейчас
+    images.schedule_missing_variants()
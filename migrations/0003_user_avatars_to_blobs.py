@@ -0,0 +1,49 @@
+"""Аватары из колонки users.avatar_base64 -> уменьшенные варианты в blobs; колонка удаляется"""
+import logging
+from avatars import render_stored_avatar, store_avatar
+from blobstore import decode_base64_image
+from database import database
+from migrate import column_names
+
+logger = logging.getLogger(__name__)
+
+# Каждый аватар декодируется и уменьшается: порции меньше, чем у постеров
+BATCH_SIZE = 20
+
+
+def load(last_id):
+    """Следующая порция: [(id пользователя, варианты или None)], курсор — последний просмотренный id"""
+    if 'avatar_base64' not in column_names("users"):
+        return None
+    rows = database.execute_sql(
+        "SELECT id, avatar_base64 FROM users WHERE avatar_base64 IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+        (last_id or 0, BATCH_SIZE),
+    ).fetchall()
+    if not rows:
+        return None
+    avatars = []
+    for user_id, payload in rows:
+        # Уменьшение — до транзакции: блокировка записи не держится, пока работает Pillow
+        try:
+            data, _ = decode_base64_image(payload, max_bytes=float("inf"))
+            avatars.append((user_id, render_stored_avatar(data)))
+        except ValueError:
+            logger.warning("Не удалось перенести аватар пользователя %s", user_id)
+            avatars.append((user_id, None))
+    return avatars, rows[-1][0]
+
+
+def apply(avatars):
+    for user_id, variants in avatars:
+        # Пользователь мог загрузить новый аватар, пока шёл перенос: его не перезаписываем
+        current = database.execute_sql("SELECT avatar_hash FROM users WHERE id = ?", (user_id,)).fetchone()
+        if variants is not None and current is not None and current[0] is None:
+            large, thumb = store_avatar(variants)
+            database.execute_sql("UPDATE users SET avatar_hash = ?, avatar_thumb_hash = ? WHERE id = ?",
+                                 (large, thumb, user_id))
+        database.execute_sql("UPDATE users SET avatar_base64 = NULL WHERE id = ?", (user_id,))
+
+
+def finish():
+    if 'avatar_base64' in column_names("users"):
+        database.execute_sql("ALTER TABLE users DROP COLUMN avatar_base64")
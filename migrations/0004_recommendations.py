@@ -0,0 +1,9 @@
+"""Таблицы рекомендаций: счётчики совместных закладок и корзин и готовые списки (recommendations.py).
+
+Сами счётчики заполняет первый прогон recommendations.refresh(), а не миграция.
+"""
+from database import FilmAudience, FilmPair, RecommendationList, RecommendationUser, database
+
+
+def up():
+    database.create_tables([FilmAudience, FilmPair, RecommendationUser, RecommendationList], safe=True)
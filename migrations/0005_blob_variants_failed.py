@@ -0,0 +1,6 @@
+"""Отметка постеров, которые не удалось декодировать (images.schedule_missing_variants их пропускает)."""
+from migrate import add_column
+
+
+def up():
+    add_column("blobs", "variants_failed", "INTEGER NOT NULL DEFAULT 0")
@@ -0,0 +1,13 @@
+"""Время удаления в collection_tombstones и граница удалённых отметок в collection_versions."""
+import time
+from database import database
+from migrate import add_column
+
+
+def up():
+    add_column("collection_tombstones", "deleted_at", "REAL")
+    # Время старых отметок неизвестно: срок хранения отсчитывается от миграции
+    database.execute_sql("UPDATE collection_tombstones SET deleted_at = ? WHERE deleted_at IS NULL", (time.time(),))
+    database.execute_sql("CREATE INDEX IF NOT EXISTS collectiontombstone_deleted_at "
+                         "ON collection_tombstones (deleted_at)")
+    add_column("collection_versions", "pruned_version", "INTEGER NOT NULL DEFAULT 0")
@@ -0,0 +1,6 @@
+"""Аренда фонового пересчёта рекомендаций: пересчитывает один воркер, а не каждый."""
+from database import RecommendationLease, database
+
+
+def up():
+    database.create_tables([RecommendationLease], safe=True)
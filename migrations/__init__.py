@@ -0,0 +1 @@
+"""Миграции схемы: NNNN_имя.py, применяются по номеру (см. migrate.py)"""
@@ -0,0 +1,40 @@
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Optional, Union
+
+# Цены хранятся целыми числами в минимальных единицах валюты (копейки, центы)
+MINOR_UNITS = 100
+
+CURRENCY_PATTERN = "^[A-Z]{3}$"  # ISO 4217: RUB, USD, EUR
+
+# Всё, кроме цифр и разделителей: пробелы тысяч, "₽", "руб."
+_NOISE_RE = re.compile(r"[^\d.,\-]")
+
+
+def parse_price(value: Union[str, int, float, None]) -> Optional[int]:
+    """Цена в основных единицах ("299", "1 299,50 ₽", 299.5) -> минимальные единицы.
+
+    Пустое значение — None; нераспознанная или отрицательная цена — ValueError.
+    """
+    if value is None:
+        return None
+    text = _NOISE_RE.sub("", str(value)).replace(",", ".")
+    if text in ("", "."):
+        if str(value).strip() == "":
+            return None
+        raise ValueError(f"Некорректная цена: {value}")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Некорректная цена: {value}")
+    if amount < 0:
+        raise ValueError(f"Цена не может быть отрицательной: {value}")
+    return int((amount * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_price(minor: Optional[int]) -> Optional[str]:
+    """Минимальные единицы -> строка для отображения: 29900 -> "299", 29950 -> "299.50" """
+    if minor is None:
+        return None
+    major, rest = divmod(minor, MINOR_UNITS)
+    return str(major) if rest == 0 else f"{major}.{rest:02d}"
@@ -0,0 +1,106 @@
+import base64
+import json
+from typing import List, Optional, Sequence, Tuple
+from peewee import Tuple as RowValue
+from database import Film, media_url
+from money import format_price
+from schemas import FilmResponse
+
+# Разрешённые порядки сортировки: имя параметра -> (поле, по убыванию)
+FILM_SORTS = {
+    "flim_id": (Film.flim_id, False),
+    "-flim_id": (Film.flim_id, True),
+    "title": (Film.title, False),
+    "-title": (Film.title, True),
+}
+
+# Поля, которые можно запросить через fields=
+FILM_FIELDS = tuple(FilmResponse.model_fields)
+
+# poster_url вычисляется из миниатюры или оригинала постера, price — из price_minor,
+# остальные поля совпадают с колонками
+_COMPUTED_COLUMNS = {
+    "poster_url": (Film.poster_thumb_hash, Film.poster_hash),
+    "price": (Film.price_minor,),
+}
+_FIELD_COLUMNS = {name: _COMPUTED_COLUMNS.get(name) or (getattr(Film, name),) for name in FILM_FIELDS}
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, film_id: int) -> str:
+    raw = json.dumps([sort_value, film_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, film_id = json.loads(raw)
+        return sort_value, int(film_id)
+    except (ValueError, TypeError):
+        raise PaginationError("Некорректный курсор")
+
+
+def parse_fields(fields: Optional[str]) -> Sequence[str]:
+    """Разбирает fields=title,poster_url; пустое значение — все поля"""
+    if not fields:
+        return FILM_FIELDS
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [n for n in names if n not in FILM_FIELDS]
+    if unknown:
+        raise PaginationError(f"Неизвестные поля: {', '.join(unknown)}")
+    return names
+
+
+def film_page(
+    query,
+    sort: str = "flim_id",
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    fields: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Возвращает страницу фильмов по keyset-курсору и курсор следующей страницы.
+
+    query — Film.select() с уже наложенными фильтрами (например, по жанру).
+    Курсор хранит значение ключа сортировки и flim_id последней строки,
+    поэтому каждая страница — это индексный поиск, а не OFFSET.
+    """
+    if sort not in FILM_SORTS:
+        raise PaginationError(f"Недопустимая сортировка: {sort}")
+    names = parse_fields(fields)
+    sort_field, descending = FILM_SORTS[sort]
+
+    columns = {Film.flim_id, sort_field} | {c for n in names for c in _FIELD_COLUMNS[n]}
+    query = query.select(*columns)
+
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        if sort_field is Film.flim_id:
+            query = query.where(Film.flim_id < last_id if descending else Film.flim_id > last_id)
+        else:
+            key = RowValue(sort_field, Film.flim_id)
+            query = query.where(key < (sort_value, last_id) if descending else key > (sort_value, last_id))
+
+    if sort_field is Film.flim_id:
+        order = [Film.flim_id.desc() if descending else Film.flim_id]
+    else:
+        order = [sort_field.desc(), Film.flim_id.desc()] if descending else [sort_field, Film.flim_id]
+    rows = list(query.order_by(*order).limit(limit + 1).dicts())
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[sort_field.name], last["flim_id"])
+
+    page = []
+    for row in rows:
+        if "poster_url" in names:
+            row["poster_url"] = media_url(row.get("poster_thumb_hash") or row.get("poster_hash"))
+        if "price" in names:
+            row["price"] = format_price(row.get("price_minor"))
+        page.append({n: row[n] for n in names})
+    return page, next_cursor
@@ -0,0 +1,104 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_ROUNDS
+
+# pbkdf2_sha256 — кроссплатформенно и без ограничения bcrypt в 72 байта.
+# min/max = default: хеш с другим числом итераций считается устаревшим и пересчитывается при входе
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__max_rounds=PASSWORD_HASH_ROUNDS,
+)
+
+
+class PasswordHashBusy(RuntimeError):
+    """Все процессы хеширования заняты и очередь заполнена"""
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+# Места в пуле: выполняющиеся и ожидающие хеши. Без свободного места запрос отклоняется сразу,
+# а не ждёт в очереди, которая при волне логинов растёт без предела
+_slots = threading.BoundedSemaphore(max(PASSWORD_HASH_WORKERS, 1) + PASSWORD_HASH_QUEUE)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+def _noop():
+    return None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # spawn, а не fork — процесс API многопоточный (как и пул обработки изображений)
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+
+def _run(func, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return func(*args)
+    if not _slots.acquire(blocking=False):
+        raise PasswordHashBusy("Очередь хеширования паролей заполнена")
+    try:
+        for attempt in range(2):
+            pool = _get_pool()
+            try:
+                return pool.submit(func, *args).result()
+            except BrokenProcessPool:
+                # Процесс пула упал (например, OOM): пересоздаём пул и пробуем ещё раз
+                _reset_pool(pool)
+                if attempt:
+                    raise
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    """Хеш пароля с текущей стоимостью; PasswordHashBusy — пул перегружен"""
+    return _run(_hash, password)
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Проверяет пароль; при совпадении с устаревшим хешем возвращает и новый хеш (иначе None)"""
+    return _run(_verify_and_update, password, hashed)
+
+
+def start():
+    """Запускает процессы пула заранее, чтобы первые входы не ждали их старта"""
+    if PASSWORD_HASH_WORKERS > 0:
+        pool = _get_pool()
+        for _ in range(PASSWORD_HASH_WORKERS):
+            pool.submit(_noop)
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        # Ждём процессы пула (хеш считается миллисекунды): с wait=False воркер uvicorn
+        # может зависнуть на выходе интерпретатора, не дождавшись их остановки
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Рекомендации: похожие фильмы и популярные фильмы по жанрам из закладок и корзин.
+
+Сигнал — фильм в закладках или корзине пользователя. Счётчики хранятся в базе:
+    film_audience — сколько пользователей держат фильм;
+    film_pairs    — сколько пользователей держат оба фильма (пара записана в обе стороны).
+Похожесть — косинусная: pairs(a, b) / sqrt(audience(a) · audience(b)).
+
+Пересчёт инкрементальный. Для пользователей, у которых версия закладок или корзины
+изменилась с прошлого прогона, из счётчиков вычитается вклад учтённого набора фильмов
+(recommendation_users) и прибавляется вклад текущего: X_new^T·X_new − X_old^T·X_old
+по матрицам "пользователь × фильм" только этих пользователей. Затем готовые списки
+(recommendation_lists) пересчитываются лишь для затронутых фильмов. Эндпоинты читают
+готовый список одной строкой по ключу.
+
+В фоне пересчитывает один процесс из всех воркеров (аренда в recommendation_lease);
+остальные читают его результат из recommendation_lists.
+
+Пересчитать вручную (rebuild — с нуля):
+    python recommendations.py
+    python recommendations.py rebuild
+"""
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from heapq import nlargest
+from itertools import combinations
+from math import sqrt
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from peewee import OperationalError
+from database import (
+    FilmAudience, FilmPair, RecommendationLease, RecommendationList, RecommendationUser, database,
+)
+from streaming import batched
+from config import RECOMMENDATIONS_TOP_N, RECOMMENDATIONS_BATCH_USERS, RECOMMENDATIONS_INTERVAL_SECONDS
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # numpy и scipy есть в requirements.txt; без них счётчики считаются на чистом Python
+    np = sparse = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько id подставляется в один запрос IN (...)
+_IN_CHUNK = 500
+
+
+def similar_key(film_id: int) -> str:
+    return f"similar:{film_id}"
+
+
+def popular_key(genre: Optional[str] = None) -> str:
+    return f"popular:{genre}" if genre else "popular"
+
+
+def recommended_ids(key: str) -> Tuple[List[int], int]:
+    """Готовый список по ключу и время его расчёта (0 — списка нет)"""
+    row = (RecommendationList
+           .select(RecommendationList.film_ids, RecommendationList.computed_at)
+           .where(RecommendationList.key == key)
+           .tuples()
+           .first())
+    return (json.loads(row[0]), row[1]) if row else ([], 0)
+
+
+# --- Изменение счётчиков ---
+
+def _cooccurrence_delta(old: Dict[int, Set[int]], new: Dict[int, Set[int]]):
+    """Изменение счётчиков при замене наборов фильмов old -> new (ключ — пользователь).
+
+    Возвращает ({фильм: Δaudience}, {(a, b): Δpairs} с a < b), без нулевых значений.
+    """
+    if sparse is not None:
+        return _cooccurrence_delta_sparse(old, new)
+    audience, pairs = Counter(), Counter()
+    for sets, sign in ((old, -1), (new, 1)):
+        for films in sets.values():
+            for film in films:
+                audience[film] += sign
+            for pair in combinations(sorted(films), 2):
+                pairs[pair] += sign
+    return ({f: n for f, n in audience.items() if n}, {p: n for p, n in pairs.items() if n})
+
+
+def _cooccurrence_delta_sparse(old, new):
+    films = np.array(sorted(set().union(*old.values(), *new.values())), dtype=np.int64)
+    if not len(films):
+        return {}, {}
+
+    def matrix(sets):
+        lengths = [len(s) for s in sets.values()]
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        cols = np.searchsorted(films, np.fromiter((f for s in sets.values() for f in s), np.int64, sum(lengths)))
+        return sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)),
+                                 shape=(len(lengths), len(films)))
+
+    x_new, x_old = matrix(new), matrix(old)
+    # X^T·X: на диагонали — число пользователей фильма, вне её — число пользователей пары
+    delta = (x_new.T @ x_new - x_old.T @ x_old).tocoo()
+    changed = delta.data != 0
+    rows, cols, values = delta.row[changed], delta.col[changed], delta.data[changed]
+    diagonal, upper = rows == cols, rows < cols
+    audience = dict(zip(films[rows[diagonal]].tolist(), values[diagonal].tolist()))
+    pairs = dict(zip(zip(films[rows[upper]].tolist(), films[cols[upper]].tolist()), values[upper].tolist()))
+    return audience, pairs
+
+
+def _apply_delta(audience: Dict[int, int], pairs: Dict[Tuple[int, int], int]):
+    cursor = database.cursor()
+    cursor.executemany(
+        "INSERT INTO film_audience (film_id, users) VALUES (?, ?) "
+        "ON CONFLICT(film_id) DO UPDATE SET users = users + excluded.users",
+        audience.items())
+    both_ways = [(a, b, n) for (a, b), n in pairs.items()] + [(b, a, n) for (a, b), n in pairs.items()]
+    cursor.executemany(
+        "INSERT INTO film_pairs (film_a, film_b, users) VALUES (?, ?, ?) "
+        "ON CONFLICT(film_a, film_b) DO UPDATE SET users = users + excluded.users",
+        both_ways)
+    # Счётчики, дошедшие до нуля, удаляются: таблицы растут только с реальными парами
+    cursor.executemany("DELETE FROM film_audience WHERE film_id = ? AND users <= 0",
+                       [(f,) for f, n in audience.items() if n < 0])
+    cursor.executemany("DELETE FROM film_pairs WHERE film_a = ? AND film_b = ? AND users <= 0",
+                       [(a, b) for a, b, n in both_ways if n < 0])
+
+
+# --- Пользователи, чьи коллекции изменились ---
+
+def _in_query(sql: str, ids: Iterable[int]) -> list:
+    """sql с одним "{}" на месте списка параметров IN; ids подставляются порциями"""
+    rows = []
+    for chunk in batched(ids, _IN_CHUNK):
+        rows.extend(database.execute_sql(sql.format(", ".join("?" * len(chunk))), chunk).fetchall())
+    return rows
+
+
+def _versions(rows) -> Dict[int, Tuple[int, int]]:
+    versions = {}
+    for user_id, kind, version in rows:
+        bookmarks, cart = versions.get(user_id, (0, 0))
+        versions[user_id] = (version, cart) if kind == "bookmarks" else (bookmarks, version)
+    return versions
+
+
+def _dirty_users() -> List[int]:
+    current = _versions(database.execute_sql("SELECT user_id, kind, version FROM collection_versions"))
+    recorded = {user_id: (b, c) for user_id, b, c in database.execute_sql(
+        "SELECT user_id, bookmarks_version, cart_version FROM recommendation_users")}
+    if not recorded:
+        # Первый прогон: строки коллекций из старых баз и сидов могут быть без версии
+        for (user_id,) in database.execute_sql("SELECT user_id FROM bookmarks UNION SELECT user_id FROM cart_items"):
+            current.setdefault(user_id, (0, 0))
+    dirty = {user_id for user_id, versions in current.items() if recorded.get(user_id) != versions}
+    # Удалённые пользователи: версий у них уже нет, а вклад в счётчиках остался
+    dirty.update(user_id for (user_id,) in database.execute_sql(
+        "SELECT user_id FROM recommendation_users WHERE user_id NOT IN (SELECT id FROM users)"))
+    return sorted(dirty)
+
+
+def _read_batch(users: List[int]):
+    """Учтённые и текущие наборы фильмов пользователей с версиями (в одной транзакции чтения)"""
+    with database.atomic():
+        recorded = {user_id: ((b, c), set(json.loads(films))) for user_id, b, c, films in _in_query(
+            "SELECT user_id, bookmarks_version, cart_version, films FROM recommendation_users "
+            "WHERE user_id IN ({})", users)}
+        versions = _versions(_in_query(
+            "SELECT user_id, kind, version FROM collection_versions WHERE user_id IN ({})", users))
+        current = defaultdict(set)
+        for table in ("bookmarks", "cart_items"):
+            for user_id, film_id in _in_query(
+                    f"SELECT user_id, film_id FROM {table} WHERE user_id IN ({{}})", users):
+                current[user_id].add(film_id)
+    return recorded, versions, current
+
+
+def _process_batch(users: List[int]) -> Optional[Tuple[Set[int], Set[int]]]:
+    """Учитывает изменения пользователей; возвращает (фильмы с изменённой аудиторией, фильмы из изменённых пар).
+
+    None — этих пользователей за время расчёта уже учёл другой процесс.
+    """
+    recorded, versions, current = _read_batch(users)
+    audience, pairs = _cooccurrence_delta({u: films for u, (_, films) in recorded.items()}, current)
+    # Строка остаётся, пока у пользователя есть версии коллекций или фильмы в них
+    keep = [(u, *versions.get(u, (0, 0)), json.dumps(sorted(current[u])))
+            for u in users if u in versions or current.get(u)]
+    gone = [(u,) for u in users if not (u in versions or current.get(u))]
+    with database.atomic("IMMEDIATE"):
+        seen = {user_id: (b, c) for user_id, b, c in _in_query(
+            "SELECT user_id, bookmarks_version, cart_version FROM recommendation_users WHERE user_id IN ({})", users)}
+        # Учтённый набор сменился, пока мы считали: вычитать старый ещё раз нельзя, подберём на следующем прогоне
+        if seen != {u: v for u, (v, _) in recorded.items()}:
+            return None
+        _apply_delta(audience, pairs)
+        cursor = database.cursor()
+        cursor.executemany("INSERT OR REPLACE INTO recommendation_users "
+                           "(user_id, bookmarks_version, cart_version, films) VALUES (?, ?, ?, ?)", keep)
+        cursor.executemany("DELETE FROM recommendation_users WHERE user_id = ?", gone)
+    return set(audience), {film for pair in pairs for film in pair}
+
+
+# --- Готовые списки ---
+
+def _similar_lists(films: List[int], audience: Dict[int, int]) -> Dict[int, List[int]]:
+    """Топ похожих для каждого фильма: по убыванию косинусной похожести, при равенстве — по flim_id"""
+    rows = _in_query("SELECT film_a, film_b, users FROM film_pairs WHERE film_a IN ({})", films)
+    lists = {film: [] for film in films}
+    if np is not None and rows:
+        data = np.array(rows, dtype=np.int64)
+        # Аудитория по flim_id одним массивом: без JOIN на каждую строку пары
+        sizes = np.zeros(max(audience) + 1, dtype=np.int64)
+        sizes[np.fromiter(audience.keys(), np.int64, len(audience))] = np.fromiter(audience.values(), np.int64, len(audience))
+        score = data[:, 2] / np.sqrt(sizes[data[:, 0]] * sizes[data[:, 1]])
+        order = np.lexsort((data[:, 1], -score, data[:, 0]))
+        film_a, film_b = data[order, 0], data[order, 1]
+        # Место строки внутри своего фильма: первые TOP_N и есть список
+        starts = np.flatnonzero(np.r_[True, film_a[1:] != film_a[:-1]])
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        top = rank < RECOMMENDATIONS_TOP_N
+        for film, similar in zip(film_a[top].tolist(), film_b[top].tolist()):
+            lists[film].append(similar)
+    else:
+        scored = defaultdict(list)
+        for film_a, film_b, users in rows:
+            scored[film_a].append((users / sqrt(audience[film_a] * audience[film_b]), -film_b))
+        for film, candidates in scored.items():
+            lists[film] = [-film_b for _, film_b in nlargest(RECOMMENDATIONS_TOP_N, candidates)]
+    return lists
+
+
+def _popular_lists() -> Dict[str, List[int]]:
+    """Популярные по числу пользователей: общий список и по жанрам за один проход по film_audience"""
+    lists = {popular_key(): []}
+    for genre, position, film_id in database.execute_sql(
+            'SELECT genre, position, film_id FROM ('
+            'SELECT f."genre-title" AS genre, a.film_id, '
+            'ROW_NUMBER() OVER (PARTITION BY f."genre-title" ORDER BY a.users DESC, a.film_id) AS position, '
+            'ROW_NUMBER() OVER (ORDER BY a.users DESC, a.film_id) AS overall '
+            'FROM film_audience a JOIN film_list f ON f.flim_id = a.film_id) '
+            'WHERE position <= ?1 OR overall <= ?1 ORDER BY overall', (RECOMMENDATIONS_TOP_N,)):
+        if len(lists[popular_key()]) < RECOMMENDATIONS_TOP_N:
+            lists[popular_key()].append(film_id)
+        if position <= RECOMMENDATIONS_TOP_N:
+            lists.setdefault(popular_key(genre), []).append(film_id)
+    return lists
+
+
+def _save_lists(lists: Dict[str, List[int]]):
+    computed_at = int(time.time() * 1000)
+    cursor = database.cursor()
+    cursor.executemany("INSERT OR REPLACE INTO recommendation_lists (key, film_ids, computed_at) VALUES (?, ?, ?)",
+                       [(key, json.dumps(ids), computed_at) for key, ids in lists.items() if ids])
+    cursor.executemany("DELETE FROM recommendation_lists WHERE key = ?", [(key,) for key, ids in lists.items() if not ids])
+
+
+def _refresh_lists(audience_changed: Set[int], pair_films: Set[int]) -> int:
+    """Пересчитывает списки похожих для затронутых фильмов и, если аудитория менялась, списки популярных"""
+    films = pair_films | audience_changed
+    # Изменилась аудитория фильма — изменилась его похожесть со всеми соседями
+    films.update(film for (film,) in _in_query(
+        "SELECT film_b FROM film_pairs WHERE film_a IN ({})", sorted(audience_changed)))
+    audience = dict(database.execute_sql("SELECT film_id, users FROM film_audience"))
+    for chunk in batched(sorted(films), _IN_CHUNK):
+        with database.atomic():
+            lists = {similar_key(film): ids for film, ids in _similar_lists(chunk, audience).items()}
+        with database.atomic("IMMEDIATE"):
+            _save_lists(lists)
+    if audience_changed:
+        with database.atomic():
+            popular = _popular_lists()
+        with database.atomic("IMMEDIATE"):
+            # Жанры, в которых больше нет популярных фильмов, тоже убираются
+            database.execute_sql("DELETE FROM recommendation_lists WHERE key GLOB 'popular*'")
+            _save_lists(popular)
+    return len(films)
+
+
+_refresh_lock = threading.Lock()
+
+
+def refresh(rebuild: bool = False) -> dict:
+    """Учитывает изменившиеся коллекции и пересчитывает затронутые списки; возвращает статистику прогона.
+
+    rebuild=True — счётчики и списки строятся заново по всем пользователям.
+    """
+    started = time.perf_counter()
+    with _refresh_lock, database.connection_context():
+        if rebuild:
+            with database.atomic("IMMEDIATE"):
+                for model in (FilmAudience, FilmPair, RecommendationUser, RecommendationList):
+                    model.delete().execute()
+        with database.atomic():
+            users = _dirty_users()
+        audience_changed, pair_films, skipped = set(), set(), 0
+        for batch in batched(users, RECOMMENDATIONS_BATCH_USERS):
+            changed = _process_batch(batch)
+            if changed is None:
+                skipped += len(batch)
+                continue
+            audience_changed |= changed[0]
+            pair_films |= changed[1]
+        films = _refresh_lists(audience_changed, pair_films)
+    stats = {"users": len(users) - skipped, "skipped": skipped, "similar_lists": films,
+             "popular": bool(audience_changed), "seconds": round(time.perf_counter() - started, 3)}
+    if users:
+        logger.info("Рекомендации пересчитаны: %s", stats)
+    return stats
+
+
+_background: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+# Аренда продлевается перед каждым прогоном; процесс, не продлевавший её столько времени,
+# считается остановленным, и пересчёт забирает другой воркер
+_LEASE_SECONDS = max(60.0, 3 * RECOMMENDATIONS_INTERVAL_SECONDS)
+
+
+def _take_lease(owner: str) -> bool:
+    """Берёт или продлевает аренду пересчёта; False — пересчитывает другой процесс (или база занята)"""
+    now = time.time()
+    try:
+        with database.connection_context(), database.atomic("IMMEDIATE"):
+            row = (RecommendationLease
+                   .select(RecommendationLease.owner, RecommendationLease.heartbeat)
+                   .where(RecommendationLease.id == 1)
+                   .tuples()
+                   .first())
+            if row is not None and row[0] != owner and row[1] > now - _LEASE_SECONDS:
+                return False
+            RecommendationLease.insert(id=1, owner=owner, heartbeat=now).on_conflict_replace().execute()
+    except OperationalError:
+        return False
+    return True
+
+
+def _release_lease(owner: str):
+    with database.connection_context(), database.atomic("IMMEDIATE"):
+        RecommendationLease.delete().where(RecommendationLease.owner == owner).execute()
+
+
+def _background_worker():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        while not _stop.is_set():
+            try:
+                if _take_lease(owner):
+                    refresh()
+            except Exception:
+                logger.exception("Не удалось пересчитать рекомендации")
+            _stop.wait(RECOMMENDATIONS_INTERVAL_SECONDS)
+    finally:
+        try:
+            _release_lease(owner)
+        except Exception:
+            logger.exception("Не удалось освободить аренду пересчёта рекомендаций")
+
+
+def start_background():
+    """Пересчёт сразу и затем раз в RECOMMENDATIONS_INTERVAL_SECONDS (0 — не запускать).
+
+    Поток запускается в каждом воркере, но пересчитывает только владелец аренды.
+    """
+    global _background
+    if RECOMMENDATIONS_INTERVAL_SECONDS > 0 and (_background is None or not _background.is_alive()):
+        _stop.clear()
+        _background = threading.Thread(target=_background_worker, name="recommendations", daemon=True)
+        _background.start()
+
+
+def stop_background(timeout: float = 10.0):
+    _stop.set()
+    if _background is not None:
+        _background.join(timeout)
+
+
+if __name__ == "__main__":
+    from database import init_database
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if sys.argv[1:] not in ([], ["rebuild"]):
+        sys.exit("использование: python recommendations.py [rebuild]")
+    init_database()
+    print(json.dumps(refresh(rebuild=sys.argv[1:] == ["rebuild"]), ensure_ascii=False))
@@ -0,0 +1,57 @@
+"""Отчёты для администраторов: агрегаты считаются одним SQL-запросом, без перебора строк в Python."""
+from typing import Dict, List, Optional
+from peewee import JOIN, SQL, fn
+from database import Bookmark, CartItem, Film
+
+
+def _counts_by_film(model, alias: str):
+    return (model
+            .select(model.film.alias("film_id"), fn.COUNT(model.id).alias("n"))
+            .group_by(model.film)
+            .alias(alias))
+
+
+def film_popularity(limit: int, genre: Optional[str] = None) -> List[dict]:
+    """Фильмы, которые чаще всего добавляют в закладки и корзину.
+
+    cart_value_minor — стоимость фильма во всех корзинах (цена × число корзин).
+    """
+    bookmarks = _counts_by_film(Bookmark, "b")
+    carts = _counts_by_film(CartItem, "c")
+    bookmarked = fn.COALESCE(bookmarks.c.n, 0)
+    in_cart = fn.COALESCE(carts.c.n, 0)
+    query = (Film
+             .select(Film.flim_id, Film.title, Film.genre_title, Film.price_minor, Film.currency,
+                     bookmarked.alias("bookmarks"), in_cart.alias("in_cart"),
+                     (Film.price_minor * in_cart).alias("cart_value_minor"))
+             .join(bookmarks, JOIN.LEFT_OUTER, on=(bookmarks.c.film_id == Film.flim_id))
+             .switch(Film)
+             .join(carts, JOIN.LEFT_OUTER, on=(carts.c.film_id == Film.flim_id))
+             .where(bookmarks.c.n.is_null(False) | carts.c.n.is_null(False)))
+    if genre:
+        query = query.where(Film.genre_title == genre.lower())
+    return list(query.order_by((bookmarked + in_cart).desc(), Film.flim_id).limit(limit).dicts())
+
+
+def cart_value() -> Dict[str, List[dict]]:
+    """Стоимость фильмов в корзинах по жанрам и валютам.
+
+    Заказов в системе нет, поэтому "выручка" — это сумма, которую принесли бы
+    текущие корзины. Фильмы без цены учитываются только в items.
+    """
+    by_genre = list(CartItem
+                    .select(Film.genre_title, Film.currency,
+                            fn.COUNT(CartItem.id).alias("items"),
+                            fn.COUNT(fn.DISTINCT(CartItem.user)).alias("users"),
+                            fn.COALESCE(fn.SUM(Film.price_minor), 0).alias("total_minor"))
+                    .join(Film, on=(CartItem.film == Film.flim_id))
+                    .group_by(Film.genre_title, Film.currency)
+                    .order_by(SQL("total_minor").desc(), Film.genre_title)
+                    .dicts())
+    # Итог по валютам складывается из уже сгруппированных строк (их не больше жанров × валют)
+    totals: Dict[str, dict] = {}
+    for row in by_genre:
+        total = totals.setdefault(row["currency"], {"currency": row["currency"], "items": 0, "total_minor": 0})
+        total["items"] += row["items"]
+        total["total_minor"] += row["total_minor"]
+    return {"totals": list(totals.values()), "by_genre": by_genre}
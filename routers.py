@@ -1,21 +1,66 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+import zipfile
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Path, Query, UploadFile, File
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from database import User, Bookmark, CartItem, database, Film, Role
-from schemas import UserCreate, UserResponse, Token, UserLogin, AvatarUpdate
+from database import (
+    User, database, Film, Role, Blob, bump_catalog_version, get_collection_version, media_url,
+)
+from blobstore import decode_base64_image, store_blob, get_blob, delete_blob_if_unused, IMAGE_CONTENT_TYPES
+from images import thumb_digest, schedule_poster_variants, poster_variants
+from avatars import set_user_avatar, set_user_avatar_base64, clear_user_avatar
+from user_collections import (
+    changes_since, get_item, forget_film, cart_summary, collection_ids, UnknownFilmError,
+)
+import collection_cache
+from reports import film_popularity, cart_value
+from bulk import read_manifest, import_films, zip_loader, export_with_inline_posters
+from catalog_cache import catalog, dump_films
+from fastjson import dumps, JSON_MEDIA_TYPE
+from pagination import film_page, parse_fields, PaginationError, FILM_SORTS
+from search import search_film_ids
+from recommendations import recommended_ids, similar_key, popular_key
+from streaming import iter_film_batches, batched, ndjson_stream, json_array_stream, NDJSON_MEDIA_TYPE
+from etags import (
+    make_etag, request_variant, conditional_response,
+    CATALOG_CACHE_CONTROL, USER_CACHE_CONTROL, NO_STORE,
+)
+from schemas import (
+    UserCreate, UserResponse, Token, UserLogin, AvatarUpdate, FilmResponse, FilmDetailResponse, PosterVariant,
+    BulkImportResponse, CartSummary, FilmPopularity, CartValueReport, BootstrapResponse,
+)
 from auth import (
     authenticate_user, 
     create_access_token, 
     get_password_hash, 
-    get_current_active_user
+    get_current_active_user,
+    get_optional_user,
+    invalidate_user_cache,
+    check_login_attempt,
+    check_registration_attempt,
+)
+from config import (
+    ACCESS_TOKEN_EXPIRE_MINUTES, RANDOM_FILMS_MAX, FILMS_PAGE_DEFAULT, FILMS_PAGE_MAX, EXPORT_BATCH_SIZE,
+    DEFAULT_CURRENCY, AVATAR_MAX_BYTES, RECOMMENDATIONS_TOP_N, TRUSTED_PROXY_HOPS,
 )
-from config import ACCESS_TOKEN_EXPIRE_MINUTES
+from money import parse_price, CURRENCY_PATTERN
 
 router = APIRouter()
 
+def _client_ip(request: Request) -> str:
+    """Адрес клиента; за TRUSTED_PROXY_HOPS прокси — из X-Forwarded-For (левее — что прислал сам клиент)"""
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [addr.strip() for header in request.headers.getlist("x-forwarded-for")
+                     for addr in header.split(",") if addr.strip()]
+        if forwarded:
+            return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return request.client.host if request.client else "unknown"
+
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate):
+def register(user_data: UserCreate, request: Request):
     """Регистрация нового пользователя"""
+    # Регистрация тоже считает хеш: у неё свой лимит по адресу
+    check_registration_attempt(_client_ip(request))
     try:
         # Проверяем, существует ли пользователь с таким username
         existing_user = User.get_or_none(User.username == user_data.username)
@@ -38,7 +83,7 @@ async def register(user_data: UserCreate):
         # Получаем роль "user" по умолчанию
         default_role = Role.get(Role.name == "user")
         
-        with database.atomic():
+        with database.atomic("IMMEDIATE"):
             user = User.create(
                 username=user_data.username,
                 email=user_data.email,
@@ -59,8 +104,10 @@ async def register(user_data: UserCreate):
         )
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin):
+def login(user_credentials: UserLogin, request: Request):
     """Вход в систему"""
+    # Ограничение попыток проверяется до поиска пользователя и вычисления хеша
+    check_login_attempt(_client_ip(request), user_credentials.username)
     user = authenticate_user(user_credentials.username, user_credentials.password)
     if not user:
         raise HTTPException(
@@ -77,126 +124,234 @@ async def login(user_credentials: UserLogin):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+def read_users_me(current_user: User = Depends(get_current_active_user)):
     """Получить информацию о текущем пользователе"""
-    # Загружаем связанную роль
-    user_with_role = User.get(User.id == current_user.id)
-    return UserResponse.model_validate(user_with_role, from_attributes=True)
+    # Роль уже загружена вместе с пользователем в get_current_user
+    return UserResponse.model_validate(current_user, from_attributes=True)
+
+@router.get("/bootstrap", response_model=BootstrapResponse)
+def bootstrap(
+    random_count: int = Query(4, alias="random", ge=0, le=RANDOM_FILMS_MAX, description="Сколько случайных фильмов"),
+    current_user: User | None = Depends(get_optional_user),
+):
+    """Всё для первой загрузки страницы одним запросом: профиль, id закладок
+    и корзины с их версиями, случайные фильмы. Гостю (или с недействительным токеном) — user: null.
+    """
+    body = {"user": None, "bookmarks": None, "cart": None, "random_films": []}
+    if current_user is not None:
+        # Пользователь с ролью уже в кеше аутентификации; аватар — только ссылкой
+        body["user"] = UserResponse.model_validate(current_user, from_attributes=True).model_dump(mode="json")
+        collection_cache.flush(current_user.id)
+        body.update(collection_ids(current_user.id))
+    if random_count:
+        # Случайные фильмы — из снимка каталога в памяти
+        body["random_films"] = catalog.snapshot().random_films(random_count)
+    return Response(content=dumps(body), media_type=JSON_MEDIA_TYPE,
+                    headers={"Cache-Control": NO_STORE, "Vary": "Authorization"})
+
+def _avatar_response(current_user: User, update, *args) -> UserResponse:
+    try:
+        user = update(current_user, *args)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return UserResponse.model_validate(user, from_attributes=True)
+
+@router.post("/me/avatar", response_model=UserResponse)
+def upload_avatar(
+    file: UploadFile = File(..., description="Изображение; уменьшается до AVATAR_SIZE и AVATAR_THUMB_SIZE"),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Загрузить аватар файлом (multipart/form-data)"""
+    # Читаем на байт больше лимита: этого достаточно, чтобы отклонить слишком большой файл
+    data = file.file.read(AVATAR_MAX_BYTES + 1)
+    if not data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Пустое изображение")
+    return _avatar_response(current_user, set_user_avatar, data)
 
 @router.put("/me/avatar", response_model=UserResponse)
-async def update_avatar(payload: AvatarUpdate, current_user: User = Depends(get_current_active_user)):
-    """Обновить аватар текущего пользователя (base64)"""
-    # Небольшая валидация: ограничим размер строки, чтобы не переполнять БД случайно
-    if not payload.avatar_base64 or len(payload.avatar_base64) > 5_000_000:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Некорректный размер изображения")
-    current_user.avatar_base64 = payload.avatar_base64
-    current_user.save()
-    return UserResponse.model_validate(current_user, from_attributes=True)
+def update_avatar(payload: AvatarUpdate, current_user: User = Depends(get_current_active_user)):
+    """Обновить аватар текущего пользователя (base64 или data URL)"""
+    return _avatar_response(current_user, set_user_avatar_base64, payload.avatar_base64)
 
-# --- Закладки ---
-from pydantic import BaseModel
+@router.delete("/me/avatar", response_model=UserResponse)
+def delete_avatar(current_user: User = Depends(get_current_active_user)):
+    """Удалить аватар текущего пользователя"""
+    return _avatar_response(current_user, clear_user_avatar)
+
+# --- Закладки и корзина ---
+from pydantic import BaseModel, Field
 from typing import List
 
+# Максимум элементов в одной пакетной операции
+COLLECTION_BATCH_MAX = 500
+
 class BookmarkCreate(BaseModel):
-    movie_id: str
-    title: str
-    author: str | None = None
-    price: str | None = None
+    # Название, режиссёр и цена берутся из каталога; старые клиенты присылают их — они игнорируются
+    movie_id: int
 
 class BookmarkResponse(BaseModel):
-    id: int
+    # None — ответ POST при отложенной записи (COLLECTION_WRITE_BEHIND_MS): строки ещё нет
+    id: int | None = None
     movie_id: str
     title: str
     author: str | None = None
     price: str | None = None
+    price_minor: int | None = None
+    currency: str | None = None
 
     class Config:
         from_attributes = True
 
-@router.get("/bookmarks", response_model=List[BookmarkResponse])
-async def list_bookmarks(current_user: User = Depends(get_current_active_user)):
-    items = Bookmark.select().where(Bookmark.user == current_user)
-    return [BookmarkResponse.model_validate(item, from_attributes=True) for item in items]
+class BookmarkBatch(BaseModel):
+    add: List[BookmarkCreate] = Field(default_factory=list, max_length=COLLECTION_BATCH_MAX)
+    remove: List[int] = Field(default_factory=list, max_length=COLLECTION_BATCH_MAX)
 
-@router.post("/bookmarks", response_model=BookmarkResponse, status_code=status.HTTP_201_CREATED)
-async def add_bookmark(payload: BookmarkCreate, current_user: User = Depends(get_current_active_user)):
-    try:
-        with database.atomic():
-            item, created = Bookmark.get_or_create(
-                user=current_user,
-                movie_id=payload.movie_id,
-                defaults={
-                    'title': payload.title,
-                    'author': payload.author,
-                    'price': payload.price,
-                }
-            )
-            if not created:
-                # обновим данные, если менялись
-                item.title = payload.title
-                item.author = payload.author
-                item.price = payload.price
-                item.save()
-        return BookmarkResponse.model_validate(item, from_attributes=True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Не удалось добавить закладку: {e}")
+class BookmarkChanges(BaseModel):
+    version: int
+    full: bool  # True — items содержит весь список, локальную копию нужно заменить
+    items: List[BookmarkResponse]
+    removed: List[str]
 
-@router.delete("/bookmarks/{movie_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_bookmark(movie_id: str, current_user: User = Depends(get_current_active_user)):
-    deleted = Bookmark.delete().where((Bookmark.user == current_user) & (Bookmark.movie_id == movie_id)).execute()
-    if deleted == 0:
-        raise HTTPException(status_code=404, detail="Закладка не найдена")
-    return
-
-# --- Корзина ---
 class CartItemCreate(BaseModel):
-    movie_id: str
-    title: str
-    author: str | None = None
-    price: str | None = None
+    movie_id: int
 
 class CartItemResponse(BaseModel):
-    id: int
+    # None — ответ POST при отложенной записи (COLLECTION_WRITE_BEHIND_MS): строки ещё нет
+    id: int | None = None
     movie_id: str
     title: str
     author: str | None = None
     price: str | None = None
+    price_minor: int | None = None
+    currency: str | None = None
 
     class Config:
         from_attributes = True
 
-@router.get("/cart", response_model=List[CartItemResponse])
-async def list_cart(current_user: User = Depends(get_current_active_user)):
-    items = CartItem.select().where(CartItem.user == current_user)
-    return [CartItemResponse.model_validate(item, from_attributes=True) for item in items]
+class CartBatch(BaseModel):
+    add: List[CartItemCreate] = Field(default_factory=list, max_length=COLLECTION_BATCH_MAX)
+    remove: List[int] = Field(default_factory=list, max_length=COLLECTION_BATCH_MAX)
 
-@router.post("/cart", response_model=CartItemResponse, status_code=status.HTTP_201_CREATED)
-async def add_to_cart(payload: CartItemCreate, current_user: User = Depends(get_current_active_user)):
+class CartChanges(BaseModel):
+    version: int
+    full: bool
+    items: List[CartItemResponse]
+    removed: List[str]
+
+class CollectionBatchResult(BaseModel):
+    version: int
+
+def _collection_list(request: Request, user: User, kind: str):
+    collection_cache.flush(user.id, kind)
+    version = get_collection_version(user.id, kind)
+    # Готовый JSON из кеша процесса, пока версия коллекции не изменилась
+    return conditional_response(request, make_etag(kind, user.id, version), USER_CACHE_CONTROL,
+                                lambda: Response(content=collection_cache.get_collection(user.id, kind, version).body,
+                                                 media_type=JSON_MEDIA_TYPE),
+                                vary="Authorization")
+
+def _collection_changes(request: Request, user: User, kind: str, since: int | None):
+    collection_cache.flush(user.id, kind)
+    version = get_collection_version(user.id, kind)
+    etag = make_etag(f"{kind}-changes", user.id, version, "all" if since is None else since)
+    return conditional_response(request, etag, USER_CACHE_CONTROL,
+                                lambda: Response(content=dumps(changes_since(user.id, kind, since)), media_type=JSON_MEDIA_TYPE),
+                                vary="Authorization")
+
+def _collection_add(user: User, kind: str, payload: BaseModel, error: str):
+    if collection_cache.write_behind_enabled():
+        # Запись отложена: ответ строится из каталога в памяти; id есть, только если строка уже записана
+        film = catalog.snapshot().by_id.get(payload.movie_id)
+        if film is None:
+            raise HTTPException(status_code=404, detail="Фильм не найден")
+        _, row_id = collection_cache.defer(user.id, kind, payload.movie_id, True)
+        return {"id": row_id, "movie_id": str(payload.movie_id), "title": film["title"], "author": film["author"],
+                "price": film["price"], "price_minor": film["price_minor"], "currency": film["currency"]}
     try:
-        with database.atomic():
-            item, created = CartItem.get_or_create(
-                user=current_user,
-                movie_id=payload.movie_id,
-                defaults={
-                    'title': payload.title,
-                    'author': payload.author,
-                    'price': payload.price,
-                }
-            )
-            if not created:
-                item.title = payload.title
-                item.author = payload.author
-                item.price = payload.price
-                item.save()
-        return CartItemResponse.model_validate(item, from_attributes=True)
+        collection_cache.apply(user.id, kind, [payload.movie_id], [])
+        return get_item(user.id, kind, payload.movie_id)
+    except UnknownFilmError:
+        raise HTTPException(status_code=404, detail="Фильм не найден")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Не удалось добавить в корзину: {e}")
+        raise HTTPException(status_code=500, detail=f"{error}: {e}")
+
+def _collection_batch(user: User, kind: str, payload: BaseModel):
+    add_ids = [item.movie_id for item in payload.add]
+    both = set(add_ids).intersection(payload.remove)
+    if both:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Фильм не может быть одновременно в add и remove: {', '.join(map(str, sorted(both)))}")
+    try:
+        version, _ = collection_cache.apply(user.id, kind, add_ids, payload.remove)
+    except UnknownFilmError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"version": version}
+
+def _collection_remove(user: User, kind: str, movie_id: int, not_found: str):
+    if collection_cache.write_behind_enabled():
+        removed, _ = collection_cache.defer(user.id, kind, movie_id, False)
+    else:
+        removed = collection_cache.apply(user.id, kind, [], [movie_id])[1]
+    if not removed:
+        raise HTTPException(status_code=404, detail=not_found)
+
+_SINCE = Query(None, ge=0, description="Версия из предыдущего ответа; без неё — полный список")
+
+@router.get("/bookmarks", response_model=List[BookmarkResponse])
+def list_bookmarks(request: Request, current_user: User = Depends(get_current_active_user)):
+    return _collection_list(request, current_user, "bookmarks")
+
+@router.get("/bookmarks/changes", response_model=BookmarkChanges)
+def bookmark_changes(request: Request, since: int | None = _SINCE, current_user: User = Depends(get_current_active_user)):
+    """Изменения закладок после версии since: клиенту не нужно заново скачивать весь список"""
+    return _collection_changes(request, current_user, "bookmarks", since)
+
+@router.post("/bookmarks", response_model=BookmarkResponse, status_code=status.HTTP_201_CREATED)
+def add_bookmark(payload: BookmarkCreate, current_user: User = Depends(get_current_active_user)):
+    return _collection_add(current_user, "bookmarks", payload, "Не удалось добавить закладку")
+
+@router.post("/bookmarks/batch", response_model=CollectionBatchResult)
+def batch_bookmarks(payload: BookmarkBatch, current_user: User = Depends(get_current_active_user)):
+    """Добавить и удалить несколько закладок одной транзакцией"""
+    return _collection_batch(current_user, "bookmarks", payload)
+
+@router.delete("/bookmarks/{movie_id}", status_code=status.HTTP_204_NO_CONTENT)
+def remove_bookmark(movie_id: int, current_user: User = Depends(get_current_active_user)):
+    _collection_remove(current_user, "bookmarks", movie_id, "Закладка не найдена")
+    return
+
+@router.get("/cart", response_model=List[CartItemResponse])
+def list_cart(request: Request, current_user: User = Depends(get_current_active_user)):
+    return _collection_list(request, current_user, "cart")
+
+@router.get("/cart/summary", response_model=CartSummary)
+def get_cart_summary(request: Request, current_user: User = Depends(get_current_active_user)):
+    """Число позиций и сумма корзины по валютам"""
+    collection_cache.flush(current_user.id, "cart")
+    # Сумма меняется и при изменении корзины, и при изменении цен в каталоге
+    etag = make_etag("cart-summary", current_user.id, get_collection_version(current_user.id, "cart"),
+                     catalog.current_version())
+    return conditional_response(request, etag, USER_CACHE_CONTROL,
+                                lambda: Response(content=dumps(cart_summary(current_user.id)), media_type=JSON_MEDIA_TYPE),
+                                vary="Authorization")
+
+@router.get("/cart/changes", response_model=CartChanges)
+def cart_changes(request: Request, since: int | None = _SINCE, current_user: User = Depends(get_current_active_user)):
+    """Изменения корзины после версии since"""
+    return _collection_changes(request, current_user, "cart", since)
+
+@router.post("/cart", response_model=CartItemResponse, status_code=status.HTTP_201_CREATED)
+def add_to_cart(payload: CartItemCreate, current_user: User = Depends(get_current_active_user)):
+    return _collection_add(current_user, "cart", payload, "Не удалось добавить в корзину")
+
+@router.post("/cart/batch", response_model=CollectionBatchResult)
+def batch_cart(payload: CartBatch, current_user: User = Depends(get_current_active_user)):
+    """Добавить и удалить несколько позиций корзины одной транзакцией"""
+    return _collection_batch(current_user, "cart", payload)
 
 @router.delete("/cart/{movie_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_from_cart(movie_id: str, current_user: User = Depends(get_current_active_user)):
-    deleted = CartItem.delete().where((CartItem.user == current_user) & (CartItem.movie_id == movie_id)).execute()
-    if deleted == 0:
-        raise HTTPException(status_code=404, detail="Товар не найден в корзине")
+def remove_from_cart(movie_id: int, current_user: User = Depends(get_current_active_user)):
+    _collection_remove(current_user, "cart", movie_id, "Товар не найден в корзине")
     return
 
 # --- Смена пароля ---
@@ -204,51 +359,203 @@ from schemas import PasswordChange
 from auth import verify_password
 
 @router.put("/me/password", status_code=status.HTTP_204_NO_CONTENT)
-async def change_password(payload: PasswordChange, current_user: User = Depends(get_current_active_user)):
-    if not verify_password(payload.current_password, current_user.hashed_password):
+def change_password(payload: PasswordChange, current_user: User = Depends(get_current_active_user)):
+    # Хеш читаем из БД, а не из закешированного пользователя: пароль мог смениться в другом воркере
+    stored_hash = User.select(User.hashed_password).where(User.id == current_user.id).scalar()
+    if not verify_password(payload.current_password, stored_hash):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Текущий пароль неверен")
     if not payload.new_password or len(payload.new_password) < 6:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Новый пароль слишком короткий")
-    current_user.hashed_password = get_password_hash(payload.new_password)
-    current_user.save()
+    new_hash = get_password_hash(payload.new_password)
+    User.update(hashed_password=new_hash).where(User.id == current_user.id).execute()
+    invalidate_user_cache(current_user.username)
     return
 
 # --- Фильмы по жанрам ---
-class FilmResponse(BaseModel):
-    flim_id: int
-    title: str
-    title_ru: str | None = None
-    author: str | None = None
-    price: str | None = None
-    genre_title: str
-    movie_base64: str | None = None
+def _film_page_response(query, limit, cursor, fields, sort):
+    """Страница каталога по keyset-курсору; курсор следующей страницы — в заголовках"""
+    try:
+        page, next_cursor = film_page(query, sort=sort or "flim_id", cursor=cursor,
+                                      limit=limit or FILMS_PAGE_DEFAULT, fields=fields)
+    except PaginationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    headers = {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=dump_films(page), media_type=JSON_MEDIA_TYPE, headers=headers)
 
-    class Config:
-        from_attributes = True
+def _film_list_response(films, fields):
+    """Весь список из кеша каталога; fields без limit/cursor/sort только сокращает поля"""
+    try:
+        names = parse_fields(fields)
+    except PaginationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return Response(content=dump_films([{name: film[name] for name in names} for film in films]),
+                    media_type=JSON_MEDIA_TYPE)
+
+# Параметры постраничной выдачи; без них отдаётся весь список из кеша каталога
+_LIMIT = Query(None, ge=1, le=FILMS_PAGE_MAX, description="Размер страницы")
+_CURSOR = Query(None, description="Курсор из заголовка X-Next-Cursor предыдущей страницы")
+_FIELDS = Query(None, description="Список полей через запятую, например flim_id,title,poster_url")
+_SORT = Query(None, description="Сортировка: " + ", ".join(FILM_SORTS))
+
+def _catalog_response(request: Request, build):
+    """Ответ каталога с ETag по версии каталога: при совпадении — 304 без чтения строк"""
+    version = catalog.current_version()
+    etag = make_etag("catalog", version, request_variant(request))
+    return conditional_response(request, etag, CATALOG_CACHE_CONTROL, lambda: build(version))
 
 @router.get("/genres/{genre}/films", response_model=List[FilmResponse])
-async def get_films_by_genre(genre: str):
+def get_films_by_genre(request: Request, genre: str, limit: int | None = _LIMIT, cursor: str | None = _CURSOR,
+                       fields: str | None = _FIELDS, sort: str | None = _SORT):
     # Приводим жанр к нижнему регистру для соответствия данным
     g = genre.strip().lower()
-    q = Film.select().where(Film.genre_title == g)
-    return [FilmResponse.model_validate(f, from_attributes=True) for f in q]
+
+    def build(version):
+        if limit or cursor or sort:
+            return _film_page_response(Film.select().where(Film.genre_title == g), limit, cursor, fields, sort)
+        if fields:
+            return _film_list_response(catalog.snapshot(version).by_genre.get(g, []), fields)
+        return Response(content=catalog.snapshot(version).genre_json(g), media_type=JSON_MEDIA_TYPE)
+
+    return _catalog_response(request, build)
 
 @router.get("/films/all", response_model=List[FilmResponse])
-async def get_all_films():
+def get_all_films(request: Request, limit: int | None = _LIMIT, cursor: str | None = _CURSOR,
+                  fields: str | None = _FIELDS, sort: str | None = _SORT):
     """Получить все фильмы из базы данных"""
-    films = Film.select()
-    return [FilmResponse.model_validate(f, from_attributes=True) for f in films]
+    def build(version):
+        if limit or cursor or sort:
+            return _film_page_response(Film.select(), limit, cursor, fields, sort)
+        if fields:
+            return _film_list_response(catalog.snapshot(version).films, fields)
+        return Response(content=catalog.snapshot(version).all_json(), media_type=JSON_MEDIA_TYPE)
+
+    return _catalog_response(request, build)
+
+@router.get(
+    "/films/export",
+    response_model=List[FilmResponse],
+    responses={200: {"content": {NDJSON_MEDIA_TYPE: {}}, "description": "JSON-массив или NDJSON"}},
+)
+def export_films(
+    format: str = Query("ndjson", pattern="^(ndjson|json)$", description="ndjson — по объекту на строку, json — массив"),
+    genre: str | None = Query(None, description="Только фильмы жанра"),
+    fields: str | None = _FIELDS,
+    sort: str | None = _SORT,
+):
+    """Выгрузка всего каталога потоком: память на запрос не зависит от размера каталога"""
+    query = Film.select()
+    if genre:
+        query = query.where(Film.genre_title == genre.strip().lower())
+    sort = sort or "flim_id"
+    # Параметры проверяем до начала потока, пока ещё можно ответить 400
+    try:
+        if sort not in FILM_SORTS:
+            raise PaginationError(f"Недопустимая сортировка: {sort}")
+        parse_fields(fields)
+    except PaginationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    batches = iter_film_batches(query, EXPORT_BATCH_SIZE, sort=sort, fields=fields)
+    if format == "json":
+        return StreamingResponse(json_array_stream(batches), media_type=JSON_MEDIA_TYPE)
+    return StreamingResponse(ndjson_stream(batches), media_type=NDJSON_MEDIA_TYPE)
+
+@router.get("/films/search", response_model=List[FilmResponse])
+def search_films(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200, description="Слова из названия или имени режиссёра (можно начало слова)"),
+    genre: str | None = Query(None, description="Ограничить поиск жанром"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10_000),
+):
+    """Полнотекстовый поиск по каталогу, результаты упорядочены по релевантности"""
+    def build(version):
+        ids = search_film_ids(q, limit=limit, offset=offset, genre=genre.strip().lower() if genre else None)
+        return Response(content=catalog.snapshot(version).films_json(ids), media_type=JSON_MEDIA_TYPE)
+
+    return _catalog_response(request, build)
+
+def _recommendation_response(request: Request, key: str, limit: int):
+    """Готовый список рекомендаций: одна строка по ключу; ETag — по версии каталога и времени расчёта"""
+    ids, computed_at = recommended_ids(key)
+    version = catalog.current_version()
+    etag = make_etag("recommendations", version, computed_at, request_variant(request))
+
+    def build():
+        snapshot = catalog.snapshot(version)
+        # Удалённые после расчёта фильмы пропускаем, не укорачивая выдачу
+        ids_in_catalog = [i for i in ids if i in snapshot.by_id][:limit]
+        return Response(content=snapshot.films_json(ids_in_catalog), media_type=JSON_MEDIA_TYPE)
+
+    return conditional_response(request, etag, CATALOG_CACHE_CONTROL, build)
+
+@router.get("/films/popular", response_model=List[FilmResponse])
+def get_popular_films(
+    request: Request,
+    genre: str | None = Query(None, description="Только фильмы жанра"),
+    limit: int = Query(20, ge=1, le=RECOMMENDATIONS_TOP_N),
+):
+    """Фильмы, которые чаще всего добавляют в закладки и корзину (пересчитываются периодически)"""
+    return _recommendation_response(request, popular_key(genre.strip().lower() if genre else None), limit)
+
+@router.get("/films/{film_id}", response_model=FilmDetailResponse)
+def get_film(request: Request, film_id: int):
+    """Карточка фильма: крупный постер и все его варианты"""
+    def build(version):
+        film = Film.get_or_none(Film.flim_id == film_id)
+        if film is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Фильм не найден")
+        detail = FilmDetailResponse.model_validate(film, from_attributes=True)
+        if film.poster_hash:
+            variants = [PosterVariant(name=v.name, url=media_url(v.digest), content_type=v.content_type,
+                                      width=v.width, height=v.height)
+                        for v in poster_variants(film.poster_hash)]
+            original = Blob.select(Blob.content_type, Blob.width, Blob.height).where(Blob.digest == film.poster_hash).first()
+            if original is not None:
+                variants.append(PosterVariant(name="original", url=media_url(film.poster_hash),
+                                              content_type=original.content_type,
+                                              width=original.width, height=original.height))
+            large = next((v for v in variants if v.name == "large"), None)
+            detail.poster_url = large.url if large else media_url(film.poster_hash)
+            detail.poster_variants = variants
+        return Response(content=dumps(detail.model_dump(mode="json")), media_type=JSON_MEDIA_TYPE)
+
+    return _catalog_response(request, build)
+
+@router.get("/films/{film_id}/similar", response_model=List[FilmResponse])
+def get_similar_films(request: Request, film_id: int,
+                      limit: int = Query(10, ge=1, le=RECOMMENDATIONS_TOP_N)):
+    """Фильмы, которые чаще всего оказываются в закладках и корзинах вместе с этим"""
+    if film_id not in catalog.snapshot().by_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Фильм не найден")
+    return _recommendation_response(request, similar_key(film_id), limit)
 
 @router.get("/films/random/{count}", response_model=List[FilmResponse])
-async def get_random_films(count: int = 4):
+def get_random_films(
+    request: Request,
+    count: int = Path(..., ge=0),
+    seed: str | None = Query(None, max_length=64, description="Одинаковая выборка для одинакового seed"),
+    daily: bool = Query(False, description="Подборка дня: общая для всех, меняется в полночь"),
+):
     """Получить случайные фильмы из базы данных"""
-    import random
-    all_films = list(Film.select())
-    random.shuffle(all_films)
-    return [FilmResponse.model_validate(f, from_attributes=True) for f in all_films[:count]]
+    count = min(count, RANDOM_FILMS_MAX)
+    if daily:
+        day = datetime.now().date().isoformat()
+        # Подборка общая для всех, но с проверкой ETag: в ETag входит день и версия каталога,
+        # поэтому после полуночи и после правки каталога клиент получает актуальную подборку
+        version = catalog.current_version()
+        etag = make_etag("daily", day, version, request_variant(request))
+        return conditional_response(request, etag, CATALOG_CACHE_CONTROL, lambda: Response(
+            content=catalog.snapshot(version).daily_json(day, count), media_type=JSON_MEDIA_TYPE))
+    if seed is not None:
+        return _catalog_response(request, lambda version: Response(
+            content=catalog.snapshot(version).seeded_json(seed, count), media_type=JSON_MEDIA_TYPE))
+    return Response(content=catalog.snapshot().random_json(count), media_type=JSON_MEDIA_TYPE,
+                    headers={"Cache-Control": NO_STORE})
 
 # --- Админ функционал ---
-async def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
     """Получает администратора из текущего пользователя"""
     # Проверяем роль пользователя
     if current_user.role.name != "administrator":
@@ -263,22 +570,47 @@ class FilmCreate(BaseModel):
     title: str
     title_ru: str | None = None
     author: str | None = None
+    # Цена строкой в основных единицах ("299.50") или сразу в копейках (price_minor)
     price: str | None = None
+    price_minor: int | None = Field(None, ge=0)
+    currency: str | None = Field(None, pattern=CURRENCY_PATTERN)
     genre_title: str
     movie_base64: str | None = None
 
 @router.post("/admin/films", response_model=FilmResponse, status_code=status.HTTP_201_CREATED)
-async def create_film(film_data: FilmCreate, admin: User = Depends(get_current_admin_user)):
+def create_film(film_data: FilmCreate, admin: User = Depends(get_current_admin_user)):
     """Создать новый фильм (только для админов)"""
+    price_minor = film_data.price_minor
+    if price_minor is None:
+        try:
+            price_minor = parse_price(film_data.price)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    poster = None
+    if film_data.movie_base64:
+        try:
+            poster = decode_base64_image(film_data.movie_base64)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Некорректный постер: {e}")
     try:
-        film = Film.create(
-            title=film_data.title,
-            title_ru=film_data.title_ru,
-            author=film_data.author,
-            price=film_data.price,
-            genre_title=film_data.genre_title.lower(),
-            movie_base64=film_data.movie_base64
-        )
+        with database.atomic("IMMEDIATE"):
+            poster_hash = store_blob(*poster) if poster else None
+            film = Film.create(
+                title=film_data.title,
+                title_ru=film_data.title_ru,
+                author=film_data.author,
+                price_minor=price_minor,
+                currency=film_data.currency or DEFAULT_CURRENCY,
+                genre_title=film_data.genre_title.lower(),
+                poster_hash=poster_hash,
+                # Тот же файл уже загружали — миниатюра готова
+                poster_thumb_hash=thumb_digest(poster_hash) if poster_hash else None,
+            )
+            version = bump_catalog_version()
+        catalog.film_added(version, film)
+        if poster_hash and not film.poster_thumb_hash:
+            # Миниатюры строятся в фоне; до этого в списках отдаётся оригинал
+            schedule_poster_variants(poster_hash)
         return FilmResponse.model_validate(film, from_attributes=True)
     except Exception as e:
         raise HTTPException(
@@ -287,11 +619,16 @@ async def create_film(film_data: FilmCreate, admin: User = Depends(get_current_a
         )
 
 @router.delete("/admin/films/{film_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_film(film_id: int, admin: User = Depends(get_current_admin_user)):
+def delete_film(film_id: int, admin: User = Depends(get_current_admin_user)):
     """Удалить фильм (только для админов)"""
     try:
         film = Film.get(Film.flim_id == film_id)
-        film.delete_instance()
+        with database.atomic("IMMEDIATE"):
+            forget_film(film_id)
+            film.delete_instance()
+            delete_blob_if_unused(film.poster_hash)
+            version = bump_catalog_version()
+        catalog.film_deleted(version, film_id)
     except Film.DoesNotExist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -303,3 +640,75 @@ async def delete_film(film_id: int, admin: User = Depends(get_current_admin_user
             detail=f"Не удалось удалить фильм: {str(e)}"
         )
     return
+
+def _manifest_format(manifest: UploadFile, format: str | None) -> str:
+    if format:
+        return format
+    name = (manifest.filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Не удалось определить формат манифеста: укажите format=csv или format=ndjson")
+
+@router.post("/admin/films/bulk", response_model=BulkImportResponse)
+def bulk_import_films(
+    manifest: UploadFile = File(..., description="CSV с заголовком или NDJSON: title, title_ru, author, price, genre_title, poster | poster_base64"),
+    images: UploadFile | None = File(None, description="zip-архив с файлами, на которые ссылается колонка poster"),
+    format: str | None = Query(None, pattern="^(csv|ndjson)$"),
+    admin: User = Depends(get_current_admin_user),
+):
+    """Массовое добавление фильмов (только для админов): пачки по BULK_BATCH_SIZE в одной транзакции"""
+    fmt = _manifest_format(manifest, format)
+    load_poster = None
+    if images is not None:
+        try:
+            load_poster = zip_loader(zipfile.ZipFile(images.file))
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Изображения должны быть zip-архивом")
+    # Ошибки проверки приходят сразу, созданные строки — после записи пачки; возвращаем по порядку строк
+    results = sorted(import_films(read_manifest(manifest.file, fmt), load_poster), key=lambda r: r["line"])
+    created = sum(1 for r in results if r["status"] == "created")
+    # Версия каталога уже увеличена: снимок перестроится при следующем чтении
+    return Response(content=dumps({"created": created, "failed": len(results) - created, "results": results}),
+                    media_type=JSON_MEDIA_TYPE)
+
+@router.get("/admin/films/bulk", responses={200: {"content": {NDJSON_MEDIA_TYPE: {}}}})
+def bulk_export_films(admin: User = Depends(get_current_admin_user)):
+    """Выгрузка каталога с постерами (NDJSON, poster_base64) — формат, который принимает POST /admin/films/bulk"""
+    return StreamingResponse(ndjson_stream(batched(export_with_inline_posters(), 50)), media_type=NDJSON_MEDIA_TYPE,
+                             headers={"Content-Disposition": 'attachment; filename="films.ndjson"'})
+
+# --- Отчёты для администраторов ---
+@router.get("/admin/stats/popularity", response_model=List[FilmPopularity])
+def stats_popularity(
+    limit: int = Query(20, ge=1, le=500),
+    genre: str | None = Query(None, description="Только фильмы жанра"),
+    admin: User = Depends(get_current_admin_user),
+):
+    """Самые популярные фильмы: число закладок и корзин, стоимость в корзинах"""
+    return film_popularity(limit, genre)
+
+@router.get("/admin/stats/revenue", response_model=CartValueReport)
+def stats_revenue(admin: User = Depends(get_current_admin_user)):
+    """Стоимость фильмов в корзинах пользователей: итог по валютам и по жанрам"""
+    return cart_value()
+
+# --- Медиа (постеры) ---
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.get("/media/{digest}", response_class=Response)
+def get_media(request: Request, digest: str = Path(..., pattern="^[0-9a-f]{64}$")):
+    """Отдаёт бинарные данные по sha256. Содержимое неизменно, поэтому кешируется навсегда"""
+    etag = f'"{digest}"'
+    # nosniff: браузер не должен угадывать тип и исполнять файл как HTML или скрипт
+    headers = {"Cache-Control": MEDIA_CACHE_CONTROL, "ETag": etag, "X-Content-Type-Options": "nosniff"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    blob = get_blob(digest)
+    if blob is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Файл не найден")
+    # Файлы, сохранённые до проверки по сигнатуре, могли получить тип от клиента
+    media_type = blob.content_type if blob.content_type in IMAGE_CONTENT_TYPES else "application/octet-stream"
+    return Response(content=bytes(blob.data), media_type=media_type, headers=headers)
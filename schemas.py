@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -24,7 +24,9 @@ class RoleResponse(BaseModel):
 class UserResponse(UserBase):
     id: int
     is_active: bool
-    avatar_base64: str | None = None
+    # Ссылки на /media: полный аватар и миниатюра (None — аватара нет)
+    avatar_url: str | None = None
+    avatar_thumb_url: str | None = None
     role: RoleResponse | None = None
     created_at: datetime
     updated_at: datetime
@@ -45,3 +47,86 @@ class AvatarUpdate(BaseModel):
 class PasswordChange(BaseModel):
     current_password: str
     new_password: str
+
+class FilmResponse(BaseModel):
+    flim_id: int
+    title: str
+    title_ru: str | None = None
+    author: str | None = None
+    price: str | None = None  # для отображения, в основных единицах: "299.50"
+    price_minor: int | None = None  # в минимальных единицах (копейках)
+    currency: str | None = None
+    genre_title: str
+    poster_url: str | None = None
+
+    class Config:
+        from_attributes = True
+
+class PosterVariant(BaseModel):
+    name: str  # "thumb", "large", "original"
+    url: str
+    content_type: str
+    width: int | None = None
+    height: int | None = None
+
+class FilmDetailResponse(FilmResponse):
+    """Фильм для отдельной страницы: poster_url — крупный вариант, poster_variants — все размеры (для srcset)"""
+    poster_variants: List[PosterVariant] = []
+
+class BulkImportRowResult(BaseModel):
+    line: int
+    status: str  # "created" или "error"
+    flim_id: int | None = None
+    error: str | None = None
+
+class BulkImportResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkImportRowResult]
+
+class CurrencyTotal(BaseModel):
+    currency: str
+    items: int
+    total_minor: int  # в минимальных единицах (копейках)
+    total: str  # для отображения: "1299.50"
+
+class CartSummary(BaseModel):
+    items: int
+    unpriced: int  # позиции без цены в сумму не входят
+    totals: List[CurrencyTotal]
+
+class FilmPopularity(BaseModel):
+    flim_id: int
+    title: str
+    genre_title: str
+    price_minor: int | None = None
+    currency: str
+    bookmarks: int
+    in_cart: int
+    cart_value_minor: int | None = None
+
+class CartValueByGenre(BaseModel):
+    genre_title: str
+    currency: str
+    items: int
+    users: int
+    total_minor: int
+
+class CartValueTotal(BaseModel):
+    currency: str
+    items: int
+    total_minor: int
+
+class CartValueReport(BaseModel):
+    totals: List[CartValueTotal]
+    by_genre: List[CartValueByGenre]
+
+class CollectionIds(BaseModel):
+    version: int  # можно передать как since= в /bookmarks/changes или /cart/changes
+    ids: List[str]
+
+class BootstrapResponse(BaseModel):
+    user: UserResponse | None = None  # None — гость
+    bookmarks: CollectionIds | None = None
+    cart: CollectionIds | None = None
+    random_films: List[FilmResponse] = []
@@ -0,0 +1,103 @@
+import re
+from typing import List, Optional
+from database import database
+
+# Полнотекстовый индекс по названию, русскому названию и режиссёру.
+# unicode61 приводит к нижнему регистру любые буквы (в том числе кириллицу)
+# и убирает диакритику у латиницы; "ё" сводится к "е" отдельно (см. _fold_sql),
+# prefix='2 3' строит префиксные индексы для поиска по мере набора.
+_CREATE_TABLE = """
+CREATE VIRTUAL TABLE film_search USING fts5(
+    title, title_ru, author,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+_TITLE_RU = '"title-ru"'
+
+
+def _fold_sql(expr: str) -> str:
+    """SQL-выражение, заменяющее ё/Ё на е/Е (unicode61 их не объединяет)"""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# Индекс синхронизируется триггерами, поэтому любые записи в film_list
+# (админка, массовый импорт, ручные правки) сразу видны в поиске
+_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS film_search_ai AFTER INSERT ON film_list BEGIN
+        INSERT INTO film_search(rowid, title, title_ru, author)
+        VALUES (new.flim_id, {_fold_sql('new.title')}, {_fold_sql('new.' + _TITLE_RU)}, {_fold_sql('new.author')});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS film_search_ad AFTER DELETE ON film_list BEGIN
+        DELETE FROM film_search WHERE rowid = old.flim_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS film_search_au AFTER UPDATE OF title, "title-ru", author ON film_list BEGIN
+        UPDATE film_search
+        SET title = {_fold_sql('new.title')}, title_ru = {_fold_sql('new.' + _TITLE_RU)}, author = {_fold_sql('new.author')}
+        WHERE rowid = old.flim_id;
+    END
+    """,
+)
+
+# Веса колонок для bm25: совпадение в названии важнее совпадения в режиссёре
+_RANK = "bm25(film_search, 10.0, 10.0, 3.0)"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+MAX_QUERY_TOKENS = 8
+
+
+def create_search_index():
+    """Создаёт FTS5-таблицу и триггеры; при первом создании индексирует существующие фильмы"""
+    exists = database.execute_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'film_search'"
+    ).fetchone()
+    with database.atomic():
+        if not exists:
+            database.execute_sql(_CREATE_TABLE)
+            database.execute_sql(
+                "INSERT INTO film_search(rowid, title, title_ru, author) "
+                f"SELECT flim_id, {_fold_sql('title')}, {_fold_sql(_TITLE_RU)}, {_fold_sql('author')} "
+                "FROM film_list"
+            )
+        for trigger in _TRIGGERS:
+            database.execute_sql(trigger)
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """Превращает пользовательский ввод в запрос FTS5: каждое слово — префиксный терм.
+
+    "власт кол" -> '"власт"* "кол"*' (все слова должны встретиться).
+    Спецсимволы синтаксиса FTS5 отбрасываются, поэтому ввод нельзя использовать для инъекций.
+    """
+    text = text.replace("ё", "е").replace("Ё", "Е")
+    tokens = _TOKEN_RE.findall(text)[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_film_ids(text: str, limit: int = 20, offset: int = 0, genre: Optional[str] = None) -> List[int]:
+    """Возвращает id фильмов, упорядоченные по релевантности"""
+    match = build_match_query(text)
+    if match is None:
+        return []
+    # Ранжируется всё множество совпадений: ограничение до сортировки отрезало бы
+    # самые релевантные фильмы, если они не среди первых по rowid
+    if genre:
+        sql = (
+            "SELECT film_search.rowid FROM film_search "
+            "JOIN film_list ON film_list.flim_id = film_search.rowid "
+            'WHERE film_search MATCH ? AND film_list."genre-title" = ? '
+            f"ORDER BY {_RANK}, film_search.rowid LIMIT ? OFFSET ?"
+        )
+        params = (match, genre, limit, offset)
+    else:
+        sql = f"SELECT rowid FROM film_search WHERE film_search MATCH ? ORDER BY {_RANK}, rowid LIMIT ? OFFSET ?"
+        params = (match, limit, offset)
+    return [row[0] for row in database.execute_sql(sql, params).fetchall()]
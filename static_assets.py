@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Сборка и раздача статики: файлы с хешем содержимого в имени и заранее сжатые варианты.
+
+/all_css/style.css -> /all_css/style.1a2b3c4d5e6f.css: такой URL меняется вместе с содержимым,
+поэтому его можно кешировать навсегда (immutable). Ссылки в CSS, app.js и HTML переписываются
+на новые имена; HTML раздаётся с no-cache — браузер перепроверяет только его.
+Текстовые файлы дополнительно сжимаются в .gz и .br, при раздаче выбирается вариант по Accept-Encoding.
+
+Сборка выполняется при запуске сервера; заранее (например, при деплое):
+    python static_assets.py
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from config import STATIC_BUILD_DIR, STATIC_GZIP_LEVEL, STATIC_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:  # Brotli есть в requirements.txt; без него остаются только .gz
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+BUILD_DIR = Path(STATIC_BUILD_DIR)
+
+# URL-префикс -> каталог с исходниками. Порядок важен: CSS ссылается на изображения,
+# app.js — на постеры, HTML — на всё остальное, поэтому ссылки переписываются после сборки зависимостей
+ASSET_DIRS = (
+    ("/images", "images"),
+    ("/images_for_buttons", "images_for_buttons"),
+    ("/images_for_movies", "images_for_movies"),
+    ("/all_css", "all_css"),
+)
+# Отдельные файлы из корня проекта; собранные лежат рядом с HTML и раздаются корневым маунтом
+ROOT_ASSETS = ("app.js",)
+HTML_DIR = "all_html"
+
+# Текст, в котором переписываются ссылки и который стоит сжимать (JPEG уже сжат)
+TEXT_SUFFIXES = {".css", ".js", ".html", ".svg", ".json", ".txt"}
+# Меньше этого сжатие не окупает лишний файл и заголовок Content-Encoding
+COMPRESS_MIN_BYTES = 512
+
+HASH_LENGTH = 12
+FINGERPRINT_RE = re.compile(rf"\.[0-9a-f]{{{HASH_LENGTH}}}\.\w+$")
+
+# Варианты в порядке предпочтения: (Accept-Encoding, суффикс файла)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Исходный URL -> URL с хешем; заполняется build()
+_manifest: Dict[str, str] = {}
+
+
+def _write_atomic(path: Path, data: bytes):
+    # Несколько воркеров могут собирать одновременно: читатель не должен увидеть недописанный файл
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _compress(path: Path, data: bytes):
+    if len(data) < COMPRESS_MIN_BYTES:
+        return
+    variants = [(".gz", gzip.compress(data, compresslevel=STATIC_GZIP_LEVEL, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(data, quality=STATIC_BROTLI_QUALITY)))
+    for suffix, compressed in variants:
+        target = path.with_name(path.name + suffix)
+        # Вариант, который не меньше оригинала, только мешает
+        if len(compressed) < len(data) and not target.exists():
+            _write_atomic(target, compressed)
+
+
+def _rewrite(text: str, pattern: Optional[re.Pattern]) -> str:
+    if pattern is None:
+        return text
+    return pattern.sub(lambda m: _manifest[m.group(0)], text)
+
+
+def _link_pattern() -> Optional[re.Pattern]:
+    # Абсолютные ссылки в кавычках или url(...): '/images/a.jpg', "/app.js", url(/all_css/x.css)
+    if not _manifest:
+        return None
+    urls = sorted(_manifest, key=len, reverse=True)
+    return re.compile(r"(?<=[\"'(])(?:" + "|".join(map(re.escape, urls)) + r")(?=[\"')?#])")
+
+
+def _build_asset(url: str, source: Path, target_dir: Path, pattern: Optional[re.Pattern]):
+    data = source.read_bytes()
+    is_text = source.suffix in TEXT_SUFFIXES
+    if is_text:
+        data = _rewrite(data.decode("utf-8"), pattern).encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    name = f"{source.stem}.{digest}{source.suffix}"
+    target = target_dir / name
+    if not target.exists():
+        if is_text:
+            _write_atomic(target, data)
+        else:
+            # Изображения не меняются при сборке: жёсткая ссылка вместо копии, если ФС позволяет
+            try:
+                os.link(source, target)
+            except FileExistsError:
+                pass
+            except OSError:
+                _write_atomic(target, data)
+        if is_text:
+            _compress(target, data)
+    _manifest[url] = url.rsplit("/", 1)[0] + "/" + name
+
+
+def build() -> Dict[str, str]:
+    """Собирает статику в STATIC_BUILD_DIR и возвращает манифест (исходный URL -> URL с хешем).
+
+    Файлы с хешем в имени не перезаписываются, поэтому повторная сборка почти ничего не стоит;
+    каталог сборки можно удалить в любой момент — он будет создан заново.
+    """
+    _manifest.clear()
+    for prefix, directory in ASSET_DIRS:
+        target_dir = BUILD_DIR / directory
+        target_dir.mkdir(parents=True, exist_ok=True)
+        pattern = _link_pattern()
+        for source in sorted((BASE_DIR / directory).iterdir()):
+            if source.is_file() and not source.name.startswith("."):
+                _build_asset(f"{prefix}/{source.name}", source, target_dir, pattern)
+
+    html_dir = BUILD_DIR / HTML_DIR
+    html_dir.mkdir(parents=True, exist_ok=True)
+    pattern = _link_pattern()
+    for name in ROOT_ASSETS:
+        _build_asset(f"/{name}", BASE_DIR / name, html_dir, pattern)
+
+    # HTML сохраняет свои имена (на них ведут ссылки и закладки браузера), меняются только ссылки внутри
+    pattern = _link_pattern()
+    for source in sorted((BASE_DIR / HTML_DIR).glob("*.html")):
+        data = _rewrite(source.read_text(encoding="utf-8"), pattern).encode("utf-8")
+        target = html_dir / source.name
+        if not target.exists() or target.read_bytes() != data:
+            for suffix in ("", ".gz", ".br"):
+                stale = target.with_name(target.name + suffix)
+                if stale.exists():
+                    stale.unlink()
+            _write_atomic(target, data)
+        _compress(target, data)
+
+    manifest = json.dumps(_manifest, ensure_ascii=False, indent=1, sort_keys=True)
+    _write_atomic(BUILD_DIR / "manifest.json", manifest.encode("utf-8"))
+    logger.info("Статика собрана: %s файлов с хешем в %s", len(_manifest), BUILD_DIR)
+    return dict(_manifest)
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles над несколькими каталогами: сначала сборка, затем исходники.
+
+    Файлы с хешем в имени из сборки — Cache-Control immutable, остальное — no-cache (перепроверка по ETag).
+    Если рядом с файлом есть .br/.gz и клиент их принимает, отдаётся сжатый вариант.
+    """
+
+    def __init__(self, *directories: Path, html: bool = False):
+        super().__init__(directory=str(directories[0]), html=html, check_dir=False)
+        self.all_directories = [str(d) for d in directories]
+
+    def _encoded(self, path: str, scope) -> Optional[Tuple[str, str, os.stat_result]]:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted:
+                try:
+                    return path + suffix, encoding, os.stat(path + suffix)
+                except FileNotFoundError:
+                    continue
+        return None
+
+    def _cache_headers(self, response, file_path: str, has_variants: bool):
+        """Одинаковые заголовки кеширования для 200 и 304: иначе 304 сбрасывает immutable"""
+        immutable = (FINGERPRINT_RE.search(os.path.basename(file_path))
+                     and Path(file_path).is_relative_to(BUILD_DIR))
+        response.headers["cache-control"] = "public, max-age=31536000, immutable" if immutable else "no-cache"
+        if has_variants:
+            response.headers["vary"] = "Accept-Encoding"
+        return response
+
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if isinstance(response, NotModifiedResponse):
+            file_path, _ = await anyio.to_thread.run_sync(self.lookup_path, path)
+            has_variants = any(os.path.exists(file_path + suffix) for _, suffix in ENCODINGS)
+            return self._cache_headers(response, file_path, has_variants)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+        file_path = response.path
+        has_variants = any(os.path.exists(file_path + suffix) for _, suffix in ENCODINGS)
+        encoded = self._encoded(file_path, scope)
+        if encoded is not None:
+            encoded_path, encoding, stat_result = encoded
+            response = FileResponse(encoded_path, stat_result=stat_result, media_type=response.media_type)
+            response.headers["content-encoding"] = encoding
+            if self.is_not_modified(response.headers, Headers(scope=scope)):
+                response = NotModifiedResponse(response.headers)
+        return self._cache_headers(response, file_path, has_variants)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for source, target in sorted(build().items()):
+        print(f"{source} -> {target}")
@@ -0,0 +1,49 @@
+from typing import Iterable, Iterator, List, Optional
+from fastjson import dumps
+from pagination import film_page
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def iter_film_batches(query, batch_size: int, sort: str = "flim_id", fields: Optional[str] = None) -> Iterator[List[dict]]:
+    """Идёт по каталогу keyset-страницами: в памяти одновременно не больше batch_size строк.
+
+    Каждая пачка — отдельный короткий запрос. StreamingResponse вызывает генератор
+    в разных потоках пула, поэтому курсор одного соединения между чанками не держим.
+    """
+    cursor = None
+    while True:
+        page, cursor = film_page(query, sort=sort, cursor=cursor, limit=batch_size, fields=fields)
+        if page:
+            yield page
+        if cursor is None:
+            return
+
+
+def batched(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """Группирует построчный генератор в пачки, чтобы отдавать их одним чанком"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ndjson_stream(batches: Iterable[List[dict]]) -> Iterator[bytes]:
+    """Одна строка JSON на объект; клиент может обрабатывать их по мере получения"""
+    for batch in batches:
+        yield b"".join(dumps(row) + b"\n" for row in batch)
+
+
+def json_array_stream(batches: Iterable[List[dict]]) -> Iterator[bytes]:
+    """Обычный JSON-массив, отдаваемый частями"""
+    yield b"["
+    first = True
+    for batch in batches:
+        chunk = b",".join(dumps(row) for row in batch)
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
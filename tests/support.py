@@ -0,0 +1,24 @@
+"""Общая временная база для тестов: модули приложения читают DATABASE_URL при импорте."""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp()
+DB_PATH = os.path.join(_tmp, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+# Долгие транзакции в тестах длиннее ожидания блокировки SQLite
+os.environ.setdefault("SQLITE_BUSY_TIMEOUT_MS", "300")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrate  # noqa: E402
+from database import database  # noqa: E402
+
+
+def reset_database():
+    """Пустая база перед тестом"""
+    if not database.is_closed():
+        database.close()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    migrate._migrations = None
@@ -0,0 +1,55 @@
+"""Миграции: два процесса (здесь — потока) одновременно применяют долгую миграцию."""
+import threading
+import time
+import types
+import unittest
+
+from support import reset_database
+import migrate
+from database import database
+
+SLOW_SECONDS = 1.5
+
+
+def _slow_up():
+    database.execute_sql("CREATE TABLE slow_migration (id INTEGER PRIMARY KEY)")
+    time.sleep(SLOW_SECONDS)
+
+
+class ConcurrentMigrateTest(unittest.TestCase):
+    def setUp(self):
+        reset_database()
+        slow = types.ModuleType("migrations.9999_slow")
+        slow.up = _slow_up
+        migrate._migrations = migrate.discover() + [migrate.Migration(9999, "slow", slow)]
+
+    def tearDown(self):
+        migrate._migrations = None
+
+    def test_second_process_waits_for_slow_migration(self):
+        results, errors = [], []
+
+        def run():
+            try:
+                results.append(migrate.migrate())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.1)
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(errors, [])
+        # Все миграции применил один из двух, второй дождался и ничего не применял
+        self.assertEqual(sorted(results), [0, len(migrate.discover())])
+        with database.connection_context():
+            versions = [v for (v,) in database.execute_sql("SELECT version FROM schema_version ORDER BY version")]
+            lock = database.execute_sql("SELECT COUNT(*) FROM schema_lock").fetchone()[0]
+        self.assertEqual(versions, [m.version for m in migrate.discover()])
+        self.assertEqual(lock, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Перенос постеров из film_list.movie_base64 (миграция 0002) на базе до появления миграций."""
+import base64
+import io
+import time
+import unittest
+
+from support import reset_database
+import images
+import migrate
+from database import database
+
+_LEGACY_FILMS = """
+CREATE TABLE film_list (
+    flim_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(255) NOT NULL,
+    author VARCHAR(255),
+    price VARCHAR(50),
+    "genre-title" VARCHAR(100) NOT NULL,
+    movie_base64 TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def _png() -> str:
+    buf = io.BytesIO()
+    images.Image.new("RGB", (400, 600), "red").save(buf, "PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+@unittest.skipIf(images.Image is None, "нужен Pillow")
+class PosterMigrationTest(unittest.TestCase):
+    def setUp(self):
+        reset_database()
+        with database.connection_context():
+            database.execute_sql(_LEGACY_FILMS)
+            database.execute_sql(
+                'INSERT INTO film_list (title, price, "genre-title", movie_base64) VALUES (?, ?, ?, ?)',
+                ("Постер", "199", "drama", "data:image/png;base64," + _png()))
+            # Старое значение-путь не переносится: очищается, чтобы колонку можно было удалить
+            database.execute_sql(
+                'INSERT INTO film_list (title, "genre-title", movie_base64) VALUES (?, ?, ?)',
+                ("Путь", "drama", "images_for_movies/x.jpg"))
+
+    def tearDown(self):
+        images.shutdown()
+
+    def test_migrated_poster_gets_thumbnail(self):
+        migrate.migrate()
+        with database.connection_context():
+            deadline = time.monotonic() + 30
+            while True:
+                poster, thumb = database.execute_sql(
+                    "SELECT poster_hash, poster_thumb_hash FROM film_list WHERE title = 'Постер'").fetchone()
+                if thumb or time.monotonic() > deadline:
+                    break
+                time.sleep(0.2)
+            columns = {row[1] for row in database.execute_sql("PRAGMA table_info(film_list)")}
+            unconverted = database.execute_sql("SELECT poster_hash FROM film_list WHERE title = 'Путь'").fetchone()
+        self.assertIsNotNone(poster)
+        self.assertIsNotNone(thumb)
+        self.assertEqual(unconverted, (None,))
+        self.assertNotIn("movie_base64", columns)
+        self.assertTrue(all(m["state"] == "применена" for m in migrate.status()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+"""Фоновый пересчёт рекомендаций: при нескольких воркерах пересчитывает один."""
+import time
+import unittest
+
+from support import reset_database
+import migrate
+import recommendations
+from database import RecommendationLease, database
+
+
+class RecommendationLeaseTest(unittest.TestCase):
+    def setUp(self):
+        reset_database()
+        migrate.migrate()
+
+    def tearDown(self):
+        database.close()
+
+    def test_one_owner_at_a_time(self):
+        self.assertTrue(recommendations._take_lease("host:1"))
+        self.assertFalse(recommendations._take_lease("host:2"))
+        # Владелец продлевает аренду
+        self.assertTrue(recommendations._take_lease("host:1"))
+
+        recommendations._release_lease("host:1")
+        self.assertTrue(recommendations._take_lease("host:2"))
+
+    def test_expired_lease_is_taken_over(self):
+        self.assertTrue(recommendations._take_lease("host:1"))
+        with database.connection_context():
+            (RecommendationLease
+             .update(heartbeat=time.time() - recommendations._LEASE_SECONDS - 1)
+             .execute())
+        self.assertTrue(recommendations._take_lease("host:2"))
+        self.assertFalse(recommendations._take_lease("host:1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+"""Раздача собранной статики: заголовки кеширования у 200 и 304."""
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("STATIC_BUILD_DIR", tempfile.mkdtemp())
+
+import support  # noqa: F401,E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.routing import Mount  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+import static_assets  # noqa: E402
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class NotModifiedCacheHeadersTest(unittest.TestCase):
+    def setUp(self):
+        manifest = static_assets.build()
+        self.url = next(url for url in manifest.values() if url.startswith("/all_css/"))
+        app = Starlette(routes=[Mount("/all_css", static_assets.AssetFiles(
+            static_assets.BUILD_DIR / "all_css", static_assets.BASE_DIR / "all_css"))])
+        self.client = TestClient(app)
+
+    def test_304_keeps_immutable(self):
+        for encoding in ("identity", "gzip"):
+            with self.subTest(encoding=encoding):
+                first = self.client.get(self.url, headers={"accept-encoding": encoding})
+                self.assertEqual(first.headers["cache-control"], IMMUTABLE)
+                again = self.client.get(self.url, headers={"accept-encoding": encoding,
+                                                           "if-none-match": first.headers["etag"]})
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again.headers["cache-control"], IMMUTABLE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Hashable
+
+
+class SlidingWindowLimiter:
+    """Не больше limit событий за window секунд на ключ (скользящее окно по меткам времени).
+
+    Для ключа хранится не больше limit меток, число ключей ограничено maxkeys: при переполнении
+    забывается ключ, к которому дольше всего не обращались. limit <= 0 — ограничения нет.
+    """
+
+    def __init__(self, limit: int, window: float, maxkeys: int):
+        self.limit = limit
+        self.window = window
+        self.maxkeys = maxkeys
+        self._data: "OrderedDict[Hashable, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: Hashable) -> float:
+        """Учитывает событие и возвращает 0; если окно заполнено — событие не учитывается,
+        возвращается, через сколько секунд освободится место.
+        """
+        if self.limit <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            stamps = self._data.get(key)
+            if stamps is None:
+                stamps = self._data[key] = deque(maxlen=self.limit)
+            while stamps and stamps[0] <= now - self.window:
+                stamps.popleft()
+            self._data.move_to_end(key)
+            if len(stamps) >= self.limit:
+                return stamps[0] + self.window - now
+            stamps.append(now)
+            while len(self._data) > self.maxkeys:
+                self._data.popitem(last=False)
+        return 0.0
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
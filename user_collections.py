@@ -0,0 +1,227 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from peewee import SQL, Cast, fn
+from database import (
+    Bookmark, CartItem, CollectionTombstone, CollectionVersion, Film, database,
+    get_collection_version, bump_collection_version,
+)
+from money import format_price
+from config import COLLECTION_TOMBSTONE_RETENTION_DAYS
+
+# Коллекции пользователя: имя (оно же ключ версии в collection_versions) -> модель
+COLLECTIONS = {"bookmarks": Bookmark, "cart": CartItem}
+
+# Сколько строк в одном INSERT (ограничение SQLite на число параметров)
+_INSERT_CHUNK = 200
+# Сколько отметок об удалении удаляется за одну транзакцию
+_PRUNE_CHUNK = 5000
+
+
+class UnknownFilmError(ValueError):
+    """В коллекцию добавляется фильм, которого нет в каталоге"""
+
+    def __init__(self, film_ids: List[int]):
+        shown = ", ".join(map(str, film_ids[:10]))
+        more = f" и ещё {len(film_ids) - 10}" if len(film_ids) > 10 else ""
+        super().__init__(f"Фильмы не найдены: {shown}{more}")
+        self.film_ids = film_ids
+
+
+def _items_query(model):
+    # Поля фильма берутся из каталога одним JOIN; movie_id в API — строка, как и раньше
+    return (model
+            .select(model.id, Cast(model.film, "TEXT").alias("movie_id"), Film.title, Film.author,
+                    Film.price_minor, Film.currency)
+            .join(Film, on=(model.film == Film.flim_id)))
+
+
+def _item_rows(query) -> List[dict]:
+    rows = list(query.dicts())
+    for row in rows:
+        row["price"] = format_price(row["price_minor"])
+    return rows
+
+
+def _add_tombstones(user_id: int, kind: str, film_ids: List[int], version: int):
+    now = time.time()
+    (CollectionTombstone
+     .insert_many([{"user": user_id, "kind": kind, "movie_id": str(film_id), "version": version, "deleted_at": now}
+                   for film_id in film_ids])
+     .on_conflict(
+         conflict_target=[CollectionTombstone.user, CollectionTombstone.kind, CollectionTombstone.movie_id],
+         preserve=[CollectionTombstone.version, CollectionTombstone.deleted_at])
+     .execute())
+
+
+def prune_tombstones(retention_seconds: float = COLLECTION_TOMBSTONE_RETENTION_DAYS * 86400) -> int:
+    """Удаляет отметки об удалении старше retention_seconds; возвращает их число.
+
+    Версия каждой удалённой отметки запоминается в collection_versions.pruned_version:
+    клиент с since меньше неё мог пропустить удаление и получит полный список.
+    """
+    cutoff = time.time() - retention_seconds
+    total = 0
+    while True:
+        # Порциями, чтобы не держать блокировку записи долго
+        with database.atomic("IMMEDIATE"):
+            rows = (CollectionTombstone
+                    .select(CollectionTombstone.user, CollectionTombstone.kind, CollectionTombstone.movie_id,
+                            CollectionTombstone.version)
+                    .where(CollectionTombstone.deleted_at < cutoff)
+                    .limit(_PRUNE_CHUNK)
+                    .tuples())
+            rows = list(rows)
+            if not rows:
+                return total
+            marks: Dict[Tuple[int, str], int] = {}
+            for user_id, kind, _, version in rows:
+                marks[user_id, kind] = max(marks.get((user_id, kind), 0), version)
+            cursor = database.cursor()
+            cursor.executemany(
+                "UPDATE collection_versions SET pruned_version = MAX(pruned_version, ?) WHERE user_id = ? AND kind = ?",
+                [(version, user_id, kind) for (user_id, kind), version in marks.items()])
+            cursor.executemany(
+                "DELETE FROM collection_tombstones WHERE user_id = ? AND kind = ? AND movie_id = ?",
+                [(user_id, kind, movie_id) for user_id, kind, movie_id, _ in rows])
+        total += len(rows)
+
+
+def apply_changes(user_id: int, kind: str, add: List[int], remove: List[int]) -> Tuple[int, List[int]]:
+    """Добавляет и удаляет фильмы коллекции одной транзакцией.
+
+    Возвращает новую версию коллекции и id фильмов, которые действительно были удалены.
+    Уже добавленные фильмы и удаление отсутствующих ничего не меняют; если изменений нет,
+    версия не увеличивается. Фильм не из каталога — UnknownFilmError.
+    """
+    model = COLLECTIONS[kind]
+    add = list(dict.fromkeys(add))
+    with database.atomic("IMMEDIATE"):
+        if add:
+            known = {film_id for (film_id,) in Film.select(Film.flim_id).where(Film.flim_id.in_(add)).tuples()}
+            missing = [film_id for film_id in add if film_id not in known]
+            if missing:
+                raise UnknownFilmError(missing)
+        present = set()
+        if add or remove:
+            present = {film_id for (film_id,) in model
+                       .select(model.film)
+                       .where((model.user == user_id) & model.film.in_(add + list(remove)))
+                       .tuples()}
+        inserted = [film_id for film_id in add if film_id not in present]
+        removed = [film_id for film_id in dict.fromkeys(remove) if film_id in present]
+        if not inserted and not removed:
+            return get_collection_version(user_id, kind), removed
+        version = bump_collection_version(user_id, kind)
+
+        for start in range(0, len(inserted), _INSERT_CHUNK):
+            chunk = inserted[start:start + _INSERT_CHUNK]
+            (model
+             .insert_many([{"user": user_id, "film": film_id, "version": version} for film_id in chunk])
+             .on_conflict_ignore()
+             .execute())
+            # Вернувшийся в коллекцию фильм больше не считается удалённым
+            (CollectionTombstone
+             .delete()
+             .where((CollectionTombstone.user == user_id) & (CollectionTombstone.kind == kind)
+                    & CollectionTombstone.movie_id.in_([str(film_id) for film_id in chunk]))
+             .execute())
+
+        if removed:
+            model.delete().where((model.user == user_id) & model.film.in_(removed)).execute()
+            _add_tombstones(user_id, kind, removed, version)
+    return version, removed
+
+
+def forget_film(film_id: int):
+    """Убирает фильм из всех коллекций перед удалением из каталога (вызывать внутри транзакции записи)"""
+    for kind, model in COLLECTIONS.items():
+        user_ids = [user_id for (user_id,) in model.select(model.user).where(model.film == film_id).tuples()]
+        if not user_ids:
+            continue
+        model.delete().where(model.film == film_id).execute()
+        for user_id in user_ids:
+            _add_tombstones(user_id, kind, [film_id], bump_collection_version(user_id, kind))
+
+
+def get_item(user_id: int, kind: str, film_id: int) -> Optional[dict]:
+    model = COLLECTIONS[kind]
+    rows = _item_rows(_items_query(model).where((model.user == user_id) & (model.film == film_id)))
+    return rows[0] if rows else None
+
+
+def list_items(user_id: int, kind: str) -> List[dict]:
+    model = COLLECTIONS[kind]
+    return _item_rows(_items_query(model).where(model.user == user_id).order_by(model.id))
+
+
+def changes_since(user_id: int, kind: str, since: Optional[int]) -> Dict:
+    """Изменения коллекции после версии since: добавленные элементы и удалённые movie_id.
+
+    Без since, с версией из будущего (например, после пересоздания базы) или с версией
+    старше хранимых отметок об удалении возвращается полный список с full=True —
+    клиент заменяет свою копию целиком.
+    """
+    model = COLLECTIONS[kind]
+    # Версия и строки читаются в одной транзакции, чтобы не пропустить запись между ними
+    with database.atomic():
+        row = (CollectionVersion
+               .select(CollectionVersion.version, CollectionVersion.pruned_version)
+               .where((CollectionVersion.user == user_id) & (CollectionVersion.kind == kind))
+               .tuples()
+               .first())
+        version, pruned_version = row or (0, 0)
+        if since is None or since > version or since < pruned_version:
+            return {"version": version, "full": True, "items": list_items(user_id, kind), "removed": []}
+        items = _item_rows(_items_query(model)
+                           .where((model.user == user_id) & (model.version > since))
+                           .order_by(model.id))
+        removed = [movie_id for (movie_id,) in CollectionTombstone
+                   .select(CollectionTombstone.movie_id)
+                   .where((CollectionTombstone.user == user_id) & (CollectionTombstone.kind == kind)
+                          & (CollectionTombstone.version > since))
+                   .tuples()]
+    return {"version": version, "full": False, "items": items, "removed": removed}
+
+
+def collection_ids(user_id: int) -> Dict[str, dict]:
+    """Версии и movie_id всех коллекций пользователя: два запроса в одной транзакции.
+
+    Этого достаточно, чтобы отметить фильмы на странице и понять, нужна ли синхронизация (since=).
+    """
+    result = {kind: {"version": 0, "ids": []} for kind in COLLECTIONS}
+    with database.atomic():
+        for kind, version in (CollectionVersion
+                              .select(CollectionVersion.kind, CollectionVersion.version)
+                              .where(CollectionVersion.user == user_id)
+                              .tuples()):
+            if kind in result:
+                result[kind]["version"] = version
+        parts = [model
+                 .select(SQL(f"'{kind}'"), Cast(model.film, "TEXT"))
+                 .where(model.user == user_id)
+                 for kind, model in COLLECTIONS.items()]
+        union = parts[0]
+        for part in parts[1:]:
+            union = union + part  # UNION ALL
+        for kind, movie_id in union.tuples():
+            result[kind]["ids"].append(movie_id)
+    return result
+
+
+def cart_summary(user_id: int) -> Dict:
+    """Число позиций корзины и суммы по валютам — одним агрегирующим запросом"""
+    rows = (CartItem
+            .select(Film.currency, fn.COUNT(CartItem.id), fn.COUNT(Film.price_minor), fn.SUM(Film.price_minor))
+            .join(Film, on=(CartItem.film == Film.flim_id))
+            .where(CartItem.user == user_id)
+            .group_by(Film.currency)
+            .order_by(Film.currency)
+            .tuples())
+    items = unpriced = 0
+    totals = []
+    for currency, count, priced, total in rows:
+        items += count
+        unpriced += count - priced
+        if priced:
+            totals.append({"currency": currency, "items": priced, "total_minor": total, "total": format_price(total)})
+    return {"items": items, "unpriced": unpriced, "totals": totals}